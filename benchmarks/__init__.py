@@ -0,0 +1,11 @@
+"""Benchmarks of the website against a seeded synthetic fleet.
+
+    python -m benchmarks.seed --cars 100000 --bookings 10000000    # fill the database of DB_URL
+    python -m benchmarks.harness --output run.json                 # measure the routes
+    python -m benchmarks.harness --baseline run.json               # fail on regressions against an earlier run
+    python -m benchmarks.booking_race --threads 32                 # many users booking one car at once
+    python -m benchmarks.upstream_load --latency 0 0.5             # payments with a slow Stripe, sync vs gevent
+    python -m benchmarks.analytics --days 365                      # fleet reports, cold and with the day partitions kept
+    python -m benchmarks.login_load --rounds 10 12                 # logins per second, hashing inline vs in a pool
+    python -m benchmarks.ratelimit_overhead                        # cost of the login throttle per attempt
+"""
@@ -0,0 +1,53 @@
+"""Benchmark of the fleet analytics against the seeded bookings: a cold report working out every day partition, then
+warm reports which only work out today again"""
+
+import argparse
+import datetime
+import sys
+import time
+from codes import create_app
+from codes.analytics import analytics, GROUPS
+from codes.models import Rented
+
+
+def timed(start, end, by):
+    """Method for running one report
+
+    Returns
+    ------------------
+    The time it took in milliseconds and the report"""
+
+    began = time.perf_counter()
+    report = analytics.report(start, end, by=by)
+    return (time.perf_counter() - began) * 1000, report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--days', type=int, default=365, help='number of days up to today the reports cover')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--by', nargs='*', default=list(GROUPS))
+    parser.add_argument('--max-warm-ms', type=float, default=None,
+                        help='fail if a warm report takes longer than this')
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        end = datetime.date.today() + datetime.timedelta(days=1)
+        start = end - datetime.timedelta(days=args.days)
+        print(dict(bookings=Rented.query.count(), days=args.days), flush=True)
+        analytics.reset()
+        cold_ms, report = timed(start, end, args.by[0])
+        print(dict(report='cold', by=args.by[0], ms=round(cold_ms, 1), **report['totals']), flush=True)
+        slowest = 0.0
+        for by in args.by:
+            warm = sorted(timed(start, end, by)[0] for _ in range(args.repeat))
+            slowest = max(slowest, warm[-1])
+            print(dict(report='warm', by=by, p50_ms=round(warm[len(warm) // 2], 1), max_ms=round(warm[-1], 1)),
+                  flush=True)
+    if args.max_warm_ms is not None:
+        sys.exit(1 if slowest > args.max_warm_ms else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""Load test of many users trying to book the same car for overlapping dates at the same time"""
+
+import argparse
+import datetime
+import threading
+import time
+import uuid
+from codes import create_app, db
+from codes.models import Car, Rented, User
+from codes.reservations import hold_car, confirm_reservation, ReservationError
+
+
+def attempt(app, car_id, user_id, rent_from, rent_till, barrier, outcomes):
+    """Method run by each thread, holding the car and paying for it as a user would"""
+    with app.app_context():
+        user = User.query.get(user_id)
+        barrier.wait()
+        try:
+            hold = hold_car(car_id, user, rent_from, rent_till, user.city_id)
+            if hold is None:
+                outcomes.append('refused')
+                return
+            payment_intent = 'pi_race_' + uuid.uuid4().hex
+            confirm_reservation(hold.id, user_id, payment_intent)
+            # the same payment confirmed a second time must not book the car again
+            confirm_reservation(hold.id, user_id, payment_intent)
+            outcomes.append('booked')
+        except ReservationError:
+            outcomes.append('refused')
+        except Exception as error:
+            outcomes.append(f'error: {error!r}')
+        finally:
+            db.session.remove()
+
+
+def overlapping_pairs(car_id):
+    """Method for counting the pairs of confirmed bookings of a car which overlap"""
+    bookings = Rented.query.filter_by(carID=car_id).filter(Rented.final_status == "true")\
+        .order_by(Rented.rented_from).all()
+    return sum(1 for i, first in enumerate(bookings) for second in bookings[i + 1:]
+               if first.rented_from <= second.rented_till and second.rented_from <= first.rented_till)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--rounds', type=int, default=5)
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        car = Car.query.filter_by(status="true").order_by(Car.id).first()
+        car_id = car.id
+        user_ids = [row.id for row in User.query.with_entities(User.id).filter_by(is_admin=False)
+                    .order_by(User.id).limit(args.threads)]
+    failures = 0
+    for round_number in range(args.rounds):
+        # every thread asks for a different but overlapping period far in the future
+        start = datetime.datetime.combine(datetime.date.today(), datetime.time()) + \
+            datetime.timedelta(days=400 + 20 * round_number)
+        barrier = threading.Barrier(len(user_ids))
+        outcomes = []
+        threads = [threading.Thread(target=attempt, args=(
+            app, car_id, user_id, start + datetime.timedelta(days=i % 3), start + datetime.timedelta(days=3 + i % 3),
+            barrier, outcomes)) for i, user_id in enumerate(user_ids)]
+        began = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - began
+        with app.app_context():
+            overlaps = overlapping_pairs(car_id)
+        errors = [outcome for outcome in outcomes if outcome.startswith('error')]
+        print(f"round {round_number}: {outcomes.count('booked')} booked, {outcomes.count('refused')} refused, "
+              f"{len(errors)} errors, {overlaps} overlapping pairs, {len(outcomes) / elapsed:.1f} attempts/s")
+        for error in errors:
+            print('  ', error)
+        failures += overlaps + len(errors)
+    raise SystemExit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,180 @@
+"""Harness measuring the latency and the database cost of the main routes through the Flask test client"""
+
+import argparse
+import datetime
+import json
+import sys
+import time
+from sqlalchemy import event, text
+from codes import create_app, db
+from codes.availability import available_cars
+from codes.models import User
+from codes.search_context import make_token
+
+# Tables which are big enough that a sequential scan on them is a regression
+LARGE_TABLES = ('rented', 'cars', 'user_verification', 'reservations')
+
+
+def _percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+
+def _rows_scanned():
+    """Method for reading how many rows PostgreSQL has read from the tables so far, None on the other databases"""
+    if db.engine.dialect.name != 'postgresql':
+        return None
+    time.sleep(0.6)  # the statistics collector only sends its counters every 500ms
+    with db.engine.connect() as connection:
+        connection.execute(text('SELECT pg_stat_clear_snapshot()'))
+        return int(connection.execute(text(
+            'SELECT COALESCE(SUM(seq_tup_read + COALESCE(idx_tup_fetch, 0)), 0) FROM pg_stat_user_tables')).scalar())
+
+
+def _seq_scans(statements):
+    """Method for finding the statements which PostgreSQL plans as a sequential scan of a large table"""
+    if db.engine.dialect.name != 'postgresql':
+        return []
+    found = []
+    with db.engine.connect() as connection:
+        for statement, parameters in statements:
+            if not statement.lstrip().upper().startswith('SELECT'):
+                continue
+            plan = connection.exec_driver_sql('EXPLAIN (FORMAT JSON) ' + statement, parameters).scalar()
+            nodes = [plan[0]['Plan']]
+            while nodes:
+                node = nodes.pop()
+                if node.get('Node Type') == 'Seq Scan' and node.get('Relation Name') in LARGE_TABLES:
+                    found.append(f"{node['Relation Name']}: {statement[:200]}")
+                nodes.extend(node.get('Plans', []))
+    return found
+
+
+class Recorder:
+    """Class for recording the statements sent to the database while a request runs"""
+
+    def __init__(self):
+        self.statements = []
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append((statement, parameters))
+
+
+def scenarios():
+    """Method for picking the rows the scenarios run with and listing the scenarios as
+    (name, id of the logged-in user, method, url, form data)"""
+    user = User.query.filter_by(is_admin=False).filter(User.city_id.isnot(None)).order_by(User.id).first()
+    admin = User.query.filter_by(is_admin=True, city_id=user.city_id).first()
+    rent_from = datetime.datetime.combine(datetime.date.today() + datetime.timedelta(days=30), datetime.time())
+    rent_till = rent_from + datetime.timedelta(days=3)
+    search = make_token(user.id, rent_from, rent_till, user.city_id)
+    car = available_cars(user.city_id, rent_from, rent_till).first()
+    user_id, admin_id = user.id, admin.id
+    return [
+        ('home_anonymous', None, 'GET', '/home', None),
+        ('home', user_id, 'GET', f'/home?search={search}', None),
+        ('search', user_id, 'POST', f'/search?search={search}', {'searched': 'company1 white'}),
+        ('book_car', user_id, 'GET', f'/book_car/{car.id}?search={search}', None),
+        ('bookings', user_id, 'GET', '/bookings', None),
+        ('cars_taking_list', admin_id, 'GET', '/cars_taking_list', None),
+        ('cars_delivery_list', admin_id, 'GET', '/cars_delivery_list', None),
+        ('cars_taking_list_late', admin_id, 'GET', '/cars_taking_list_late', None),
+        ('cars_delivery_list_late', admin_id, 'GET', '/cars_delivery_list_late', None),
+        ('display_users_list', admin_id, 'GET', '/display_users_list', None),
+    ]
+
+
+def run(app, iterations=50, warmup=5, only=None):
+    """Method for running every scenario and measuring it
+
+    Returns
+    ------------------
+    The dictionary of the results of each scenario"""
+
+    results = {}
+    with app.app_context():
+        for name, user_id, method, url, data in scenarios():
+            if only and name not in only:
+                continue
+            client = app.test_client()
+            if user_id is not None:
+                with client.session_transaction() as session:
+                    session['_user_id'] = str(user_id)
+                    session['_fresh'] = True
+            for _ in range(warmup):
+                client.open(url, method=method, data=data)
+            rows_before = _rows_scanned()
+            latencies, queries = [], []
+            recorder = Recorder()
+            for _ in range(iterations):
+                recorder.statements = []
+                event.listen(db.engine, 'before_cursor_execute', recorder)
+                start = time.perf_counter()
+                response = client.open(url, method=method, data=data)
+                latencies.append((time.perf_counter() - start) * 1000)
+                event.remove(db.engine, 'before_cursor_execute', recorder)
+                queries.append(len(recorder.statements))
+            rows_after = _rows_scanned()
+            results[name] = dict(
+                status=response.status_code, iterations=iterations,
+                p50_ms=round(_percentile(latencies, 0.50), 3), p99_ms=round(_percentile(latencies, 0.99), 3),
+                mean_ms=round(sum(latencies) / len(latencies), 3), queries=max(queries),
+                rows_scanned=None if rows_before is None else (rows_after - rows_before) // iterations,
+                seq_scans=_seq_scans(recorder.statements))
+    return results
+
+
+def compare(results, baseline, tolerance=0.2):
+    """Method for comparing a run with an earlier one
+
+    Returns
+    ------------------
+    The list of the regressions found, empty if there are none"""
+
+    regressions = []
+    for name, old in baseline.get('scenarios', {}).items():
+        new = results.get(name)
+        if new is None:
+            continue
+        if new['p99_ms'] > old['p99_ms'] * (1 + tolerance):
+            regressions.append(f"{name}: p99 {old['p99_ms']}ms -> {new['p99_ms']}ms")
+        if new['queries'] > old['queries']:
+            regressions.append(f"{name}: queries {old['queries']} -> {new['queries']}")
+        if old.get('rows_scanned') and new.get('rows_scanned') and \
+                new['rows_scanned'] > old['rows_scanned'] * (1 + tolerance):
+            regressions.append(f"{name}: rows scanned {old['rows_scanned']} -> {new['rows_scanned']}")
+        if new.get('seq_scans') and not old.get('seq_scans'):
+            regressions.append(f"{name}: sequential scans {new['seq_scans']}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--iterations', type=int, default=50)
+    parser.add_argument('--warmup', type=int, default=5)
+    parser.add_argument('--only', nargs='*', help='names of the scenarios to run')
+    parser.add_argument('--output', help='file to write the results to as JSON')
+    parser.add_argument('--baseline', help='JSON file of an earlier run to compare with')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed relative slowdown')
+    args = parser.parse_args()
+
+    app = create_app()
+    app.config['WTF_CSRF_ENABLED'] = False
+    results = run(app, args.iterations, args.warmup, args.only)
+    report = dict(created=datetime.datetime.utcnow().isoformat(), database=app.config['SQLALCHEMY_DATABASE_URI']
+                  .split('@')[-1], scenarios=results)
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    print(output)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print('REGRESSION', regression, file=sys.stderr)
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""Load test of the login route served by gunicorn, for a few bcrypt costs with the hashes run inline in the request
+workers and in the pool of hashing processes"""
+
+import argparse
+import os
+import re
+import socket
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from codes import create_app
+from codes.models import User
+from benchmarks.seed import PASSWORD
+
+CSRF_TOKEN = re.compile(r'name="csrf_token" type="hidden" value="([^"]+)"')
+
+
+def _percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+
+def serve(rounds, hash_workers, worker_class, workers, threads, port):
+    """Method for starting gunicorn with the given cost and hashing pool
+
+    Returns
+    ------------------
+    The gunicorn process once it accepts connections"""
+
+    env = dict(os.environ, BCRYPT_LOG_ROUNDS=str(rounds), PASSWORD_HASH_WORKERS=str(hash_workers),
+               WORKER_CLASS=worker_class, WEB_CONCURRENCY=str(workers), GUNICORN_THREADS=str(threads), PORT=str(port))
+    process = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'app:app'], env=env)
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return process
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("gunicorn did not start")
+
+
+def load(port, emails, concurrency):
+    """Method for logging in with many clients at once, each fetching the form for its CSRF token first
+
+    Returns
+    ------------------
+    The dictionary of the throughput, the latencies of the posts and the number of failed logins"""
+
+    def log_in(email):
+        with requests.Session() as session:
+            try:
+                page = session.get(f'http://127.0.0.1:{port}/login', timeout=60)
+                token = CSRF_TOKEN.search(page.text).group(1)
+                start = time.perf_counter()
+                response = session.post(f'http://127.0.0.1:{port}/login', allow_redirects=False, timeout=60,
+                                        data={'csrf_token': token, 'email': email, 'password': PASSWORD})
+                ok = response.status_code == 302
+            except (requests.RequestException, AttributeError):
+                start, ok = time.perf_counter(), False
+            return time.perf_counter() - start, ok
+
+    began = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        results = list(pool.map(log_in, emails))
+    elapsed = time.perf_counter() - began
+    latencies = [latency * 1000 for latency, _ in results]
+    return dict(logins_per_s=round(len(emails) / elapsed, 2), p50_ms=round(_percentile(latencies, 0.5), 1),
+                p99_ms=round(_percentile(latencies, 0.99), 1), errors=sum(1 for _, ok in results if not ok))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rounds', type=int, nargs='*', default=[10, 12])
+    parser.add_argument('--hash-workers', type=int, nargs='*', default=[0, 2])
+    parser.add_argument('--worker-class', default='sync')
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--port', type=int, default=8766)
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        emails = [user.email for user in User.query.with_entities(User.email)
+                  .filter_by(is_admin=False, is_super_admin=False).order_by(User.id).limit(args.requests)]
+    for rounds in args.rounds:
+        for hash_workers in args.hash_workers:
+            process = serve(rounds, hash_workers, args.worker_class, args.workers, args.threads, args.port)
+            try:
+                # the first pass hashes the seeded passwords again with this cost, the second one is measured
+                load(args.port, emails, args.concurrency)
+                result = load(args.port, emails, args.concurrency)
+            finally:
+                process.terminate()
+                process.wait()
+            print(dict(rounds=rounds, hash_workers=hash_workers, **result), flush=True)
+
+
+if __name__ == '__main__':
+    main()
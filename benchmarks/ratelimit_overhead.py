@@ -0,0 +1,79 @@
+"""Benchmark of the rate limiter: the cost of a token taken from each backend, and the latency of a login post let
+through, refused by the limiter and, for comparison, refused by the password check with the limiter turned off"""
+
+import argparse
+import random
+import time
+from codes import create_app
+from codes.models import User
+from codes.ratelimit import rate_limiter, MemoryBackend, RedisBackend
+
+
+def _percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+
+def backend_cost(backend, calls):
+    """Method for timing the attempts of many addresses against a backend
+
+    Returns
+    ------------------
+    The microseconds per attempt"""
+
+    rate_limiter.backend = backend
+    ips = [f'10.{random.randrange(256)}.{random.randrange(256)}.{random.randrange(256)}' for _ in range(calls)]
+    began = time.perf_counter()
+    for ip in ips:
+        rate_limiter.hit('login', ip, 'someone@example.com')
+    return (time.perf_counter() - began) / calls * 1e6
+
+
+def login_latency(app, email, password, iterations, ip):
+    """Method for posting the login form from one address through the test client
+
+    Returns
+    ------------------
+    The median latency in milliseconds and the status codes seen"""
+
+    client = app.test_client()
+    latencies, statuses = [], set()
+    for _ in range(iterations):
+        start = time.perf_counter()
+        response = client.post('/login', data={'email': email, 'password': password},
+                               environ_base={'REMOTE_ADDR': ip})
+        latencies.append((time.perf_counter() - start) * 1000)
+        statuses.add(response.status_code)
+    return round(_percentile(latencies, 0.5), 3), sorted(statuses)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--calls', type=int, default=100000)
+    parser.add_argument('--iterations', type=int, default=50)
+    parser.add_argument('--redis-url', help='also time the shared backend against this server')
+    args = parser.parse_args()
+
+    app = create_app()
+    app.config['WTF_CSRF_ENABLED'] = False
+    with app.app_context():
+        email = User.query.filter_by(is_admin=False).order_by(User.id).first().email
+        print(dict(backend='memory', us_per_attempt=round(backend_cost(MemoryBackend(), args.calls), 2)), flush=True)
+        if args.redis_url:
+            cost = backend_cost(RedisBackend(args.redis_url), min(args.calls, 10000))
+            print(dict(backend='redis', us_per_attempt=round(cost, 2)), flush=True)
+
+        cases = [
+            ('let through, refused by the password', MemoryBackend(), (1e6, 1e6)),
+            ('refused by the limiter', MemoryBackend(), (1e-6, 1.0)),
+            ('refused by the password, no limiter', None, (1e6, 1e6)),
+        ]
+        for number, (case, backend, ip_limit) in enumerate(cases):
+            rate_limiter.backend = backend
+            rate_limiter.limits['login'] = dict(ip=ip_limit, account=(1e6, 1e6), all=(1e6, 1e6))
+            p50_ms, statuses = login_latency(app, email, 'Wrong@123', args.iterations, f'10.0.0.{number + 1}')
+            print(dict(case=case, p50_ms=p50_ms, statuses=statuses), flush=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+"""Generator of a synthetic fleet and booking history at a configurable scale"""
+
+import argparse
+import datetime
+import random
+from codes import create_app, db
+from codes.models import City, CarCompany, CarModels, CarCategories, Car, User, Rented
+from codes.search import refresh_search_documents
+from codes.manifest import rebuild
+from codes.passwords import passwords
+
+CHUNK = 10000
+COLORS = ['WHITE', 'BLACK', 'SILVER', 'RED', 'BLUE', 'GREY']
+PASSWORD = 'Bench@123'
+
+
+def _insert(table, rows):
+    """Method for inserting rows in chunks with executemany"""
+    for start in range(0, len(rows), CHUNK):
+        db.session.execute(table.insert(), rows[start:start + CHUNK])
+    db.session.commit()
+
+
+def _bookings(rng, car_ids, city_of, user_ids, total, today):
+    """Method for generating the bookings of every car one after the other so that the confirmed bookings of a car
+    never overlap. Yields the rows so that millions of them are never held in memory at once."""
+    per_car = max(1, total // len(car_ids))
+    made = 0
+    for car_id in car_ids:
+        day = today - datetime.timedelta(days=per_car * 6)
+        for _ in range(per_car):
+            if made >= total:
+                return
+            day += datetime.timedelta(days=rng.randint(0, 4))
+            length = rng.randint(1, 6)
+            rented_from, rented_till = day, day + datetime.timedelta(days=length)
+            day = rented_till + datetime.timedelta(days=1)
+            past = rented_till < today
+            fine = rng.choice([0] * 9 + [rng.randint(100, 2000)]) if past else 0
+            yield dict(carID=car_id, user_id=rng.choice(user_ids), booking_time=rented_from - datetime.timedelta(days=3),
+                       rented_from=rented_from, rented_till=rented_till, car_taken=past, car_delivery=past,
+                       city_taken_id=city_of[car_id], city_delivery_id=city_of[car_id],
+                       final_status=rng.choice(["true"] * 19 + ["false"]), said_date=True, said_time=True,
+                       proper_condition=fine == 0, fine=fine, fine_paid=fine == 0 or rng.random() < 0.8)
+            made += 1
+
+
+def seed(cities=50, companies=30, models=200, categories=8, cars=100000, users=20000, bookings=10000000, seed_value=1):
+    """Method for filling an empty database with a synthetic fleet. It needs an app context.
+
+    Returns
+    ------------------
+    The dictionary of the number of rows added to each table"""
+
+    rng = random.Random(seed_value)
+    today = datetime.datetime.combine(datetime.date.today(), datetime.time())
+    password = passwords.hash(PASSWORD)
+    _insert(City.__table__, [dict(city=f"CITY{i}") for i in range(cities)])
+    _insert(CarCompany.__table__, [dict(company_name=f"COMPANY{i}") for i in range(companies)])
+    _insert(CarModels.__table__, [dict(model_name=f"MODEL{i}") for i in range(models)])
+    _insert(CarCategories.__table__, [dict(category=f"CATEGORY{i}") for i in range(categories)])
+    city_ids = [row.id for row in City.query.all()]
+    company_ids = [row.id for row in CarCompany.query.all()]
+    model_ids = [row.id for row in CarModels.query.all()]
+    category_ids = [row.id for row in CarCategories.query.all()]
+
+    _insert(User.__table__, [dict(name=f"Admin {i}", username=f"admin{i}", email=f"admin{i}@bench.example.com",
+                                  password=password, city_id=city_id, is_verified=True, is_admin=True,
+                                  is_super_admin=i == 0, fine_pending=False)
+                             for i, city_id in enumerate(city_ids)])
+    _insert(User.__table__, [dict(name=f"User {i}", username=f"user{i}", email=f"user{i}@bench.example.com",
+                                  password=password, city_id=rng.choice(city_ids), is_verified=True, is_admin=False,
+                                  is_super_admin=False, fine_pending=False) for i in range(users)])
+    user_ids = [row.id for row in User.query.with_entities(User.id).filter_by(is_admin=False)]
+
+    car_rows = []
+    for i in range(cars):
+        color = rng.choice(COLORS)
+        car_rows.append(dict(car_id=f"BN{i:08d}", company_id=rng.choice(company_ids), model_id=rng.choice(model_ids),
+                             category_id=rng.choice(category_ids), color=color, mileage=rng.randint(8, 30),
+                             ppd=rng.randint(800, 6000), min_rent=1000, city_id=rng.choice(city_ids),
+                             deposit=rng.randint(1000, 10000), status="true"))
+    _insert(Car.__table__, car_rows)
+    refresh_search_documents()
+    db.session.commit()
+    city_of = {row.id: row.city_id for row in Car.query.with_entities(Car.id, Car.city_id)}
+    del car_rows
+
+    made, chunk = 0, []
+    for row in _bookings(rng, list(city_of), city_of, user_ids, bookings, today):
+        chunk.append(row)
+        if len(chunk) == CHUNK:
+            db.session.execute(Rented.__table__.insert(), chunk)
+            db.session.commit()
+            made, chunk = made + len(chunk), []
+    if chunk:
+        _insert(Rented.__table__, chunk)
+        made += len(chunk)
+    rebuild()
+    return dict(cities=cities, companies=companies, models=models, categories=categories, cars=cars,
+                users=users + len(city_ids), bookings=made)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--cities', type=int, default=50)
+    parser.add_argument('--companies', type=int, default=30)
+    parser.add_argument('--models', type=int, default=200)
+    parser.add_argument('--categories', type=int, default=8)
+    parser.add_argument('--cars', type=int, default=100000)
+    parser.add_argument('--users', type=int, default=20000)
+    parser.add_argument('--bookings', type=int, default=10000000)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--create', action='store_true', help='create the tables first')
+    args = parser.parse_args()
+    app = create_app()
+    with app.app_context():
+        if args.create:
+            db.create_all()
+        counts = seed(args.cities, args.companies, args.models, args.categories, args.cars, args.users,
+                      args.bookings, args.seed)
+    print(counts)
+
+
+if __name__ == '__main__':
+    main()
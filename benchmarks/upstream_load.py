@@ -0,0 +1,166 @@
+"""Load test of the payment route against the local Stripe and SMTP stubs with an injected upstream latency, run once
+with the sync workers and once with the gevent workers of gunicorn"""
+
+import argparse
+import datetime
+import os
+import socket
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from codes import create_app, db
+from codes.models import Car, User, Reservation, Payment, Rented
+from benchmarks import upstream_stubs
+
+
+def _percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+
+def prepare(app, count, offset=0):
+    """Method for holding a number of cars for a user far in the future and signing a session cookie for him. Each
+    hold is paid for once, so every payment of the test goes to Stripe.
+
+    Returns
+    ------------------
+    The ids of the holds and the session cookie"""
+
+    with app.app_context():
+        user = User.query.filter_by(is_admin=False, is_super_admin=False).order_by(User.id).first()
+        rent_from = datetime.datetime.combine(datetime.date.today(), datetime.time()) + \
+            datetime.timedelta(days=900 + 10 * offset)
+        expires_at = datetime.datetime.utcnow() + datetime.timedelta(days=1)
+        holds = [Reservation(carID=car.id, user_id=user.id, rented_from=rent_from,
+                             rented_till=rent_from + datetime.timedelta(days=2), city_taken_id=car.city_id,
+                             city_delivery_id=car.city_id, expires_at=expires_at)
+                 for car in Car.query.filter_by(status="true").order_by(Car.id).limit(count)]
+        db.session.add_all(holds)
+        db.session.commit()
+        cookie = app.session_interface.get_signing_serializer(app).dumps({'_user_id': str(user.id), '_fresh': True})
+        return [hold.id for hold in holds], cookie
+
+
+def cleanup(app, hold_ids):
+    """Method for removing the holds of a run with the payments and the bookings made for them
+
+    Returns
+    ------------------
+    The number of bookings which were made"""
+
+    with app.app_context():
+        paid = Payment.query.filter(Payment.reservation_id.in_(hold_ids))
+        intents = [payment.provider_id for payment in paid if payment.provider_id]
+        booked = Rented.query.filter(Rented.payment_intent.in_(intents)).delete(synchronize_session=False) \
+            if intents else 0
+        paid.delete(synchronize_session=False)
+        Reservation.query.filter(Reservation.id.in_(hold_ids)).delete(synchronize_session=False)
+        db.session.commit()
+        return booked
+
+
+def serve(worker_class, workers, port, stripe_port, smtp_port):
+    """Method for starting gunicorn with the given worker class, talking to the stubs
+
+    Returns
+    ------------------
+    The gunicorn process once it accepts connections"""
+
+    env = dict(os.environ, WORKER_CLASS=worker_class, WEB_CONCURRENCY=str(workers), PORT=str(port),
+               STRIPE_API_BASE=f'http://127.0.0.1:{stripe_port}', MAIL_SERVER='127.0.0.1', MAIL_PORT=str(smtp_port),
+               MAIL_USE_TLS='false', STRIPE_SECRET_KEY=os.environ.get('STRIPE_SECRET_KEY') or 'sk_test_stub')
+    process = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'app:app'], env=env)
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return process
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("gunicorn did not start")
+
+
+def load(port, hold_ids, cookie, concurrency):
+    """Method for sending the payments of the holds from many clients at once
+
+    Returns
+    ------------------
+    The dictionary of the throughput, the latencies and the number of failed payments"""
+
+    def pay(i):
+        start = time.perf_counter()
+        try:
+            response = requests.post(f'http://127.0.0.1:{port}/charge/{hold_ids[i]}',
+                                     data={'stripeToken': 'tok_visa'}, cookies={'session': cookie},
+                                     allow_redirects=False, timeout=120)
+            ok = response.status_code == 302 and '/index/' not in response.headers.get('Location', '')
+        except requests.RequestException:
+            ok = False
+        return time.perf_counter() - start, ok
+
+    began = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        results = list(pool.map(pay, range(len(hold_ids))))
+    elapsed = time.perf_counter() - began
+    latencies = [latency * 1000 for latency, _ in results]
+    return dict(requests_per_s=round(len(hold_ids) / elapsed, 2), p50_ms=round(_percentile(latencies, 0.5), 1),
+                p99_ms=round(_percentile(latencies, 0.99), 1), errors=sum(1 for _, ok in results if not ok))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--latency', type=float, nargs='*', default=[0.0, 0.2, 0.5],
+                        help='seconds each Stripe and SMTP call waits')
+    parser.add_argument('--worker-class', nargs='*', default=['sync', 'gevent'])
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--stripe-port', type=int, default=12111)
+    parser.add_argument('--smtp-port', type=int, default=12025)
+    parser.add_argument('--min-ratio', type=float, default=None,
+                        help='fail if the gevent throughput at the highest latency is below this share of the '
+                             'throughput without latency')
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        user = User.query.filter_by(is_admin=False, is_super_admin=False).order_by(User.id).first()
+        user_id, customer_id = user.id, user.stripe_customer_id
+    rows = []
+    for latency in args.latency:
+        stubs = upstream_stubs.start(args.stripe_port, args.smtp_port, latency)
+        try:
+            for worker_class in args.worker_class:
+                hold_ids, cookie = prepare(app, args.requests, len(rows))
+                process = serve(worker_class, args.workers, args.port, args.stripe_port, args.smtp_port)
+                try:
+                    result = load(args.port, hold_ids, cookie, args.concurrency)
+                finally:
+                    process.terminate()
+                    process.wait()
+                    booked = cleanup(app, hold_ids)
+                rows.append(dict(worker_class=worker_class, latency_s=latency, booked=booked, **result))
+                print(rows[-1], flush=True)
+        finally:
+            for stub in stubs:
+                stub.shutdown()
+                stub.server_close()
+            # the customer made on the fake does not exist on the real Stripe
+            with app.app_context():
+                User.query.filter_by(id=user_id).update({'stripe_customer_id': customer_id})
+                db.session.commit()
+
+    gevent = [row for row in rows if row['worker_class'] == 'gevent']
+    if args.min_ratio is not None and len(gevent) > 1:
+        ratio = gevent[-1]['requests_per_s'] / gevent[0]['requests_per_s']
+        print(f"gevent throughput at {gevent[-1]['latency_s']}s latency is {ratio:.0%} of the one at "
+              f"{gevent[0]['latency_s']}s")
+        sys.exit(1 if ratio < args.min_ratio else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,208 @@
+"""Local fakes of the Stripe API and of an SMTP server which answer after an injected delay, for testing the payments
+and for the load tests without reaching the real services"""
+
+import argparse
+import hashlib
+import hmac
+import itertools
+import json
+import socketserver
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl
+
+_ids = itertools.count(1)
+# The objects the app creates on Stripe, by the path of the API call
+STRIPE_OBJECTS = {'payment_methods': ('pm', 'payment_method'), 'customers': ('cus', 'customer'),
+                  'payment_intents': ('pi', 'payment_intent'), 'refunds': ('re', 'refund')}
+# A card token which the fake declines, as the test token of the same name of Stripe
+DECLINED_TOKEN = 'tok_chargeDeclined'
+
+
+def _form(body):
+    """Method for turning the form encoded body of a Stripe call into a dictionary, metadata[key] into a nested one"""
+    values = {}
+    for key, value in parse_qsl(body, keep_blank_values=True):
+        if '[' in key:
+            outer, inner = key.split('[', 1)
+            values.setdefault(outer, {})[inner.rstrip(']').replace('][', '.')] = value
+        else:
+            values[key] = value
+    return values
+
+
+class StripeHandler(BaseHTTPRequestHandler):
+    """Class for a fake of the part of the Stripe API the website uses. Objects are kept in memory, a repeated
+    Idempotency-Key gets the first answer again, or an idempotency_error if the parameters differ, PaymentIntents are
+    created succeeded unless the card token is DECLINED_TOKEN, and they can be retrieved and listed."""
+
+    latency = 0.0
+    objects = {}
+    idempotent = {}
+    lock = threading.Lock()
+
+    def _send(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _create(self, kind, values):
+        prefix, name = STRIPE_OBJECTS.get(kind, ('obj', kind or 'object'))
+        obj = {'id': f'{prefix}_stub{next(_ids)}', 'object': name, 'livemode': False, 'created': int(time.time()),
+               'metadata': values.get('metadata', {})}
+        if kind == 'payment_intents':
+            declined = values.get('payment_method_data', {}).get('card.token') == DECLINED_TOKEN
+            obj.update(amount=int(values.get('amount', 0)), currency=values.get('currency'),
+                       customer=values.get('customer'), status='requires_payment_method' if declined else 'succeeded')
+            if declined:
+                return 402, {'error': {'type': 'card_error', 'code': 'card_declined',
+                                       'message': 'Your card was declined.', 'payment_intent': obj}}
+        else:
+            obj.update({key: value for key, value in values.items() if not isinstance(value, dict)})
+        return 200, obj
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0)).decode()
+        time.sleep(self.latency)
+        key = self.headers.get('Idempotency-Key')
+        with self.lock:
+            if key and key in self.idempotent:
+                first_body, answer = self.idempotent[key]
+                if first_body != body:
+                    return self._send(400, {'error': {'type': 'idempotency_error', 'message': (
+                        'Keys for idempotent requests can only be used with the same parameters they were first '
+                        'used with.')}})
+                return self._send(*answer)
+            parts = self.path.split('?')[0].strip('/').split('/')
+            status, obj = self._create(parts[1] if len(parts) > 1 else '', _form(body))
+            if status == 200:
+                self.objects[obj['id']] = obj
+            if key:
+                self.idempotent[key] = (body, (status, obj))
+        self._send(status, obj)
+
+    def do_GET(self):
+        time.sleep(self.latency)
+        path, _, query = self.path.partition('?')
+        parts = path.strip('/').split('/')
+        with self.lock:
+            if len(parts) == 3:
+                obj = self.objects.get(parts[2])
+                if obj is None:
+                    return self._send(404, {'error': {'type': 'invalid_request_error', 'message': 'No such object'}})
+                return self._send(200, obj)
+            name = STRIPE_OBJECTS.get(parts[1] if len(parts) > 1 else '', ('', ''))[1]
+            created = int(_form(query).get('created', {}).get('gte', 0))
+            data = [obj for obj in self.objects.values() if obj['object'] == name and obj['created'] >= created]
+        self._send(200, {'object': 'list', 'url': path, 'has_more': False, 'data': data})
+
+    def log_message(self, *args):
+        pass
+
+
+def signed_event(secret, event_type, obj):
+    """Method for making the body and the headers of a webhook event, signed the way Stripe signs it
+
+    Returns
+    ------------------
+    The body and the dictionary of the headers"""
+
+    payload = json.dumps({'id': f'evt_stub{next(_ids)}', 'object': 'event', 'type': event_type,
+                          'data': {'object': obj}}).encode()
+    timestamp = int(time.time())
+    signature = hmac.new(secret.encode(), f'{timestamp}.'.encode() + payload, hashlib.sha256).hexdigest()
+    return payload, {'Content-Type': 'application/json', 'Stripe-Signature': f't={timestamp},v1={signature}'}
+
+
+def send_webhook(url, secret, event_type, obj):
+    """Method for posting an event to the webhook of the website, signed the way Stripe signs it
+
+    Returns
+    ------------------
+    The status code of the answer"""
+
+    payload, headers = signed_event(secret, event_type, obj)
+    request = urllib.request.Request(url, data=payload, headers=headers)
+    try:
+        with urllib.request.urlopen(request) as response:
+            return response.status
+    except urllib.error.HTTPError as error:
+        return error.code
+
+
+class SMTPHandler(socketserver.StreamRequestHandler):
+    """Class speaking just enough SMTP for smtplib to send a message, which is then thrown away"""
+
+    latency = 0.0
+
+    def reply(self, line):
+        self.wfile.write(line.encode() + b'\r\n')
+
+    def handle(self):
+        self.reply('220 stub ESMTP')
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode(errors='replace').strip().upper()
+            if command.startswith('EHLO'):
+                self.wfile.write(b'250-stub\r\n250 SIZE 10485760\r\n')
+            elif command.startswith('DATA'):
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                while self.rfile.readline() not in (b'.\r\n', b'.\n', b''):
+                    pass
+                time.sleep(self.latency)
+                self.reply('250 OK: queued')
+            elif command.startswith('QUIT'):
+                self.reply('221 Bye')
+                return
+            else:
+                self.reply('250 OK')
+
+
+class _ThreadingTCPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def start(stripe_port=12111, smtp_port=12025, latency=0.0):
+    """Method for starting both stubs in background threads
+
+    Returns
+    ------------------
+    The list of the servers, to be shut down with their shutdown method"""
+
+    stripe_handler = type('DelayedStripeHandler', (StripeHandler,), {'latency': latency})
+    smtp_handler = type('DelayedSMTPHandler', (SMTPHandler,), {'latency': latency})
+    servers = [ThreadingHTTPServer(('127.0.0.1', stripe_port), stripe_handler),
+               _ThreadingTCPServer(('127.0.0.1', smtp_port), smtp_handler)]
+    for server in servers:
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+    return servers
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--stripe-port', type=int, default=12111)
+    parser.add_argument('--smtp-port', type=int, default=12025)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds each call waits before answering')
+    args = parser.parse_args()
+    start(args.stripe_port, args.smtp_port, args.latency)
+    print(f"STRIPE_API_BASE=http://127.0.0.1:{args.stripe_port} MAIL_SERVER=127.0.0.1 MAIL_PORT={args.smtp_port} "
+          f"MAIL_USE_TLS=false")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
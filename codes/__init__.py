@@ -1,12 +1,10 @@
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
-from flask_bcrypt import Bcrypt
 from flask_login import LoginManager
 from .config import Config
 from flask_mail import Mail
 
 db = SQLAlchemy()
-bcrypt = Bcrypt()
 login_manager = LoginManager()
 login_manager.login_view = 'main.login'
 login_manager.login_message_category = 'info'
@@ -16,19 +14,47 @@ mail = Mail()
 def create_app(config_class=Config):
 	"""Method for creating the app"""
 	app = Flask(__name__)
-	app.config.from_object(Config)
+	app.config.from_object(config_class)
 	app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = True
 	db.init_app(app)
 	mail.init_app(app)
 	login_manager.init_app(app)
+	from .passwords import passwords
+	passwords.init_app(app)
+	from .ratelimit import rate_limiter
+	rate_limiter.init_app(app)
+	from .assets import assets
+	assets.init_app(app)
+	from .storage import storage
+	storage.init_app(app)
+	from .reference import reference_data
+	reference_data.init_app(app)
+	from .user_cache import user_cache
+	user_cache.init_app(app)
+	from .profiling import profiler
+	profiler.init_app(app)
+	from .page_cache import page_cache
+	page_cache.init_app(app)
+	from .analytics import analytics
+	analytics.init_app(app)
 	from .main.routes import main
 	from .cars.routes import cars
 	from .users.routes import users
 	from .admins.routes import admins
 	from .errors.handlers import errors
+	from .jobs.routes import jobs
 	app.register_blueprint(main)
 	app.register_blueprint(cars)
 	app.register_blueprint(users)
 	app.register_blueprint(admins)
 	app.register_blueprint(errors)
+	app.register_blueprint(jobs)
+	from .manifest import rebuild_manifest_command
+	app.cli.add_command(rebuild_manifest_command)
+	from .payments import reconcile_payments_command
+	app.cli.add_command(reconcile_payments_command)
+	from .assets import build_assets_command
+	app.cli.add_command(build_assets_command)
+	from .storage import move_id_proofs_command
+	app.cli.add_command(move_id_proofs_command)
 	return app
@@ -1,10 +1,20 @@
-from flask import render_template, url_for, flash, redirect, Blueprint, request
-from .. import db, bcrypt
+from flask import render_template, url_for, flash, redirect, Blueprint, request, jsonify, abort
+from .. import db
 from ..decorators import super_admin_role_required, admin_role_required
 from ..models import User, CarCompany, CarModels, CarCategories, City, UserVerification, Car
 from ..admins.forms import CreateAdmins, AddCity, AddCompany, AddModel, AddCategory, DeleteCity, DeleteModel, \
     DeleteCompany, DeleteCategory, UpdateCity, UpdateCompany, UpdateCategory, UpdateModel
 from flask_login import login_required
+from ..reference import reference_data
+from ..user_cache import user_cache
+from ..search import refresh_search_documents
+from ..utils import id_proof_urls
+from ..profiling import profiler
+from .. import pool_metrics
+from ..analytics import analytics, GROUPS
+from ..validations import commit_form
+from ..passwords import passwords
+import datetime
 
 admins = Blueprint('admins', __name__)
 
@@ -20,17 +30,17 @@ def create_admins():
     -----------------------------
     Returns: The success flash message and redirects to the home page"""
 
-    cities = City.query.all()
+    cities = reference_data.all(City)
     form = CreateAdmins()
     if request.method == 'POST':
         if form.validate_on_submit():
-            hashed_password = bcrypt.generate_password_hash(form.password.data).decode('utf-8')
+            hashed_password = passwords.hash(form.password.data)
             user = User(username=form.username.data, email=form.email.data, password=hashed_password,
                         name=form.name.data, city_id=form.city_id.data, is_admin=True)
             db.session.add(user)
-            db.session.commit()
-            flash(f'Admin has been created successfully!', 'success')
-            return redirect(url_for('main.home'))
+            if commit_form(form):
+                flash(f'Admin has been created successfully!', 'success')
+                return redirect(url_for('main.home'))
     return render_template('create_admins.html', form=form, cities=cities)
 
 
@@ -50,9 +60,10 @@ def add_company():
         if form.validate_on_submit():
             company = CarCompany(company_name=form.company_name.data.replace(" ", "").upper())
             db.session.add(company)
-            db.session.commit()
-            flash(f'Company has been added successfully!', 'success')
-            return redirect(url_for('main.home'))
+            if commit_form(form):
+                reference_data.invalidate()
+                flash(f'Company has been added successfully!', 'success')
+                return redirect(url_for('main.home'))
     return render_template('add_company.html', form=form)
 
 
@@ -72,9 +83,10 @@ def add_city():
         if form.validate_on_submit():
             city = City(city=form.city.data.replace(" ", "").upper())
             db.session.add(city)
-            db.session.commit()
-            flash(f'City has been added successfully!', 'success')
-            return redirect(url_for('main.home'))
+            if commit_form(form):
+                reference_data.invalidate()
+                flash(f'City has been added successfully!', 'success')
+                return redirect(url_for('main.home'))
     return render_template('add_city.html', form=form)
 
 
@@ -94,9 +106,10 @@ def add_category():
         if form.validate_on_submit():
             category = CarCategories(category=form.category.data.replace(" ", "").upper())
             db.session.add(category)
-            db.session.commit()
-            flash(f'Category has been added successfully!', 'success')
-            return redirect(url_for('main.home'))
+            if commit_form(form):
+                reference_data.invalidate()
+                flash(f'Category has been added successfully!', 'success')
+                return redirect(url_for('main.home'))
     return render_template('add_category.html', form=form)
 
 
@@ -116,9 +129,10 @@ def add_model():
         if form.validate_on_submit():
             model = CarModels(model_name=form.model_name.data.replace(" ", "").upper())
             db.session.add(model)
-            db.session.commit()
-            flash(f'Model has been added successfully!', 'success')
-            return redirect(url_for('main.home'))
+            if commit_form(form):
+                reference_data.invalidate()
+                flash(f'Model has been added successfully!', 'success')
+                return redirect(url_for('main.home'))
     return render_template('add_model.html', form=form)
 
 
@@ -133,9 +147,13 @@ def verify_user(user_id):
     Returns: Details of the user and the id proof image he has submitted with buttons to review the request"""
 
     user_ver = UserVerification.query.filter_by(user_id=user_id).filter(UserVerification.approval == "").first()
+    if user_ver is None:
+        # the id proofs are only shown while their request waits for a review
+        abort(404)
     user = User.query.filter_by(id=user_id).first()
-    image_file = url_for('static', filename='id_proofs/' + user_ver.id_proof)
-    return render_template('verify_user.html', user_ver=user_ver, user=user, image_file=image_file)
+    image_file, image_webp = id_proof_urls(user_ver.id_proof)
+    return render_template('verify_user.html', user_ver=user_ver, user=user, image_file=image_file,
+                           image_webp=image_webp)
 
 
 @admins.route("/accept_user/<string:user_id>")
@@ -203,6 +221,7 @@ def delete_admin(user_id):
 
     User.query.filter_by(id=user_id).delete()
     db.session.commit()
+    user_cache.invalidate(user_id)
     flash('Admin successfully deleted!', 'danger')
     return redirect(url_for('admins.admin_list'))
 
@@ -220,7 +239,7 @@ def delete_city():
     warning flash message is returned"""
 
     form = DeleteCity()
-    cities = City.query.all()
+    cities = reference_data.all(City)
     if cities:
         if request.method == "POST":
             if form.validate_on_submit():
@@ -229,7 +248,9 @@ def delete_city():
                     flash("City cannot be deleted as it has users!", "warning")
                 else:
                     City.query.filter_by(id=form.city_id.data).delete()
+                    refresh_search_documents(Car.city_id.is_(None))
                     db.session.commit()
+                    reference_data.invalidate()
                     flash('City has been deleted successfully!', 'success')
                 return redirect(url_for('main.home'))
         return render_template('delete_city.html', form=form, cities=cities)
@@ -250,7 +271,7 @@ def delete_company():
     warning flash message is returned"""
 
     form = DeleteCompany()
-    companies = CarCompany.query.all()
+    companies = reference_data.all(CarCompany)
     if companies:
         if request.method == "POST":
             if form.validate_on_submit():
@@ -260,6 +281,7 @@ def delete_company():
                 else:
                     CarCompany.query.filter_by(id=form.company_id.data).delete()
                     db.session.commit()
+                    reference_data.invalidate()
                     flash('Company has been deleted successfully!', 'success')
                 return redirect(url_for('main.home'))
         return render_template('delete_company.html', form=form, companies=companies)
@@ -280,7 +302,7 @@ def delete_category():
     warning flash message is returned"""
 
     form = DeleteCategory()
-    categories = CarCategories.query.all()
+    categories = reference_data.all(CarCategories)
     if categories:
         if request.method == "POST":
             if form.validate_on_submit():
@@ -290,6 +312,7 @@ def delete_category():
                 else:
                     CarCategories.query.filter_by(id=form.category_id.data).delete()
                     db.session.commit()
+                    reference_data.invalidate()
                     flash('Category has been deleted successfully!', 'success')
                 return redirect(url_for('main.home'))
         return render_template('delete_category.html', form=form, categories=categories)
@@ -310,7 +333,7 @@ def delete_model():
     warning flash message is returned"""
 
     form = DeleteModel()
-    models = CarModels.query.all()
+    models = reference_data.all(CarModels)
     if models:
         if request.method == "POST":
             if form.validate_on_submit():
@@ -320,6 +343,7 @@ def delete_model():
                 else:
                     CarModels.query.filter_by(id=form.model_id.data).delete()
                     db.session.commit()
+                    reference_data.invalidate()
                     flash('Car Model has been deleted successfully!', 'success')
                 return redirect(url_for('main.home'))
         return render_template('delete_model.html', form=form, models=models)
@@ -339,15 +363,16 @@ def update_city():
     Returns: The success flash message and redirects to the home page"""
 
     form = UpdateCity()
-    cities = City.query.all()
+    cities = reference_data.all(City)
     if cities:
         if request.method == "POST":
             if form.validate_on_submit():
                 city = City.query.filter_by(id=form.city_id.data).first()
                 city.city = form.city.data.replace(" ", "").upper()
-                db.session.commit()
-                flash(f'City has been updated successfully!', 'success')
-                return redirect(url_for('main.home'))
+                if commit_form(form, lambda: refresh_search_documents(Car.city_id == city.id)):
+                    reference_data.invalidate()
+                    flash(f'City has been updated successfully!', 'success')
+                    return redirect(url_for('main.home'))
         return render_template('update_city.html', form=form, cities=cities)
     else:
         flash(f'There are no cities in the database!', 'info')
@@ -366,15 +391,16 @@ def update_company():
     Returns: The success flash message and redirects to the home page"""
 
     form = UpdateCompany()
-    companies = CarCompany.query.all()
+    companies = reference_data.all(CarCompany)
     if companies:
         if request.method == "POST":
             if form.validate_on_submit():
                 company = CarCompany.query.filter_by(id=form.company_id.data).first()
                 company.company_name = form.company_name.data.replace(" ", "").upper()
-                db.session.commit()
-                flash(f'Company has been updated successfully!', 'success')
-                return redirect(url_for('main.home'))
+                if commit_form(form, lambda: refresh_search_documents(Car.company_id == company.id)):
+                    reference_data.invalidate()
+                    flash(f'Company has been updated successfully!', 'success')
+                    return redirect(url_for('main.home'))
         return render_template('update_company.html', form=form, companies=companies)
     else:
         flash(f'There are no companies in the database!', 'info')
@@ -393,15 +419,16 @@ def update_category():
     Returns: The success flash message and redirects to the home page"""
 
     form = UpdateCategory()
-    categories = CarCategories.query.all()
+    categories = reference_data.all(CarCategories)
     if categories:
         if request.method == "POST":
             if form.validate_on_submit():
                 category = CarCategories.query.filter_by(id=form.category_id.data).first()
                 category.category = form.category.data.replace(" ", "").upper()
-                db.session.commit()
-                flash(f'Category has been updated successfully!', 'success')
-                return redirect(url_for('main.home'))
+                if commit_form(form, lambda: refresh_search_documents(Car.category_id == category.id)):
+                    reference_data.invalidate()
+                    flash(f'Category has been updated successfully!', 'success')
+                    return redirect(url_for('main.home'))
         return render_template('update_category.html', form=form, categories=categories)
     else:
         flash(f'There are no categories in the database!', 'info')
@@ -420,16 +447,74 @@ def update_model():
     Returns: The success flash message and redirects to the home page"""
 
     form = UpdateModel()
-    models = CarModels.query.all()
+    models = reference_data.all(CarModels)
     if models:
         if request.method == "POST":
             if form.validate_on_submit():
                 model = CarModels.query.filter_by(id=form.model_id.data).first()
                 model.model_name = form.model_name.data.replace(" ", "").upper()
-                db.session.commit()
-                flash(f'Model has been updated successfully!', 'success')
-                return redirect(url_for('main.home'))
+                if commit_form(form, lambda: refresh_search_documents(Car.model_id == model.id)):
+                    reference_data.invalidate()
+                    flash(f'Model has been updated successfully!', 'success')
+                    return redirect(url_for('main.home'))
         return render_template('update_model.html', form=form, models=models)
     else:
         flash(f'There are no models in the database!', 'info')
         return redirect(url_for('main.home'))
+
+
+@admins.route("/profiler", methods=['GET', 'POST'])
+@login_required
+@super_admin_role_required
+def profiler_report():
+
+    """Method to see what each endpoint costs, as measured by the profiler of the worker serving the request, which can
+    only be accessed by the super admin. A post request clears the totals.
+    -----------------------------
+    Returns: The stats of each endpoint as JSON or a 404 error if the profiler is turned off"""
+
+    if not profiler.enabled:
+        abort(404)
+    if request.method == "POST":
+        profiler.reset()
+    return jsonify(sample_rate=profiler.sample_rate, endpoints=profiler.report())
+
+
+@admins.route("/pool_stats", methods=['GET', 'POST'])
+@login_required
+@super_admin_role_required
+def pool_stats():
+
+    """Method to see how long the requests of the worker serving the request wait for a database connection and how
+    full its pool is, which can only be accessed by the super admin. A post request clears the counters.
+    -----------------------------
+    Returns: The pool metrics as JSON"""
+
+    if request.method == "POST":
+        pool_metrics.stats.reset()
+    return jsonify(pool_metrics.report())
+
+
+@admins.route("/analytics")
+@login_required
+@admin_role_required
+def fleet_analytics():
+
+    """Method to see the use of the fleet, the revenue and the fines between two days, per car or rolled up by city,
+    company or category, which can only be accessed by the admin. The days default to the last thirty.
+    -----------------------------
+    Returns: The report as a page, or as JSON if asked for with format=json"""
+
+    today = datetime.date.today()
+    try:
+        end = datetime.date.fromisoformat(request.args.get('end') or (today + datetime.timedelta(days=1)).isoformat())
+        start = datetime.date.fromisoformat(request.args.get('start') or (end - datetime.timedelta(days=30)).isoformat())
+    except ValueError:
+        abort(400)
+    by = request.args.get('by', 'city')
+    if by not in GROUPS or start >= end:
+        abort(400)
+    report = analytics.report(start, end, by=by)
+    if request.args.get('format') == 'json':
+        return jsonify(dict(report, start=start.isoformat(), end=end.isoformat()))
+    return render_template('analytics.html', title='Analytics', report=report, groups=list(GROUPS))
@@ -0,0 +1,283 @@
+import datetime
+import threading
+from collections import OrderedDict
+from types import SimpleNamespace
+import numpy as np
+from sqlalchemy import select, func
+from . import db
+from .models import Car, Rented, Maintenance, City, CarCompany, CarCategories
+from .page_cache import page_cache
+from .reference import reference_data
+
+# The number of rows fetched from the database and turned into arrays at a time
+CHUNK_SIZE = 100000
+DAY = 86400
+EPOCH = datetime.date(1970, 1, 1)
+# A car id and a day index are packed into one int64 key as day * KEY_STRIDE + car id
+KEY_STRIDE = 1 << 32
+# The columns of the cars a report can be grouped by, with the reference table and the column naming the group
+GROUPS = {
+    'car': None,
+    'city': ('city_id', City, 'city'),
+    'company': ('company_id', CarCompany, 'company_name'),
+    'category': ('category_id', CarCategories, 'category'),
+}
+
+
+def _epoch(day):
+    return (day - EPOCH).days * DAY
+
+
+def _chunks(statement, dtypes):
+    """Method for running a select and getting its rows as columns, CHUNK_SIZE rows at a time
+
+    Returns
+    ------------------
+    A generator of lists with one NumPy array per column"""
+
+    result = db.session.connection().execution_options(stream_results=True).execute(statement)
+    for rows in result.partitions(CHUNK_SIZE):
+        yield [np.array(column, dtype=dtype) for column, dtype in zip(zip(*rows), dtypes)]
+
+
+def _reduce(keys, values):
+    """Method for summing the values sharing a key
+
+    Returns
+    ------------------
+    The sorted unique keys and the sums"""
+
+    unique, inverse = np.unique(keys, return_inverse=True)
+    return unique, np.bincount(inverse, weights=values, minlength=len(unique))
+
+
+def _fleet():
+    """Method for loading the id, number plate, price per day and group columns of every car as arrays sorted by id"""
+    statement = select(Car.id, Car.car_id, Car.ppd, func.coalesce(Car.city_id, 0), func.coalesce(Car.company_id, 0),
+                       func.coalesce(Car.category_id, 0)).order_by(Car.id)
+    columns = [np.empty(0, dtype=dtype) for dtype in (np.int64, object, np.float64, np.int64, np.int64, np.int64)]
+    chunks = list(_chunks(statement, [column.dtype for column in columns]))
+    if chunks:
+        columns = [np.concatenate(parts) for parts in zip(*chunks)]
+    return SimpleNamespace(**dict(zip(('ids', 'car_id', 'ppd', 'city_id', 'company_id', 'category_id'), columns)))
+
+
+def _positions(fleet, car_ids):
+    """Method for finding the rows of the fleet arrays of some car ids
+
+    Returns
+    ------------------
+    The positions and a mask of the car ids which are still in the fleet"""
+
+    positions = np.searchsorted(fleet.ids, car_ids)
+    found = positions < len(fleet.ids)
+    found[found] = fleet.ids[positions[found]] == car_ids[found]
+    return positions, found
+
+
+def compute_partitions(first, last, fleet):
+    """Method for working out the use of every car on each day from first to last. The confirmed bookings overlapping
+    those days are read in chunks, each booking is expanded into one entry per day it touches without a Python loop,
+    and the seconds of each car on each day are summed by a packed (day, car) key.
+
+    Args
+    ------------------
+    first: It is the first day
+    last: It is the last day, included
+    fleet: It is the fleet arrays used for the price per day
+
+    Returns
+    ------------------
+    A dictionary of the day to its partition, holding the cars used that day, their occupied days and rent, and the
+    cars returned that day with the number of returns"""
+
+    lo = _epoch(first)
+    days = (last - first).days + 1
+    hi = lo + days * DAY
+    statement = select(Rented.carID, Rented.rented_from, Rented.rented_till).where(
+        Rented.final_status == "true", Rented.carID.isnot(None),
+        Rented.rented_till > datetime.datetime.combine(first, datetime.time()),
+        Rented.rented_from < datetime.datetime.combine(last + datetime.timedelta(days=1), datetime.time()))
+    used, returned = ([], []), ([], [])
+    for car_ids, starts, ends in _chunks(statement, (np.int64, 'datetime64[s]', 'datetime64[s]')):
+        starts, ends = starts.astype(np.int64), ends.astype(np.int64)
+        starts, clipped_ends = np.maximum(starts, lo), np.minimum(ends, hi)
+        first_day = (starts - lo) // DAY
+        spans = np.maximum((clipped_ends - 1 - lo) // DAY - first_day + 1, 0)
+        booking = np.repeat(np.arange(len(spans)), spans)
+        day = first_day[booking] + np.arange(len(booking)) - np.repeat(np.cumsum(spans) - spans, spans)
+        day_start = lo + day * DAY
+        seconds = np.minimum(clipped_ends[booking], day_start + DAY) - np.maximum(starts[booking], day_start)
+        keys, sums = _reduce(day * KEY_STRIDE + car_ids[booking], seconds)
+        used[0].append(keys)
+        used[1].append(sums)
+        inside = ends < hi
+        keys, sums = _reduce((ends[inside] - lo) // DAY * KEY_STRIDE + car_ids[inside], np.ones(inside.sum()))
+        returned[0].append(keys)
+        returned[1].append(sums)
+
+    def split(pair):
+        keys, sums = _reduce(np.concatenate(pair[0] or [np.empty(0, np.int64)]),
+                             np.concatenate(pair[1] or [np.empty(0)]))
+        bounds = np.searchsorted(keys, np.arange(days + 1) * KEY_STRIDE)
+        return [(keys[a:b] % KEY_STRIDE, sums[a:b]) for a, b in zip(bounds[:-1], bounds[1:])]
+
+    partitions = {}
+    for offset, ((cars, seconds), (returned_cars, returns)) in enumerate(zip(split(used), split(returned))):
+        positions, found = _positions(fleet, cars)
+        ppd = np.zeros(len(cars))
+        ppd[found] = fleet.ppd[positions[found]]
+        occupied = seconds / DAY
+        partitions[first + datetime.timedelta(days=offset)] = SimpleNamespace(
+            cars=cars, occupied=occupied, rent=occupied * ppd, returned_cars=returned_cars, returns=returns)
+    return partitions
+
+
+def _runs(days):
+    """Method for splitting sorted days into runs of consecutive days
+
+    Returns
+    ------------------
+    The list of the (first, last) day of each run"""
+
+    runs = []
+    for day in days:
+        if runs and runs[-1][1] + datetime.timedelta(days=1) == day:
+            runs[-1][1] = day
+        else:
+            runs.append([day, day])
+    return runs
+
+
+class Analytics:
+    """Class for the reports of the use of the fleet. The bookings are turned into partitions of one day each, holding
+    the occupied days and the rent of every car used that day. A day before today can no longer change, as bookings
+    are only cancelled before they start, so its partition is kept in memory and only today and the days after it
+    are worked out again for each report. The fines and the maintenance are few and are read for each report."""
+
+    def __init__(self, app=None):
+        self.max_days = 3660
+        self._partitions = OrderedDict()
+        self._fleet = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Method for setting up the number of day partitions kept from the app config"""
+        self.max_days = app.config.get('ANALYTICS_CACHE_DAYS', 3660)
+        self._partitions = OrderedDict()
+        self._fleet = None
+        app.extensions['analytics'] = self
+
+    def fleet(self):
+        """Method for getting the fleet arrays, loaded again only when the fleet version has moved"""
+        version = page_cache.counter.read()
+        if self._fleet is None or self._fleet[0] != version:
+            self._fleet = (version, _fleet())
+        return self._fleet[1]
+
+    def partitions(self, first, last, today=None):
+        """Method for getting the partitions of the days from first to last, working out only the days which are not
+        kept yet and today and the days after it
+
+        Returns
+        ------------------
+        The list of the partitions in the order of the days"""
+
+        today = today or datetime.date.today()
+        fleet = self.fleet()
+        days = [first + datetime.timedelta(days=offset) for offset in range((last - first).days + 1)]
+        with self._lock:
+            found = {day: self._partitions[day] for day in days if day in self._partitions}
+        missing = [day for day in days if day not in found]
+        for run_first, run_last in _runs(missing):
+            computed = compute_partitions(run_first, run_last, fleet)
+            found.update(computed)
+            with self._lock:
+                for day, partition in computed.items():
+                    if day < today:
+                        self._partitions[day] = partition
+                while len(self._partitions) > self.max_days:
+                    self._partitions.popitem(last=False)
+        return [found[day] for day in days]
+
+    def reset(self):
+        """Method for dropping the kept partitions"""
+        with self._lock:
+            self._partitions.clear()
+        self._fleet = None
+
+    def report(self, start, end, by='city', limit=100, today=None):
+        """Method for the use, the revenue and the fines of the fleet between two days, per car or rolled up by city,
+        company or category. The revenue is the price per day times the occupied days plus the fines.
+
+        Args
+        ------------------
+        start: It is the first day
+        end: It is the day after the last day
+        by: It is car, city, company or category
+        limit: It is the maximum number of rows, the ones with the highest revenue are kept
+
+        Returns
+        ------------------
+        The dictionary of the rows, sorted by revenue, and the totals of the whole fleet"""
+
+        days = (end - start).days
+        fleet = self.fleet()
+        size = len(fleet.ids)
+        occupied, rent, returns = np.zeros(size), np.zeros(size), np.zeros(size)
+        if days > 0:
+            for partition in self.partitions(start, end - datetime.timedelta(days=1), today):
+                positions, found = _positions(fleet, partition.cars)
+                occupied += np.bincount(positions[found], weights=partition.occupied[found], minlength=size)
+                rent += np.bincount(positions[found], weights=partition.rent[found], minlength=size)
+                positions, found = _positions(fleet, partition.returned_cars)
+                returns += np.bincount(positions[found], weights=partition.returns[found], minlength=size)
+        since, until = (datetime.datetime.combine(day, datetime.time()) for day in (start, end))
+        fines, fined, maintenance = np.zeros(size), np.zeros(size), np.zeros(size)
+        statement = select(Rented.carID, Rented.fine).where(
+            Rented.final_status == "true", Rented.carID.isnot(None), Rented.fine > 0,
+            Rented.rented_till >= since, Rented.rented_till < until)
+        for car_ids, amounts in _chunks(statement, (np.int64, np.float64)):
+            positions, found = _positions(fleet, car_ids)
+            fines += np.bincount(positions[found], weights=amounts[found], minlength=size)
+            fined += np.bincount(positions[found], minlength=size)
+        statement = select(Maintenance.carID).where(Maintenance.carID.isnot(None), Maintenance.date >= since,
+                                                    Maintenance.date < until)
+        for car_ids, in _chunks(statement, (np.int64,)):
+            positions, found = _positions(fleet, car_ids)
+            maintenance += np.bincount(positions[found], minlength=size)
+
+        if GROUPS[by] is None:
+            groups, names = np.arange(size), fleet.car_id
+        else:
+            column, model, name = GROUPS[by]
+            groups, inverse = np.unique(getattr(fleet, column), return_inverse=True)
+            names = [getattr(reference_data.get(model, int(group_id)), name, "Unknown") for group_id in groups]
+            groups = inverse
+        count = len(names)
+
+        def total(values):
+            return np.bincount(groups, weights=values, minlength=count)
+
+        columns = dict(cars=total(np.ones(size)), occupied_days=total(occupied), rent=total(rent), fines=total(fines),
+                       fined=total(fined), returns=total(returns), maintenance=total(maintenance))
+        columns['revenue'] = columns['rent'] + columns['fines']
+        order = np.argsort(-columns['revenue'], kind='stable')[:limit]
+        rows = [self._row(names[i], {key: values[i] for key, values in columns.items()}, days) for i in order]
+        totals = self._row("All cars", {key: values.sum() for key, values in columns.items()}, days)
+        return dict(start=start, end=end, by=by, days=days, rows=rows, totals=totals)
+
+    @staticmethod
+    def _row(name, values, days):
+        capacity = values['cars'] * days
+        return dict(name=name, cars=int(values['cars']), occupied_days=round(float(values['occupied_days']), 1),
+                    utilization=round(float(values['occupied_days'] / capacity), 4) if capacity else 0.0,
+                    revenue=int(round(values['revenue'])), fines=int(values['fines']), returns=int(values['returns']),
+                    fine_rate=round(float(values['fined'] / values['returns']), 4) if values['returns'] else 0.0,
+                    average_fine=int(values['fines'] / values['fined']) if values['fined'] else 0,
+                    maintenance=int(values['maintenance']))
+
+
+analytics = Analytics()
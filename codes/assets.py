@@ -0,0 +1,142 @@
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import shutil
+import click
+from flask import current_app, request, send_from_directory, url_for, abort
+from flask.cli import with_appcontext
+
+# The assets are cached by the browsers for a year without asking again, their name changes with their content
+MAX_AGE = 365 * 24 * 3600
+# The directories of the static folder which are not assets, e.g. the uploads of the users
+SKIP_DIRECTORIES = ('dist', 'id_proofs')
+# The files worth compressing, the others (images, fonts) are compressed already
+COMPRESSIBLE = ('.css', '.js', '.svg', '.json', '.txt', '.html', '.map')
+# The encodings built next to each asset, in the order they are preferred
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+
+def _fingerprinted(name, content):
+    root, ext = os.path.splitext(name)
+    return f"{root}.{hashlib.sha256(content).hexdigest()[:12]}{ext}"
+
+
+def _brotli():
+    try:
+        import brotli
+    except ImportError:
+        return None
+    return brotli
+
+
+def build(source, output):
+    """Method for building the assets: every file of the static folder is copied to the output folder under a name
+    holding the hash of its content, with a gzip and a brotli copy of the ones worth compressing, and a manifest of
+    the names is written for asset_url. Brotli is skipped if the brotli package is not installed.
+
+    Args
+    ------------------
+    source: It is the static folder
+    output: It is the folder the built assets go to
+
+    Returns
+    ------------------
+    The manifest, a dictionary of the name of each asset to its fingerprinted name"""
+
+    brotli = _brotli()
+    if os.path.isdir(output):
+        shutil.rmtree(output)
+    manifest = {}
+    for directory, directories, files in os.walk(source):
+        if directory == source:
+            directories[:] = [name for name in directories if name not in SKIP_DIRECTORIES]
+        for filename in sorted(files):
+            path = os.path.join(directory, filename)
+            name = os.path.relpath(path, source).replace(os.sep, '/')
+            with open(path, 'rb') as f:
+                content = f.read()
+            built = _fingerprinted(name, content)
+            target = os.path.join(output, built)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            with open(target, 'wb') as f:
+                f.write(content)
+            if filename.endswith(COMPRESSIBLE):
+                with open(target + '.gz', 'wb') as f:
+                    f.write(gzip.compress(content, compresslevel=9, mtime=0))
+                if brotli is not None:
+                    with open(target + '.br', 'wb') as f:
+                        f.write(brotli.compress(content, quality=11))
+            manifest[name] = built
+    with open(os.path.join(output, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    return manifest
+
+
+class Assets:
+    """Class for serving the built assets. asset_url gives the fingerprinted url of an asset, which is served at
+    /assets/ with an immutable Cache-Control, so a returning visitor asks for none of them until one changes. The
+    precompressed copy matching the Accept-Encoding of the browser is sent as it is, and the file goes out through
+    the file wrapper of the server (sendfile under gunicorn), or through the front server when USE_X_SENDFILE is on.
+    Without a build, asset_url falls back to the plain static url."""
+
+    def __init__(self, app=None):
+        self.output = None
+        self.manifest = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Method for loading the manifest of the build and adding the route and the template global"""
+        self.output = app.config.get('ASSETS_FOLDER') or os.path.join(app.static_folder, 'dist')
+        try:
+            with open(os.path.join(self.output, 'manifest.json')) as f:
+                self.manifest = json.load(f)
+        except (FileNotFoundError, ValueError):
+            self.manifest = {}
+        app.add_url_rule('/assets/<path:filename>', 'assets', self.serve)
+        app.add_template_global(self.url, 'asset_url')
+        app.extensions['assets'] = self
+
+    def url(self, filename):
+        """Method for getting the url of an asset
+
+        Returns
+        ------------------
+        The fingerprinted url if the asset is built else the static url"""
+
+        built = self.manifest.get(filename)
+        if built is None:
+            return url_for('static', filename=filename)
+        return url_for('assets', filename=built)
+
+    def serve(self, filename):
+        """Method for sending a built asset, precompressed if the browser accepts it"""
+        if filename == 'manifest.json' or filename.endswith(tuple(suffix for _, suffix in ENCODINGS)):
+            abort(404)
+        mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        encoding, path = None, filename
+        for name, suffix in ENCODINGS:
+            if name in request.accept_encodings and os.path.isfile(os.path.join(self.output, filename + suffix)):
+                encoding, path = name, filename + suffix
+                break
+        response = send_from_directory(self.output, path, mimetype=mimetype, max_age=MAX_AGE)
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        response.vary.add('Accept-Encoding')
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+        return response
+
+
+assets = Assets()
+
+
+@click.command('build-assets')
+@with_appcontext
+def build_assets_command():
+    """Fingerprint and compress the static files for asset_url."""
+    manifest = build(current_app.static_folder, assets.output)
+    assets.manifest = manifest
+    click.echo(f"{len(manifest)} assets built in {assets.output}")
@@ -0,0 +1,46 @@
+from sqlalchemy import and_, exists
+from .models import Car, Rented
+
+
+def booking_overlaps(rent_from, rent_till):
+    """Method for building the condition which matches the confirmed bookings clashing with a time period
+
+    Args
+    ------------------
+    rent_from: It is the date from which the car is needed
+    rent_till: It is the date till which the car is needed
+
+    Returns
+    ------------------
+    The SQL condition which is true for a confirmed booking overlapping the given dates"""
+
+    return and_(Rented.final_status == "true", Rented.rented_from <= rent_till, Rented.rented_till >= rent_from)
+
+
+def available_cars(city_id, rent_from, rent_till):
+    """Method for getting the cars of a city which are free for the whole of a time period. The booked cars are
+    removed with a correlated NOT EXISTS so the database answers it as one anti-join probing the bookings of each car,
+    instead of first loading every clashing booking into python and sending it back as a NOT IN list.
+
+    Args
+    ------------------
+    city_id: It is the city in which the cars are needed
+    rent_from: It is the date from which the car is needed
+    rent_till: It is the date till which the car is needed
+
+    Returns
+    ------------------
+    The query of the available cars which can be filtered and paginated further"""
+
+    clash = exists().where(Rented.carID == Car.id).where(booking_overlaps(rent_from, rent_till))
+    return Car.query.filter_by(city_id=city_id).filter_by(status="true").filter(~clash)
+
+
+def is_car_available(car_id, rent_from, rent_till):
+    """Method for checking if a single car has no confirmed booking clashing with a time period
+
+    Returns
+    ------------------
+    True if the car is free for the whole time period else False"""
+
+    return Rented.query.filter_by(carID=car_id).filter(booking_overlaps(rent_from, rent_till)).first() is None
@@ -1,5 +1,6 @@
 from flask_wtf import FlaskForm
-from wtforms import StringField, SubmitField, IntegerField, TextAreaField
+from wtforms import StringField, SubmitField, IntegerField, TextAreaField, BooleanField
+from flask_wtf.file import FileField, FileAllowed, FileRequired
 from wtforms.validators import DataRequired, Length
 from ..validations import Validators
 
@@ -51,3 +52,15 @@ class CarMaintenance(FlaskForm):
 	"""Form for accepting the description of the car from admin for maintaining it"""
 	description = TextAreaField('Description', validators=[DataRequired()])
 	submit = SubmitField('Done!')
+
+
+class ImportCars(FlaskForm):
+	"""Form for taking a CSV or JSON lines file of cars from the admin to add a whole fleet at once"""
+	fleet = FileField('Fleet file', validators=[FileRequired(), FileAllowed(['csv', 'jsonl'])])
+	dry_run = BooleanField('Only check the file')
+	submit = SubmitField('Import Cars!')
+
+
+class BookCar(FlaskForm):
+	"""Form for confirming the booking of a car, which holds the car for the user while he pays"""
+	submit = SubmitField('Confirm Car!')
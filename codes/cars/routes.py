@@ -1,10 +1,19 @@
-from flask import render_template, Blueprint, flash, redirect, url_for, request
-from .. import db
+from flask import render_template, Blueprint, flash, redirect, url_for, request, Response, stream_with_context, abort
+from .. import db, manifest, fleet_io, search_context
 from flask_login import current_user, login_required
 from ..decorators import admin_role_required, user_required, user_verified
-from ..models import Car, CarCategories, CarModels, CarCompany, City, Temporary, Rented, Maintenance, User
-from .forms import CreateCars, GetCar, UpdateCar, ReturnCar, CarMaintenance
+from ..models import Car, CarCategories, CarModels, CarCompany, City, Rented, Maintenance, User, \
+    ManifestEntry
+from .forms import CreateCars, GetCar, UpdateCar, ReturnCar, CarMaintenance, ImportCars, BookCar
 from ..main.forms import SearchForm
+from ..availability import booking_overlaps, is_car_available
+from ..reservations import hold_car
+from ..loaders import CAR_DETAILS, MANIFEST_ENTRY_DETAILS
+from ..reference import reference_data
+from ..search import refresh_search_documents
+from ..pagination import keyset_paginate
+from ..page_cache import page_cache
+from ..validations import commit_form
 import datetime
 
 cars = Blueprint('cars', __name__)
@@ -28,10 +37,10 @@ def create_cars():
     Returns: The success flash message and redirects to the home page"""
 
     form = CreateCars()
-    categories = CarCategories.query.all()
-    companies = CarCompany.query.all()
-    models = CarModels.query.all()
-    cities = City.query.all()
+    categories = reference_data.all(CarCategories)
+    companies = reference_data.all(CarCompany)
+    models = reference_data.all(CarModels)
+    cities = reference_data.all(City)
     if request.method == "POST":
         if form.validate_on_submit():
             car = Car(car_id=form.car_id.data.replace(" ", "").upper(), company_id=form.company_id.data,
@@ -40,13 +49,54 @@ def create_cars():
                       mileage=form.mileage.data, ppd=form.ppd.data, min_rent=form.min_rent.data,
                       city_id=form.city_id.data, deposit=form.deposit.data)
             db.session.add(car)
-            db.session.commit()
-            flash(f'Car has been added successfully!', 'success')
-            return redirect(url_for('main.home'))
+            if commit_form(form, lambda: refresh_search_documents(Car.id == car.id)):
+                page_cache.invalidate()
+                flash(f'Car has been added successfully!', 'success')
+                return redirect(url_for('main.home'))
     return render_template('create_cars.html', form=form, categories=categories, models=models, companies=companies,
                            cities=cities)
 
 
+@cars.route("/import_cars", methods=['GET', 'POST'])
+@login_required
+@admin_role_required
+def import_cars():
+
+    """Method to add a whole fleet of cars from a CSV or JSON lines file which can only be accessed by the admin. If the
+    request method is get, a form is called to upload the file and upon the validation of the form, every valid car of
+    the file is added and the rows which could not be added are listed with their errors.
+    -----------------------------
+    Returns: The import form with the report of the upload if any"""
+
+    form = ImportCars()
+    report = None
+    if form.validate_on_submit():
+        fleet = form.fleet.data
+        report = fleet_io.import_cars(fleet.stream, fleet_io.file_format(fleet.filename), dry_run=form.dry_run.data)
+        if form.dry_run.data:
+            flash(f'{report.inserted} cars can be added and {report.failed} rows have errors!', 'info')
+        else:
+            flash(f'{report.inserted} cars have been added successfully!', 'success')
+    return render_template('import_cars.html', form=form, report=report, fields=fleet_io.CAR_FIELDS)
+
+
+@cars.route("/export_<string:table>.<string:fmt>")
+@login_required
+@admin_role_required
+def export(table, fmt):
+
+    """Method to download the fleet or the booking history as a CSV or JSON lines file which can only be accessed by
+    the admin. The file is streamed while it is written.
+    -----------------------------
+    Returns: The file of the cars or of the bookings"""
+
+    exports = {'cars': fleet_io.export_cars, 'bookings': fleet_io.export_bookings}
+    if table not in exports or fmt not in fleet_io.FORMATS:
+        abort(404)
+    return Response(stream_with_context(exports[table](fmt)), mimetype=fleet_io.FORMATS[fmt],
+                    headers={'Content-Disposition': f'attachment; filename={table}.{fmt}'})
+
+
 @cars.route("/get_car",  methods=['GET', 'POST'])
 @login_required
 @admin_role_required
@@ -79,8 +129,8 @@ def update_car():
 
     car_id = request.args.get('car_id')
     car = Car.query.filter_by(car_id=car_id).first()
-    cities = City.query.all()
-    current_city = City.query.filter_by(id=car.city_id).first()
+    cities = reference_data.all(City)
+    current_city = reference_data.get(City, car.city_id)
     form = UpdateCar()
     if request.method == "POST":
         if form.validate_on_submit():
@@ -91,7 +141,9 @@ def update_car():
             car.deposit = form.deposit.data
             car.city_id = form.city_id.data
             car.status = form.status.data
+            refresh_search_documents(Car.id == car.id)
             db.session.commit()
+            page_cache.invalidate()
             flash(' Car has been updated successfully!', 'success')
             return redirect(url_for('main.home'))
     elif request.method == "GET":
@@ -106,6 +158,7 @@ def update_car():
 
 
 @cars.route('/view_car/<string:car_id>')
+@page_cache.cached
 def view_car(car_id):
 
     """Method to view a car by clicking on the view car button which does not require to be an authenticated or an
@@ -113,71 +166,55 @@ def view_car(car_id):
     -----------------------------
     Returns: The car details which was viewed by the user"""
 
-    car = Car.query.filter_by(car_id=car_id).first()
+    car = Car.query.options(*CAR_DETAILS).filter_by(car_id=car_id).first()
     return render_template('view_car.html', car=car)
 
 
-@cars.route('/book_car/<int:car_id>')
+@cars.route('/book_car/<int:car_id>', methods=['GET', 'POST'])
 @login_required
 @user_required
 @user_verified
 def book_car(car_id):
 
-    """Method to book a car for a verified user. The car is booked only if he does not have any other bookings during
-    that time period and if he does not have any pending fine.
+    """Method to book a car for a verified user. The car and the price are shown first, and the car is only held for
+    him while he pays once he confirms it with a post, so opening or prefetching the link holds nothing. He can only
+    book it if he does not have any other bookings during that time period and if he does not have any pending fine.
     -----------------------------
-    Returns: The success flash message and redirects to the home page if no pending fine or bookings at that time else
-    return a warning flash message"""
+    Returns: The car with a confirm button, or redirects to the payment of the hold once confirmed, or a warning flash
+    message"""
 
     if not current_user.fine_pending:
-        user = Temporary.query.filter_by(user_id=current_user.id).first()
-        rented_cars = Rented.query.filter(user.rent_from <= Rented.rented_till) \
-            .filter(user.rent_till >= Rented.rented_from).filter_by(carID=car_id)\
-            .filter(Rented.final_status == "true").all()
-        record = Rented.query.filter(user.rent_from <= Rented.rented_till) \
-            .filter(user.rent_till >= Rented.rented_from).filter_by(user_id=current_user.id) \
-            .filter(Rented.final_status == "true").all()
-        if rented_cars:
-            flash("Sorry! This car is already booked!", "warning")
-            return redirect(url_for('main.home'))
-        elif record:
+        dates = search_context.current()
+        if dates is None or dates.expired:
+            flash("Please Enter the dates again!", "info")
+            return redirect(url_for('users.taking_dates'))
+        record = Rented.query.filter_by(user_id=current_user.id)\
+            .filter(booking_overlaps(dates.rent_from, dates.rent_till)).first()
+        if record:
             flash("Sorry! You already have a booking for this time period and you can only book a single at a"
                   " given time!", "warning")
             return redirect(url_for('main.home'))
-        else:
-            car = Car.query.filter_by(id=car_id).first()
-            dates = Temporary.query.filter_by(user_id=current_user.id).first()
-            days = int(str(dates.rent_till - dates.rent_from).split(" ")[0])
-            rent_from = str(dates.rent_from).split(" ")[0]
-            rent_till = str(dates.rent_till).split(" ")[0]
-            return render_template('payment.html', car=car, days=days, rent_from=rent_from, rent_till=rent_till,
-                                   dates=dates)
+        form = BookCar()
+        if form.validate_on_submit():
+            hold = hold_car(car_id, current_user, dates.rent_from, dates.rent_till, dates.city_id)
+            if hold is None:
+                flash("Sorry! This car is already booked!", "warning")
+                return redirect(url_for('main.home'))
+            return redirect(url_for('users.index', hold_id=hold.id))
+        car = Car.query.options(*CAR_DETAILS).filter_by(id=car_id).first_or_404()
+        if not is_car_available(car_id, dates.rent_from, dates.rent_till):
+            flash("Sorry! This car is already booked!", "warning")
+            return redirect(url_for('main.home'))
+        days = (dates.rent_till - dates.rent_from).days
+        rent_from = str(dates.rent_from).split(" ")[0]
+        rent_till = str(dates.rent_till).split(" ")[0]
+        return render_template('payment.html', car=car, days=days, rent_from=rent_from, rent_till=rent_till,
+                               dates=dates, book_form=form, search=request.args.get(search_context.KEY))
     else:
         flash("You first need the to pay your previous fine to book a car!", "warning")
         return redirect(url_for('users.bookings'))
 
 
-@cars.route('/confirm_car')
-@login_required
-@user_required
-def confirm_car():
-
-    """Method to confirm the booking of the user in the database only after he has completed his payment.
-    -----------------------------
-    Returns: The success flash message and redirects to the home page"""
-
-    ids = request.args.get('ids')
-    dates = Temporary.query.filter_by(user_id=current_user.id).first()
-    rent = Rented(carID=ids, user_id=current_user.id, booking_time=datetime.datetime.now(),
-                  rented_from=dates.rent_from, rented_till=dates.rent_till,
-                  city_taken_id=current_user.city_id, city_delivery_id=dates.city_id)
-
-    db.session.add(rent)
-    db.session.commit()
-    flash("The car has been booked successfully!", "success")
-    return redirect(url_for('main.home'))
-
-
 @cars.route("/get_delete_car",  methods=['GET', 'POST'])
 @login_required
 @admin_role_required
@@ -190,7 +227,7 @@ def get_delete_car():
 
     form = GetCar()
     if form.validate_on_submit():
-        car = Car.query.filter_by(car_id=form.car.data.replace(" ", "").upper()).first()
+        car = Car.query.options(*CAR_DETAILS).filter_by(car_id=form.car.data.replace(" ", "").upper()).first()
         return render_template('delete_car.html', car=car)
     return render_template('get_car.html', form=form)
 
@@ -212,10 +249,12 @@ def delete_car(car_id):
         else:
             Car.query.filter_by(id=car_id).delete()
             db.session.commit()
+            page_cache.invalidate()
             flash("Car deleted successfully!", "success")
     else:
         Car.query.filter_by(id=car_id).delete()
         db.session.commit()
+        page_cache.invalidate()
         flash("Car deleted successfully!", "success")
     return redirect(url_for('main.home'))
 
@@ -231,10 +270,8 @@ def cars_taking_list():
     Returns: The cars list if there are bookings for that day else returns an info message and redirects to the home
     page"""
 
-    page = request.args.get('page', 1, type=int)
-    orders = Rented.query.filter_by(city_taken_id=current_user.city_id).filter_by(final_status="true")\
-        .filter_by(rented_from=datetime.date.today()).filter_by(car_taken=False)\
-        .paginate(page=page, per_page=5)
+    orders = manifest.entries(current_user.city_id, manifest.PICKUP).options(*MANIFEST_ENTRY_DETAILS)
+    orders = keyset_paginate(orders, (ManifestEntry.day, ManifestEntry.booking_id), request.args.get('cursor'))
     if orders.items:
         return render_template('cars_taking.html', orders=orders)
     else:
@@ -251,9 +288,12 @@ def car_taken(ids):
     -----------------------------
     Returns: Enter the data that the car is taken by the user and redirects to the home page"""
 
-    record = Rented.query.filter_by(booking_id=ids).first()
-    record.car_taken = True
-    db.session.commit()
+    record = Rented.query.filter_by(booking_id=ids).first_or_404()
+    # a double click or a reopened link must not move the booking twice
+    if not record.car_taken:
+        record.car_taken = True
+        manifest.car_taken(record)
+        db.session.commit()
     return redirect(url_for('main.home'))
 
 
@@ -268,10 +308,8 @@ def cars_delivery_list():
     Returns: The cars list if there are returns for that day else returns an info message and redirects to the home
     page"""
 
-    page = request.args.get('page', 1, type=int)
-    orders = Rented.query.filter_by(city_delivery_id=current_user.city_id).filter_by(final_status="true")\
-        .filter_by(rented_till=datetime.date.today()).filter_by(car_taken=True)\
-        .filter_by(car_delivery=False).paginate(page=page, per_page=5)
+    orders = manifest.entries(current_user.city_id, manifest.RETURN).options(*MANIFEST_ENTRY_DETAILS)
+    orders = keyset_paginate(orders, (ManifestEntry.day, ManifestEntry.booking_id), request.args.get('cursor'))
     if orders.items:
         return render_template('cars_delivery.html', orders=orders)
     else:
@@ -303,6 +341,7 @@ def car_return_review(ids):
                 user = User.query.filter_by(id=record.user_id).first()
                 user.fine_pending = True
             record.car_delivery = True
+            manifest.car_returned(record)
             db.session.commit()
             flash('Car reviewed!', "success")
             return redirect(url_for('main.home'))
@@ -320,10 +359,8 @@ def cars_taking_list_late():
     Returns: The cars list if there are bookings for that day else returns an info message and redirects to the home
     page"""
 
-    page = request.args.get('page', 1, type=int)
-    orders = Rented.query.filter_by(city_taken_id=current_user.city_id).filter_by(final_status="true")\
-        .filter(Rented.rented_from < datetime.date.today()).filter(Rented.rented_till > datetime.date.today())\
-        .filter_by(car_taken=False).paginate(page=page, per_page=5)
+    orders = manifest.entries(current_user.city_id, manifest.PICKUP, late=True).options(*MANIFEST_ENTRY_DETAILS)
+    orders = keyset_paginate(orders, (ManifestEntry.day, ManifestEntry.booking_id), request.args.get('cursor'))
     if orders.items:
         return render_template('cars_taking.html', orders=orders)
     else:
@@ -341,10 +378,8 @@ def cars_delivery_list_late():
     Returns: The cars list if there are returns for that day else returns an info message and redirects to the home
     page"""
 
-    page = request.args.get('page', 1, type=int)
-    orders = Rented.query.filter_by(city_delivery_id=current_user.city_id).filter_by(final_status="true")\
-        .filter(Rented.rented_till < datetime.date.today()).filter_by(car_taken=True)\
-        .filter_by(car_delivery=False).paginate(page=page, per_page=5)
+    orders = manifest.entries(current_user.city_id, manifest.RETURN, late=True).options(*MANIFEST_ENTRY_DETAILS)
+    orders = keyset_paginate(orders, (ManifestEntry.day, ManifestEntry.booking_id), request.args.get('cursor'))
     if orders.items:
         return render_template('cars_delivery.html', orders=orders)
     else:
@@ -393,6 +428,7 @@ def car_maintenance():
             db.session.add(record)
             car.status = False
             db.session.commit()
+            page_cache.invalidate()
             flash('Car successfully added to maintenance!', 'success')
             return redirect(url_for('main.home'))
     return render_template('car_maintenance.html', form=form)
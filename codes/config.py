@@ -1,19 +1,74 @@
 import os
 from dotenv import load_dotenv
+from .pool_metrics import InstrumentedQueuePool
 
 load_dotenv()
 
 
+def engine_options(url):
+	"""Method for building the SQLAlchemy engine options from the env variables. Each gunicorn worker opens up to
+	DB_POOL_SIZE + DB_MAX_OVERFLOW connections, so workers times that plus the job workers has to stay below the
+	max_connections of the database."""
+	if not url or url.startswith("sqlite"):
+		return {}
+	options = dict(
+		poolclass=InstrumentedQueuePool,
+		pool_size=int(os.environ.get("DB_POOL_SIZE", 5)),
+		max_overflow=int(os.environ.get("DB_MAX_OVERFLOW", 10)),
+		pool_timeout=int(os.environ.get("DB_POOL_TIMEOUT", 30)),
+		pool_recycle=int(os.environ.get("DB_POOL_RECYCLE", 1800)),
+		pool_pre_ping=os.environ.get("DB_POOL_PRE_PING", "true").lower() == "true",
+	)
+	statement_timeout = int(os.environ.get("DB_STATEMENT_TIMEOUT", 0))
+	if statement_timeout and url.startswith("postgres"):
+		options["connect_args"] = {"options": f"-c statement_timeout={statement_timeout}"}
+	return options
+
+
 class Config:
 	"""For declaring the env variables"""
 	SECRET_KEY = os.environ.get("SECRET_KEY")
 	SQLALCHEMY_DATABASE_URI = os.environ.get("DB_URL")
-	MAIL_SERVER = 'smtp.gmail.com'
-	MAIL_PORT = 587
-	MAIL_USE_TLS = True
+	SQLALCHEMY_ENGINE_OPTIONS = engine_options(SQLALCHEMY_DATABASE_URI)
+	MAIL_SERVER = os.environ.get("MAIL_SERVER", 'smtp.gmail.com')
+	MAIL_PORT = int(os.environ.get("MAIL_PORT", 587))
+	MAIL_USE_TLS = os.environ.get("MAIL_USE_TLS", "true").lower() == "true"
 	MAIL_USERNAME = os.environ.get("EMAIL_USER")
 	MAIL_PASSWORD = os.environ.get("EMAIL_PASS")
 	publishable_key = os.environ.get("STRIPE_PUBLISHABLE_KEY")
 	secret_key = os.environ.get("STRIPE_SECRET_KEY")
+	STRIPE_WEBHOOK_SECRET = os.environ.get("STRIPE_WEBHOOK_SECRET")
+	MAX_CONTENT_LENGTH = int(os.environ.get("MAX_CONTENT_LENGTH", 10 * 1024 * 1024))
+	REFERENCE_VERSION_FILE = os.environ.get("REFERENCE_VERSION_FILE")
+	USER_CACHE_BACKEND = os.environ.get("USER_CACHE_BACKEND", "memory")
+	USER_CACHE_URL = os.environ.get("USER_CACHE_URL")
+	USER_CACHE_TTL = int(os.environ.get("USER_CACHE_TTL", 60))
+	USER_VERSION_FILE = os.environ.get("USER_VERSION_FILE")
+	PROFILER_ENABLED = os.environ.get("PROFILER_ENABLED", "false").lower() == "true"
+	PROFILER_SAMPLE_RATE = float(os.environ.get("PROFILER_SAMPLE_RATE", 1.0))
+	FLEET_VERSION_FILE = os.environ.get("FLEET_VERSION_FILE")
+	PAGE_CACHE_ENABLED = os.environ.get("PAGE_CACHE_ENABLED", "true").lower() == "true"
+	PAGE_CACHE_SIZE = int(os.environ.get("PAGE_CACHE_SIZE", 1000))
+	PAGE_CACHE_TTL = int(os.environ.get("PAGE_CACHE_TTL", 300))
+	ANALYTICS_CACHE_DAYS = int(os.environ.get("ANALYTICS_CACHE_DAYS", 3660))
+	SEARCH_CONTEXT_MAX_AGE = int(os.environ.get("SEARCH_CONTEXT_MAX_AGE", 30 * 86400))
+	BCRYPT_LOG_ROUNDS = int(os.environ.get("BCRYPT_LOG_ROUNDS", 12))
+	PASSWORD_HASH_WORKERS = int(os.environ.get("PASSWORD_HASH_WORKERS", 2))
+	PASSWORD_HASH_TIMEOUT = float(os.environ.get("PASSWORD_HASH_TIMEOUT", 10))
+	RATELIMIT_BACKEND = os.environ.get("RATELIMIT_BACKEND", "memory")
+	RATELIMIT_URL = os.environ.get("RATELIMIT_URL")
+	RATELIMIT_TRUSTED_PROXIES = int(os.environ.get("RATELIMIT_TRUSTED_PROXIES", 0))
+	RATELIMIT_LOGIN_IP = os.environ.get("RATELIMIT_LOGIN_IP")
+	RATELIMIT_LOGIN_ACCOUNT = os.environ.get("RATELIMIT_LOGIN_ACCOUNT")
+	RATELIMIT_LOGIN_ALL = os.environ.get("RATELIMIT_LOGIN_ALL")
+	RATELIMIT_RESET_REQUEST_IP = os.environ.get("RATELIMIT_RESET_REQUEST_IP")
+	RATELIMIT_RESET_REQUEST_ACCOUNT = os.environ.get("RATELIMIT_RESET_REQUEST_ACCOUNT")
+	RATELIMIT_RESET_REQUEST_ALL = os.environ.get("RATELIMIT_RESET_REQUEST_ALL")
+	ASSETS_FOLDER = os.environ.get("ASSETS_FOLDER")
+	USE_X_SENDFILE = os.environ.get("USE_X_SENDFILE", "false").lower() == "true"
+	STORAGE_ROOT = os.environ.get("STORAGE_ROOT")
+	STORAGE_DELIVERY = os.environ.get("STORAGE_DELIVERY", "send_file")
+	STORAGE_ACCEL_PREFIX = os.environ.get("STORAGE_ACCEL_PREFIX", "/_protected/")
+	STORAGE_URL_MAX_AGE = int(os.environ.get("STORAGE_URL_MAX_AGE", 300))
 
 
@@ -1,5 +1,8 @@
 from flask import Blueprint, render_template
 from ..main.forms import SearchForm
+from ..passwords import PasswordServiceBusy
+from ..ratelimit import RateLimited
+import math
 
 errors = Blueprint('errors', __name__)
 
@@ -29,3 +32,19 @@ def error_500(error):
     """Method to display a good and manageable user interface for 500 Errors"""
     form = SearchForm()
     return render_template('errors/500.html', form=form), 500
+
+
+@errors.app_errorhandler(PasswordServiceBusy)
+def error_503(error):
+    """Method to display a good and manageable user interface when the passwords can not be hashed fast enough"""
+    form = SearchForm()
+    return render_template('errors/503.html', form=form), 503, {'Retry-After': '5'}
+
+
+@errors.app_errorhandler(RateLimited)
+def error_429(error):
+    """Method to display a good and manageable user interface when too many attempts are made"""
+    form = SearchForm()
+    retry_after = max(1, math.ceil(error.retry_after))
+    return render_template('errors/429.html', form=form, retry_after=retry_after), 429, \
+        {'Retry-After': str(retry_after)}
@@ -0,0 +1,242 @@
+import csv
+import io
+import json
+import os
+from itertools import islice
+from . import db
+from .models import Car, CarCompany, CarModels, CarCategories, City, Rented, User
+from .page_cache import page_cache
+from .reference import reference_data
+from .search import refresh_search_documents
+
+# The columns of a fleet file, the reference tables are given by their names instead of their ids
+CAR_FIELDS = ('car_id', 'company', 'model', 'category', 'color', 'mileage', 'ppd', 'min_rent', 'deposit', 'city',
+              'status')
+NUMBER_FIELDS = ('mileage', 'ppd', 'min_rent', 'deposit')
+BOOKING_FIELDS = ('booking_id', 'car_id', 'username', 'booking_time', 'rented_from', 'rented_till', 'city_taken',
+                  'city_delivery', 'final_status', 'car_taken', 'car_delivery', 'fine', 'fine_paid')
+FORMATS = {'csv': 'text/csv', 'jsonl': 'application/x-ndjson'}
+BATCH_SIZE = 1000
+# Only this many error messages are kept in the report, the rest are only counted
+MAX_ERRORS = 500
+
+
+class ImportReport:
+    """Class for the outcome of an import, the number of cars added and the errors of the rows which were skipped"""
+
+    def __init__(self):
+        self.inserted = 0
+        self.failed = 0
+        self.errors = []
+
+    def error(self, line, message):
+        self.failed += 1
+        if len(self.errors) < MAX_ERRORS:
+            self.errors.append((line, message))
+
+
+def file_format(filename):
+    """Method for getting the format of a fleet file from its extension, None if it is not supported"""
+    fmt = os.path.splitext(filename or '')[1].lower().lstrip('.')
+    return fmt if fmt in FORMATS else None
+
+
+def read_rows(stream, fmt):
+    """Method for reading the rows of a CSV or JSON lines file one at a time
+
+    Args
+    ------------------
+    stream: It is the binary stream of the file
+    fmt: It is csv or jsonl
+
+    Returns
+    ------------------
+    A generator of the line number and the row as a dictionary, or the line number and the error message"""
+
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    if fmt == 'csv':
+        reader = csv.DictReader(text)
+        for row in reader:
+            yield reader.line_num, {key.strip().lower(): value for key, value in row.items() if key}
+        return
+    for line_num, line in enumerate(text, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            yield line_num, "The line is not valid JSON!"
+            continue
+        if not isinstance(row, dict):
+            yield line_num, "The line is not a JSON object!"
+            continue
+        yield line_num, {key.lower(): value for key, value in row.items()}
+
+
+def _name(value):
+    """Method for normalizing a name the way the forms store it, without spaces and in upper case"""
+    return str(value or '').replace(" ", "").upper()
+
+
+def _lookups():
+    """Method for getting the ids of the reference rows by their names from the reference cache"""
+    return {
+        'company': {row.company_name: row.id for row in reference_data.all(CarCompany)},
+        'model': {row.model_name: row.id for row in reference_data.all(CarModels)},
+        'category': {row.category: row.id for row in reference_data.all(CarCategories)},
+        'city': {row.city: row.id for row in reference_data.all(City)},
+    }
+
+
+def _clean(row, lookups):
+    """Method for turning a row of the file into the values of a car
+
+    Returns
+    ------------------
+    The values of the car and the list of the errors of the row"""
+
+    errors = []
+    car_id = _name(row.get('car_id'))
+    if not 2 <= len(car_id) <= 20:
+        errors.append("car_id should have between 2 and 20 characters")
+    values = dict(car_id=car_id, color=_name(row.get('color')), status=_name(row.get('status')).lower() or "true")
+    if not values['color']:
+        errors.append("color is required")
+    if values['status'] not in ("true", "false"):
+        errors.append("status should be true or false")
+    for field in ('company', 'model', 'category', 'city'):
+        row_id = lookups[field].get(_name(row.get(field)))
+        if row_id is None:
+            errors.append(f"there is no {field} named {row.get(field)!r}")
+        values[f'{field}_id'] = row_id
+    for field in NUMBER_FIELDS:
+        try:
+            values[field] = int(row.get(field))
+            if values[field] <= 0:
+                raise ValueError
+        except (TypeError, ValueError):
+            errors.append(f"{field} should be a positive number")
+    return values, errors
+
+
+def import_cars(stream, fmt, dry_run=False, batch_size=BATCH_SIZE):
+    """Method for adding the cars of a fleet file. The file is read in batches; the names of the companies, models,
+    categories and cities are resolved from the reference cache, the number plates of a whole batch are checked
+    against the database with one query and the valid cars of the batch are inserted with a single executemany.
+    Invalid rows are skipped and reported, every valid row is added.
+
+    Args
+    ------------------
+    stream: It is the binary stream of the file
+    fmt: It is csv or jsonl
+    dry_run: It is True if the file should only be validated
+    batch_size: It is the number of rows checked and inserted together
+
+    Returns
+    ------------------
+    The ImportReport"""
+
+    report = ImportReport()
+    lookups = _lookups()
+    seen = set()
+    rows = read_rows(stream, fmt)
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            break
+        valid, failed = [], []
+        for line, row in batch:
+            if isinstance(row, str):
+                failed.append((line, row))
+                continue
+            values, errors = _clean(row, lookups)
+            if values['car_id'] in seen:
+                errors.append(f"car_id {values['car_id']} appears more than once in the file")
+            if errors:
+                failed.append((line, "; ".join(errors)))
+                continue
+            seen.add(values['car_id'])
+            valid.append((line, values))
+        taken = {row.car_id for row in Car.query.with_entities(Car.car_id)
+                 .filter(Car.car_id.in_([values['car_id'] for _, values in valid]))} if valid else set()
+        new = []
+        for line, values in valid:
+            if values['car_id'] in taken:
+                failed.append((line, f"Car ID {values['car_id']} is already taken!"))
+            else:
+                new.append(values)
+        # the errors are reported in the order of the lines, whatever check found them
+        for line, message in sorted(failed):
+            report.error(line, message)
+        if new and not dry_run:
+            db.session.execute(Car.__table__.insert(), new)
+            refresh_search_documents(Car.car_id.in_([values['car_id'] for values in new]))
+            db.session.commit()
+        report.inserted += len(new)
+    if report.inserted and not dry_run:
+        page_cache.invalidate()
+    return report
+
+
+def _write(fields, fmt):
+    """Method for getting the function turning a row into a line of the export"""
+    if fmt == 'jsonl':
+        return lambda row: json.dumps(dict(zip(fields, row)), default=str) + "\n"
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def line(row):
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerow(['' if value is None else value for value in row])
+        return buffer.getvalue()
+    return line
+
+
+def export_cars(fmt):
+    """Method for writing the fleet out as CSV or JSON lines. The cars are streamed from a server side cursor in
+    batches, so the memory used does not depend on the size of the fleet.
+
+    Returns
+    ------------------
+    A generator of the lines of the file"""
+
+    names = {model: {row.id: row for row in reference_data.all(model)}
+             for model in (CarCompany, CarModels, CarCategories, City)}
+
+    def name(model, row_id, column):
+        row = names[model].get(row_id)
+        return getattr(row, column) if row else None
+
+    write = _write(CAR_FIELDS, fmt)
+    if fmt == 'csv':
+        yield write(CAR_FIELDS)
+    cars = db.session.query(Car.car_id, Car.company_id, Car.model_id, Car.category_id, Car.color, Car.mileage, Car.ppd,
+                            Car.min_rent, Car.deposit, Car.city_id, Car.status).order_by(Car.id).yield_per(BATCH_SIZE)
+    for car in cars:
+        yield write((car.car_id, name(CarCompany, car.company_id, 'company_name'),
+                     name(CarModels, car.model_id, 'model_name'), name(CarCategories, car.category_id, 'category'),
+                     car.color, car.mileage, car.ppd, car.min_rent, car.deposit, name(City, car.city_id, 'city'),
+                     car.status))
+
+
+def export_bookings(fmt):
+    """Method for writing the booking history out as CSV or JSON lines, streamed the same way as the fleet
+
+    Returns
+    ------------------
+    A generator of the lines of the file"""
+
+    cities = {row.id: row.city for row in reference_data.all(City)}
+    write = _write(BOOKING_FIELDS, fmt)
+    if fmt == 'csv':
+        yield write(BOOKING_FIELDS)
+    bookings = db.session.query(Rented.booking_id, Car.car_id, User.username, Rented.booking_time, Rented.rented_from,
+                                Rented.rented_till, Rented.city_taken_id, Rented.city_delivery_id, Rented.final_status,
+                                Rented.car_taken, Rented.car_delivery, Rented.fine, Rented.fine_paid)\
+        .outerjoin(Car, Car.id == Rented.carID).outerjoin(User, User.id == Rented.user_id)\
+        .order_by(Rented.booking_id).yield_per(BATCH_SIZE)
+    for booking in bookings:
+        row = list(booking)
+        row[6], row[7] = cities.get(booking.city_taken_id), cities.get(booking.city_delivery_id)
+        yield write(row)
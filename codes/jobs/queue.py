@@ -0,0 +1,124 @@
+import datetime
+import json
+import logging
+import time
+import traceback
+from sqlalchemy import and_, or_
+from .. import db
+from ..models import Job
+
+logger = logging.getLogger(__name__)
+
+TASKS = {}
+# A running job whose worker has not finished it within this time is assumed to be lost and is run again
+LOCK_TIMEOUT = datetime.timedelta(minutes=10)
+
+
+class PermanentError(Exception):
+    """Raised by a job which would fail the same way if it was tried again, so it is marked as failed at once"""
+
+
+def task(name):
+    """Decorator for registering a function as a background job which can be enqueued by its name"""
+    def register(func):
+        TASKS[name] = func
+        return func
+    return register
+
+
+def enqueue(name, max_attempts=5, delay=0, **payload):
+    """Method for adding a job to the queue. The job is only flushed, the caller commits it together with the change
+    which asked for it, so that it is run only if that change is saved as well.
+
+    Args
+    ------------------
+    name: It is the name the job function is registered with
+    max_attempts: It is the number of times the job is tried before it is marked as failed
+    delay: It is the number of seconds to wait before running the job
+    payload: They are the JSON serializable keyword arguments passed to the job function
+
+    Returns
+    ------------------
+    The Job row"""
+
+    if name not in TASKS:
+        raise KeyError(f"There is no job named {name}!")
+    job = Job(name=name, payload=json.dumps(payload), max_attempts=max_attempts,
+              run_at=datetime.datetime.utcnow() + datetime.timedelta(seconds=delay))
+    db.session.add(job)
+    db.session.flush()
+    return job
+
+
+def backoff(attempts, base=5, limit=3600):
+    """Method for getting the number of seconds to wait before the next try of a failed job"""
+    return min(base * 2 ** (attempts - 1), limit)
+
+
+def claim():
+    """Method for taking the next due job off the queue. The row is locked with SKIP LOCKED on PostgreSQL so that
+    several workers can poll the same table without running a job twice.
+
+    Returns
+    ------------------
+    The claimed job or None if no job is due"""
+
+    now = datetime.datetime.utcnow()
+    job = Job.query.filter(or_(and_(Job.status == 'queued', Job.run_at <= now),
+                               and_(Job.status == 'running', Job.locked_at < now - LOCK_TIMEOUT)))\
+        .order_by(Job.run_at, Job.id).with_for_update(skip_locked=True).first()
+    if job is None:
+        db.session.rollback()
+        return None
+    job.status = 'running'
+    job.attempts += 1
+    job.locked_at = now
+    db.session.commit()
+    return job
+
+
+def run(job):
+    """Method for running a claimed job and recording its outcome, retrying it later with an exponential backoff if
+    it raises anything but a PermanentError"""
+    job_id, attempts = job.id, job.attempts
+    try:
+        TASKS[job.name](**json.loads(job.payload))
+        db.session.commit()
+    except Exception as error:
+        db.session.rollback()
+        job = Job.query.get(job_id)
+        job.last_error = traceback.format_exc()[-2000:]
+        if attempts >= job.max_attempts or isinstance(error, PermanentError):
+            job.status = 'failed'
+            job.finished = datetime.datetime.utcnow()
+            logger.exception("Job %s (%s) failed for good", job_id, job.name)
+        else:
+            job.status = 'queued'
+            job.run_at = datetime.datetime.utcnow() + datetime.timedelta(seconds=backoff(attempts))
+            logger.warning("Job %s (%s) failed, it will be tried again", job_id, job.name)
+    else:
+        job = Job.query.get(job_id)
+        job.status = 'done'
+        job.finished = datetime.datetime.utcnow()
+    job.locked_at = None
+    db.session.commit()
+
+
+def work(poll_interval=1.0, burst=False):
+    """Method for the worker loop which runs the due jobs one after the other. It needs an app context.
+
+    Args
+    ------------------
+    poll_interval: It is the number of seconds to sleep when the queue is empty
+    burst: It is True if the worker should stop once the queue is empty, e.g. in the tests"""
+
+    from . import tasks  # noqa: F401, registers the jobs
+    while True:
+        job = claim()
+        if job is None:
+            if burst:
+                return
+            time.sleep(poll_interval)
+            continue
+        run(job)
+        db.session.remove()
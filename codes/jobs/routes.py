@@ -0,0 +1,22 @@
+from flask import Blueprint, jsonify
+from flask_login import login_required
+from ..decorators import admin_role_required
+from ..models import Job
+from . import tasks  # noqa: F401, registers the jobs so that they can be enqueued
+
+jobs = Blueprint('jobs', __name__)
+
+
+@jobs.route("/jobs/<int:job_id>")
+@login_required
+@admin_role_required
+def job_status(job_id):
+
+    """Method to get the status of a background job which can only be accessed by the admin.
+    -----------------------------
+    Returns: The job status as JSON"""
+
+    job = Job.query.get_or_404(job_id)
+    return jsonify(id=job.id, name=job.name, status=job.status, attempts=job.attempts,
+                   max_attempts=job.max_attempts, run_at=job.run_at.isoformat(),
+                   finished=job.finished.isoformat() if job.finished else None, last_error=job.last_error)
@@ -0,0 +1,47 @@
+from flask_mail import Message
+from .. import db, mail
+from ..models import User, Rented
+from .. import payments
+from ..uploads import make_variants, UnsupportedUpload
+from ..storage import storage, ID_PROOFS
+from .queue import task, PermanentError
+
+
+@task('send_email')
+def send_email(subject, recipients, body, sender='noreply@demo.com'):
+    """Job for sending an email through the configured SMTP server"""
+    msg = Message(subject, sender=sender, recipients=recipients)
+    msg.body = body
+    mail.send(msg)
+
+
+@task('process_id_proof')
+def process_id_proof(filename):
+    """Job for making the fixed size variants of an id proof uploaded by a user. An image which cannot be decoded
+    fails the job without retrying it."""
+    try:
+        make_variants(filename, storage.directory(ID_PROOFS))
+    except UnsupportedUpload as error:
+        raise PermanentError(str(error)) from error
+
+
+@task('reconcile_fines')
+def reconcile_fines(user_id):
+    """Job for updating whether a user still has a fine to pay after a fine has been paid"""
+    user = User.query.get(user_id)
+    if user is not None:
+        user.fine_pending = Rented.query.filter_by(user_id=user_id).filter(Rented.fine > 0)\
+            .filter(Rented.fine_paid.is_(False)).first() is not None
+        db.session.commit()
+
+
+@task('refund_payment')
+def refund_payment(payment_id):
+    """Job for refunding a payment whose car was booked by someone else before it was confirmed"""
+    payments.refund(payment_id)
+
+
+@task('reconcile_payments')
+def reconcile_payments():
+    """Job for settling the payments still waiting for Stripe"""
+    payments.reconcile()
@@ -0,0 +1,69 @@
+from contextlib import contextmanager
+from sqlalchemy import event
+from sqlalchemy.orm import joinedload
+from . import db
+from .models import Car, Rented, ManifestEntry
+
+# Loader presets for the listing pages. The templates walk the many to one relationships of each row
+# (car.company, order.car.model, order.person ...), so these are joined into the listing query itself and rendering
+# a page costs a fixed number of queries whatever the page size is.
+CAR_DETAILS = (
+    joinedload(Car.company),
+    joinedload(Car.model),
+    joinedload(Car.category),
+    joinedload(Car.city),
+)
+
+BOOKING_DETAILS = (
+    joinedload(Rented.car).options(joinedload(Car.company), joinedload(Car.model), joinedload(Car.category)),
+)
+
+MANIFEST_DETAILS = BOOKING_DETAILS + (
+    joinedload(Rented.person),
+)
+
+MANIFEST_ENTRY_DETAILS = (
+    joinedload(ManifestEntry.booking).options(*MANIFEST_DETAILS),
+)
+
+
+@contextmanager
+def count_queries():
+    """Method for counting the SQL statements sent to the database inside a with block. It yields a list which holds
+    every statement executed so far, so its length is the query count.
+
+    Returns
+    ------------------
+    The list of the executed statements"""
+
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    engine = db.engine
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+
+@contextmanager
+def assert_max_queries(limit):
+    """Method for making sure that the code inside a with block does not send more than a given number of queries,
+    e.g. a test client rendering a listing page.
+
+    Args
+    ------------------
+    limit: It is the maximum number of queries allowed
+
+    Returns
+    ------------------
+    The list of the executed statements or raises an AssertionError when there are more than the limit"""
+
+    with count_queries() as statements:
+        yield statements
+    if len(statements) > limit:
+        raise AssertionError(f"{len(statements)} queries were executed, expected at most {limit}:\n" +
+                             "\n".join(statements))
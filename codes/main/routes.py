@@ -1,11 +1,17 @@
-import datetime
-
 from flask import render_template, url_for, flash, redirect, request, Blueprint
 from flask_login import login_user, current_user, logout_user, login_required
-from .. import db, bcrypt
-from ..models import User, Car, City, CarCompany, CarModels, CarCategories, Temporary, Rented
+from .. import db, search_context
+from ..models import User, Car, City
 from ..main.forms import LoginForm, UpdateAccountForm, ResetPasswordForm, RequestResetForm, ChangePassword, SearchForm
 from ..utils import send_reset_email
+from ..availability import available_cars
+from ..loaders import CAR_DETAILS
+from ..reference import reference_data
+from ..search import search_cars
+from ..page_cache import page_cache
+from ..validations import commit_form
+from ..passwords import passwords
+from ..ratelimit import rate_limiter
 main = Blueprint('main', __name__)
 
 
@@ -17,6 +23,7 @@ def base():
 
 @main.route("/")
 @main.route("/home")
+@page_cache.cached
 def home():
 
     """Method for displaying the home page of the website to any type of user. It detects the user by his role
@@ -28,27 +35,22 @@ def home():
     if current_user.is_authenticated:
         if current_user.is_admin:
             return render_template('home.html')
-        dates = Temporary.query.filter_by(user_id=current_user.id).first()
+        dates = search_context.current()
         if dates:
-            if dates.rent_from < datetime.datetime.today():
+            if dates.expired:
                 flash("Please Enter the dates again!", "info")
                 return redirect(url_for('users.taking_dates'))
         else:
             return redirect(url_for('users.taking_dates'))
-        rented_cars = Rented.query.with_entities(Rented.carID).filter(dates.rent_from <= Rented.rented_till) \
-            .filter(dates.rent_till >= Rented.rented_from).filter(Rented.final_status == "true").all()
-        lst = []
-        for i in rented_cars:
-            lst += i
-        cars = Car.query.filter_by(city_id=current_user.city_id).filter(Car.id.notin_(lst)) \
-            .filter_by(status="true").paginate(page=page, per_page=2)
+        cars = available_cars(current_user.city_id, dates.rent_from, dates.rent_till).options(*CAR_DETAILS)\
+            .paginate(page=page, per_page=2)
         if cars:
             return render_template('home.html', cars=cars, dates=dates)
         else:
             flash("There are no cars available in your city in the asked time!", "info")
             return render_template('layout.html')
     else:
-        cars = Car.query.paginate(page=page, per_page=2)
+        cars = Car.query.options(*CAR_DETAILS).paginate(page=page, per_page=2)
         return render_template('home.html', cars=cars)
 
 
@@ -61,6 +63,7 @@ def about():
 
 
 @main.route("/login", methods=['GET', 'POST'])
+@rate_limiter.limit('login', account_field='email')
 def login():
 
     """Method for logging in to the website for all types of users. If the request method is get, a form is called and
@@ -68,13 +71,15 @@ def login():
     -----------------------------
     Returns: The success message and redirects to home if proper credentials else displays a warning message"""
 
-    form = LoginForm()
-    user = User.query.filter_by(email=form.email.data).first()
     if current_user.is_authenticated:
         return redirect(url_for('main.home'))
+    form = LoginForm()
     if request.method == "POST":
         if form.validate_on_submit():
-            if user and bcrypt.check_password_hash(user.password, form.password.data):
+            user = User.query.filter_by(email=form.email.data).first()
+            if user and passwords.verify(user, form.password.data):
+                # saves the password hashed again if the cost has changed
+                db.session.commit()
                 if user.is_admin:
                     login_user(user, remember=form.remember.data)
                     next_page = request.args.get('next')
@@ -109,17 +114,17 @@ def account():
     ---------------------------
     Returns: Success flash message if the account is updated"""
 
-    cities = City.query.all()
-    current_city = City.query.filter_by(id=current_user.city_id).first()
+    cities = reference_data.all(City)
+    current_city = reference_data.get(City, current_user.city_id)
     form = UpdateAccountForm()
     if form.validate_on_submit():
         current_user.username = form.username.data
         current_user.email = form.email.data
         current_user.name = form.name.data
         current_user.city_id = form.city_id.data
-        db.session.commit()
-        flash('Your account has been updated!', 'success')
-        return redirect(url_for('main.account'))
+        if commit_form(form):
+            flash('Your account has been updated!', 'success')
+            return redirect(url_for('main.account'))
     elif request.method == 'GET':
         form.username.data = current_user.username
         form.email.data = current_user.email
@@ -129,6 +134,7 @@ def account():
 
 
 @main.route("/reset_password", methods=['GET', 'POST'])
+@rate_limiter.limit('reset_request', account_field='mail')
 def reset_request():
 
     """Method for applying for the reset password request. If the request method is get, a form is passed and upon the
@@ -143,6 +149,7 @@ def reset_request():
         if form.validate_on_submit():
             user = User.query.filter_by(email=form.mail.data).first()
             send_reset_email(user)
+            db.session.commit()
             flash('An email has been sent with instructions to reset password!', 'info')
             return redirect(url_for('main.login'))
     return render_template('reset_request.html', title='Reset Password', form=form)
@@ -165,7 +172,7 @@ def reset_token(token):
     form = ResetPasswordForm()
     if request.method == "POST":
         if form.validate_on_submit():
-            hashed_password = bcrypt.generate_password_hash(form.password.data).decode('utf-8')
+            hashed_password = passwords.hash(form.password.data)
             user.password = hashed_password
             db.session.commit()
             flash(f'Your password has been updated successfully!', 'success')
@@ -182,8 +189,8 @@ def change_password():
     Returns: Success message and redirects to the home page"""
     form = ChangePassword()
     if form.validate_on_submit():
-        if bcrypt.check_password_hash(current_user.password, form.form_password.data):
-            hashed_password = bcrypt.generate_password_hash(form.password.data).decode('utf-8')
+        if passwords.check(current_user.password, form.form_password.data):
+            hashed_password = passwords.hash(form.password.data)
             current_user.password = hashed_password
             db.session.commit()
             flash("Your password is updated successfully!", "success")
@@ -197,36 +204,16 @@ def change_password():
 @login_required
 def search():
 
-    """Method for searching the cars according to the word entered by the user.
+    """Method for searching the available cars according to the words entered by the user.
     -----------------------------
     Returns: The list of the cars which are matching with the word entered by the user"""
 
     page = request.args.get('page', 1, type=int)
     form = SearchForm()
-    cars = Car.query.paginate(page=page, per_page=2)
-    dates = Temporary.query.filter_by(user_id=current_user.id).first()
-    rented_cars = Rented.query.with_entities(Rented.carID).filter(dates.rent_from <= Rented.rented_till) \
-        .filter(dates.rent_till >= Rented.rented_from).filter(Rented.final_status == "true").all()
-    lst = []
-    for i in rented_cars:
-        lst += i
+    dates = search_context.current()
+    if dates is None or dates.expired:
+        return redirect(url_for('users.taking_dates'))
+    cars = available_cars(current_user.city_id, dates.rent_from, dates.rent_till).options(*CAR_DETAILS)
     if form.validate_on_submit():
-        searched_cars = form.searched.data
-        record = CarCompany.query.filter(CarCompany.company_name.ilike('%' + searched_cars + '%')).first()
-        if record:
-            cars = Car.query.filter_by(company_id=record.id).filter_by(city_id=current_user.city_id).\
-                filter(Car.id.notin_(lst)).filter_by(status="true").paginate(page=page, per_page=2)
-        record = CarCategories.query.filter(CarCategories.category.ilike('%' + searched_cars + '%')).first()
-        if record:
-            cars = Car.query.filter_by(category_id=record.id).filter_by(city_id=current_user.city_id)\
-                .filter(Car.id.notin_(lst)).filter_by(status="true").paginate(page=page, per_page=2)
-        record = CarModels.query.filter(CarModels.model_name.ilike('%' + searched_cars + '%')).first()
-        if record:
-            cars = Car.query.filter_by(model_id=record.id).filter_by(city_id=current_user.city_id)\
-                .filter(Car.id.notin_(lst)).filter_by(status="true").paginate(page=page, per_page=2)
-        record = City.query.filter(City.city.ilike('%' + searched_cars + '%')).first()
-        if record:
-            cars = Car.query.filter_by(city_id=record.id).filter_by(city_id=current_user.city_id)\
-                .filter(Car.id.notin_(lst)).filter_by(status="true").paginate(page=page, per_page=2)
-        return render_template('home.html', cars=cars, dates=dates)
-    return render_template('home.html', cars=cars, dates=dates)
+        cars = search_cars(cars, form.searched.data)
+    return render_template('home.html', cars=cars.paginate(page=page, per_page=2), dates=dates)
@@ -0,0 +1,118 @@
+import datetime
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import func, literal
+from . import db
+from .models import ManifestEntry, Rented
+
+# The cars to be handed over to the user in the city he takes them from, and the cars to be received back in the city
+# he returns them to
+PICKUP = 'pickup'
+RETURN = 'return'
+
+
+def _day(value):
+    return value.date() if isinstance(value, datetime.datetime) else value
+
+
+def _add(booking, kind, city_id, day):
+    if city_id is None or ManifestEntry.query.filter_by(booking_id=booking.booking_id, kind=kind).first() is not None:
+        return
+    db.session.add(ManifestEntry(city_id=city_id, kind=kind, day=_day(day), till=_day(booking.rented_till),
+                                 booking_id=booking.booking_id))
+
+
+def _remove(booking, kind=None):
+    entries = ManifestEntry.query.filter_by(booking_id=booking.booking_id)
+    if kind is not None:
+        entries = entries.filter_by(kind=kind)
+    entries.delete(synchronize_session=False)
+
+
+def booking_confirmed(booking):
+    """Method for putting a newly confirmed booking on the pickup list of its city. The booking must be flushed."""
+    _add(booking, PICKUP, booking.city_taken_id, booking.rented_from)
+
+
+def booking_cancelled(booking):
+    """Method for taking a cancelled booking off every list"""
+    _remove(booking)
+
+
+def car_taken(booking):
+    """Method for moving a booking from the pickup list of its city to the return list of the city it is returned to.
+    Calling it again for the same booking changes nothing."""
+    _remove(booking, PICKUP)
+    _add(booking, RETURN, booking.city_delivery_id, booking.rented_till)
+
+
+def car_returned(booking):
+    """Method for taking a returned car off the return list"""
+    _remove(booking, RETURN)
+
+
+def entries(city_id, kind, late=False, today=None):
+    """Method for getting the entries of a list of a city. Each list is a single range of the manifest index.
+
+    Args
+    ------------------
+    city_id: It is the id of the city of the admin
+    kind: It is PICKUP or RETURN
+    late: It is True for the entries of the previous days which are still pending, False for the entries of today
+    today: It is the date of today, the current date if not given
+
+    Returns
+    ------------------
+    The query of the ManifestEntry rows"""
+
+    today = today or datetime.date.today()
+    query = ManifestEntry.query.filter_by(city_id=city_id, kind=kind)
+    if not late:
+        return query.filter(ManifestEntry.day == today)
+    query = query.filter(ManifestEntry.day < today)
+    if kind == PICKUP:
+        # a car not taken by the end of its booking is no longer waiting to be picked up
+        query = query.filter(ManifestEntry.till > today)
+    return query
+
+
+def rebuild(city_id=None):
+    """Method for building the manifest again from the bookings, e.g. after bookings were changed outside of the
+    website.
+
+    Args
+    ------------------
+    city_id: It is the id of the city whose lists are built, None for every city
+
+    Returns
+    ------------------
+    The number of entries written"""
+
+    pickups = db.session.query(Rented.city_taken_id, literal(PICKUP), func.date(Rented.rented_from),
+                               func.date(Rented.rented_till), Rented.booking_id)\
+        .filter(Rented.final_status == "true").filter_by(car_taken=False).filter(Rented.city_taken_id.isnot(None))
+    returns = db.session.query(Rented.city_delivery_id, literal(RETURN), func.date(Rented.rented_till),
+                               func.date(Rented.rented_till), Rented.booking_id)\
+        .filter(Rented.final_status == "true").filter_by(car_taken=True).filter_by(car_delivery=False)\
+        .filter(Rented.city_delivery_id.isnot(None))
+    old = ManifestEntry.query
+    if city_id is not None:
+        old = old.filter_by(city_id=city_id)
+        pickups = pickups.filter(Rented.city_taken_id == city_id)
+        returns = returns.filter(Rented.city_delivery_id == city_id)
+    old.delete(synchronize_session=False)
+    columns = ['city_id', 'kind', 'day', 'till', 'booking_id']
+    written = 0
+    for query in (pickups, returns):
+        result = db.session.execute(ManifestEntry.__table__.insert().from_select(columns, query))
+        written += result.rowcount
+    db.session.commit()
+    return written
+
+
+@click.command('rebuild-manifest')
+@click.option('--city', type=int, help='id of the city to rebuild, every city if not given')
+@with_appcontext
+def rebuild_manifest_command(city):
+    """Build the daily pickup and return lists again from the bookings."""
+    click.echo(f"{rebuild(city)} manifest entries written")
@@ -8,8 +8,9 @@ from flask import current_app
 
 @login_manager.user_loader
 def load_user(user_id):
-	"""For loading the user into the website"""
-	return User.query.get(int(user_id))
+	"""For loading the user into the website, from the user cache when it has the user"""
+	from .user_cache import user_cache
+	return user_cache.load(int(user_id))
 
 
 class City(db.Model):
@@ -35,6 +36,7 @@ class User(db.Model, UserMixin):
 	is_admin = db.Column(db.Boolean, default=False)
 	is_super_admin = db.Column(db.Boolean, default=False)
 	fine_pending = db.Column(db.Boolean, default=False)
+	stripe_customer_id = db.Column(db.String(100), nullable=True)
 
 	def get_reset_token(self, expires_sec=1800):
 		s = Serializer(current_app.config['SECRET_KEY'], expires_sec)
@@ -77,6 +79,11 @@ class CarCategories(db.Model):
 class Car(db.Model):
 	"""Class for adding the table cars into the database"""
 	__tablename__ = 'cars'
+	__table_args__ = (
+		db.Index('ix_cars_city_status', 'city_id', 'status'),
+		db.Index('ix_cars_search_text_trgm', 'search_text', postgresql_using='gin',
+				 postgresql_ops={'search_text': 'gin_trgm_ops'}),
+	)
 
 	id = db.Column(db.Integer, primary_key=True)
 	car_id = db.Column(db.String(50), unique=True, nullable=False)
@@ -94,11 +101,23 @@ class Car(db.Model):
 	city = db.relationship("City", backref=backref("cities_cars", uselist=False))
 	deposit = db.Column(db.Integer, nullable=False)
 	status = db.Column(db.String(20), nullable=True, default=True)
+	search_text = db.Column(db.String(300), nullable=True)
 
 
 class Rented(db.Model):
 	"""Class for adding the table rented into the database"""
 	__tablename__ = 'rented'
+	__table_args__ = (
+		db.Index('ix_rented_car_period', 'carID', 'rented_from', 'rented_till',
+				 postgresql_where=db.text("final_status = 'true'"), sqlite_where=db.text("final_status = 'true'")),
+		db.Index('ix_rented_user_booking_time', 'user_id', 'booking_time'),
+		db.Index('ix_rented_taking', 'city_taken_id', 'rented_from',
+				 postgresql_where=db.text("final_status = 'true' AND NOT car_taken"),
+				 sqlite_where=db.text("final_status = 'true' AND car_taken = 0")),
+		db.Index('ix_rented_delivery', 'city_delivery_id', 'rented_till',
+				 postgresql_where=db.text("final_status = 'true' AND car_taken AND NOT car_delivery"),
+				 sqlite_where=db.text("final_status = 'true' AND car_taken = 1 AND car_delivery = 0")),
+	)
 
 	booking_id = db.Column(db.Integer, primary_key=True)
 	carID = db.Column(db.Integer, db.ForeignKey("cars.id", ondelete='SET NULL'), nullable=True)
@@ -122,11 +141,16 @@ class Rented(db.Model):
 	description = db.Column(db.String(200))
 	fine = db.Column(db.Integer, default=0)
 	fine_paid = db.Column(db.Boolean, default=False)
+	payment_intent = db.Column(db.String(100), unique=True, nullable=True)
 
 
 class UserVerification(db.Model):
 	"""Class for adding the table user_verification into the database"""
 	__tablename__ = 'user_verification'
+	__table_args__ = (
+		db.Index('ix_user_verification_pending', 'user_id', postgresql_where=db.text("approval = ''"),
+				 sqlite_where=db.text("approval = ''")),
+	)
 
 	id = db.Column(db.Integer, primary_key=True)
 	user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='SET NULL'), nullable=True)
@@ -149,15 +173,95 @@ class Maintenance(db.Model):
 	person = db.relationship("User", backref=backref("users_maintenance", uselist=False))
 
 
-class Temporary(db.Model):
-	"""Class for adding the table temporary into the database"""
-	__tablename__ = 'temporary'
+class Job(db.Model):
+	"""Class for adding the table jobs into the database, the queue of the background jobs run by the worker"""
+	__tablename__ = 'jobs'
+	__table_args__ = (
+		db.Index('ix_jobs_status_run_at', 'status', 'run_at'),
+	)
+
+	id = db.Column(db.Integer, primary_key=True)
+	name = db.Column(db.String(60), nullable=False)
+	payload = db.Column(db.Text, nullable=False, default='{}')
+	status = db.Column(db.String(20), nullable=False, default='queued')
+	attempts = db.Column(db.Integer, nullable=False, default=0)
+	max_attempts = db.Column(db.Integer, nullable=False, default=5)
+	run_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+	locked_at = db.Column(db.DateTime, nullable=True)
+	last_error = db.Column(db.Text, nullable=True)
+	created = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+	finished = db.Column(db.DateTime, nullable=True)
+
+
+class Reservation(db.Model):
+	"""Class for adding the table reservations into the database, the short-lived holds on a car while its
+	booking is being paid"""
+	__tablename__ = 'reservations'
+	__table_args__ = (
+		db.Index('ix_reservations_car_expires', 'carID', 'expires_at'),
+	)
+
+	id = db.Column(db.Integer, primary_key=True)
+	carID = db.Column(db.Integer, db.ForeignKey("cars.id", ondelete='CASCADE'), nullable=False)
+	car = db.relationship("Car", backref=backref("cars_reservations", uselist=False))
+	user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+	person = db.relationship("User", backref=backref("users_reservations", uselist=False))
+	rented_from = db.Column(db.DateTime, nullable=False)
+	rented_till = db.Column(db.DateTime, nullable=False)
+	city_taken_id = db.Column(db.Integer, db.ForeignKey('cities.id', ondelete='SET NULL'), nullable=True)
+	city_delivery_id = db.Column(db.Integer, db.ForeignKey('cities.id', ondelete='SET NULL'), nullable=True)
+	created = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+	expires_at = db.Column(db.DateTime, nullable=False)
+	status = db.Column(db.String(20), nullable=False, default='held')
+	payment_intent = db.Column(db.String(100), unique=True, nullable=True)
+
+	@property
+	def days(self):
+		return (self.rented_till - self.rented_from).days
+
+	@property
+	def total_amount(self):
+		return (self.days*self.car.ppd) + self.car.deposit
+
+
+class ManifestEntry(db.Model):
+	"""Class for adding the table manifest_entries into the database, the precomputed daily lists of the cars to be
+	taken from and returned to each city"""
+	__tablename__ = 'manifest_entries'
+	__table_args__ = (
+		db.Index('ix_manifest_city_kind_day', 'city_id', 'kind', 'day', 'booking_id'),
+		db.UniqueConstraint('booking_id', 'kind', name='uq_manifest_booking_kind'),
+	)
+
+	id = db.Column(db.Integer, primary_key=True)
+	city_id = db.Column(db.Integer, db.ForeignKey('cities.id', ondelete='CASCADE'), nullable=False)
+	kind = db.Column(db.String(10), nullable=False)
+	day = db.Column(db.Date, nullable=False)
+	till = db.Column(db.Date, nullable=False)
+	booking_id = db.Column(db.Integer, db.ForeignKey('rented.booking_id', ondelete='CASCADE'), nullable=False)
+	booking = db.relationship("Rented", backref=backref("manifest_entries", cascade="all, delete-orphan"))
+
+
+class Payment(db.Model):
+	"""Class for adding the table payments into the database, one row for each attempt to pay for a held car or for a
+	fine"""
+	__tablename__ = 'payments'
+	__table_args__ = (
+		db.Index('ix_payments_target', 'target'),
+		db.Index('ix_payments_status_updated', 'status', 'updated'),
+	)
 
 	id = db.Column(db.Integer, primary_key=True)
 	user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='SET NULL'), nullable=True)
-	person = db.relationship("User", backref=backref("users_temp", uselist=False))
-	booking_time = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
-	rent_from = db.Column(db.DateTime, nullable=False)
-	rent_till = db.Column(db.DateTime, nullable=False)
-	city_id = db.Column(db.Integer, db.ForeignKey('cities.id', ondelete='SET NULL'), nullable=True)
-	city = db.relationship("City", backref=backref("cities_temp", uselist=False))
+	kind = db.Column(db.String(10), nullable=False)
+	target = db.Column(db.String(50), nullable=False)
+	reservation_id = db.Column(db.Integer, db.ForeignKey('reservations.id', ondelete='SET NULL'), nullable=True)
+	booking_id = db.Column(db.Integer, db.ForeignKey('rented.booking_id', ondelete='SET NULL'), nullable=True)
+	amount = db.Column(db.Integer, nullable=False)
+	currency = db.Column(db.String(3), nullable=False, default='inr')
+	idempotency_key = db.Column(db.String(80), unique=True, nullable=False)
+	provider_id = db.Column(db.String(100), unique=True, nullable=True)
+	status = db.Column(db.String(20), nullable=False, default='pending')
+	last_error = db.Column(db.String(500), nullable=True)
+	created = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+	updated = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
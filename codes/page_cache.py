@@ -0,0 +1,96 @@
+import datetime
+import hashlib
+import os
+from functools import wraps
+from flask import request, session, current_app, make_response
+from flask_login import current_user
+from .reference import reference_data
+from .user_cache import MemoryBackend
+from .utils import VersionCounter
+
+
+class PageCache:
+    """Class for keeping the rendered pages which every anonymous visitor sees the same, i.e. the listing of the home
+    page and view_car. A page is kept under its url and the version of the fleet together with the version of the
+    reference tables, whose names are shown on it. The routes changing the cars bump the fleet version, which every
+    worker reads from a shared file, so a stale page is never served. The pages carry an ETag made of the same
+    versions, so a browser revalidating gets a 304 without the page being rendered or even looked up."""
+
+    def __init__(self, app=None):
+        self.counter = None
+        self.backend = None
+        self.enabled = False
+        self.ttl = 300
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Method for setting up the shared fleet version counter and the cache from the app config"""
+        path = app.config.get('FLEET_VERSION_FILE') or os.path.join(app.instance_path, 'fleet.version')
+        self.counter = VersionCounter(path)
+        self.enabled = app.config.get('PAGE_CACHE_ENABLED', True)
+        self.ttl = app.config.get('PAGE_CACHE_TTL', 300)
+        self.backend = MemoryBackend(app.config.get('PAGE_CACHE_SIZE', 1000))
+        app.extensions['page_cache'] = self
+
+    def version(self):
+        """Method for getting the version the cached pages depend on, of the fleet and of the reference tables"""
+        return f"{self.counter.read()}.{reference_data.counter.read()}"
+
+    def last_modified(self):
+        """Method for getting the time of the last change of the fleet or of the reference tables
+
+        Returns
+        ------------------
+        The datetime of the last change or None if nothing has changed since the version files were made"""
+
+        times = [os.path.getmtime(path) for path in (self.counter.path, reference_data.counter.path)
+                 if os.path.exists(path)]
+        return datetime.datetime.utcfromtimestamp(int(max(times))) if times else None
+
+    def invalidate(self):
+        """Method to be called after a car has been added, changed or removed so that every worker renders the pages
+        again"""
+        self.counter.bump()
+
+    def _cacheable(self):
+        # a pending flash message is rendered into the page, any other argument than the page would fill the cache
+        return self.enabled and request.method == 'GET' and not current_user.is_authenticated \
+            and not session.get('_flashes') and set(request.args) <= {'page'}
+
+    def _finish(self, response, etag, modified):
+        response.set_etag(etag)
+        if modified is not None:
+            response.last_modified = modified
+        response.cache_control.no_cache = True
+        response.vary.add('Cookie')
+        return response.make_conditional(request)
+
+    def cached(self, view):
+        """Decorator for a view whose page is the same for every anonymous visitor. Logged in users, pages showing a
+        flash message and answers other than 200 go through the view untouched."""
+
+        @wraps(view)
+        def decorated(*args, **kwargs):
+            if not self._cacheable():
+                return view(*args, **kwargs)
+            version = self.version()
+            key = f"{request.path}?page={request.args.get('page', 1, type=int)}@{version}"
+            etag = hashlib.sha1(key.encode()).hexdigest()[:20]
+            if request.if_none_match.contains(etag):
+                return self._finish(current_app.response_class(status=304), etag, self.last_modified())
+            entry = self.backend.get(key)
+            if entry is None:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200 or session.get('_flashes'):
+                    return response
+                entry = dict(body=response.get_data(), mimetype=response.mimetype,
+                             modified=self.last_modified() or datetime.datetime.utcnow().replace(microsecond=0))
+                self.backend.set(key, entry, self.ttl)
+            response = current_app.response_class(entry['body'], mimetype=entry['mimetype'])
+            return self._finish(response, etag, entry['modified'])
+
+        return decorated
+
+
+page_cache = PageCache()
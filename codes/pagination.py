@@ -0,0 +1,113 @@
+import datetime
+from flask import current_app
+from itsdangerous import URLSafeSerializer, BadSignature
+from sqlalchemy import tuple_
+from . import db
+
+
+class KeysetPage:
+    """Class for a page of rows fetched by keyset pagination. Instead of a page number it carries opaque tokens of the
+    first and the last row, so fetching the next or the previous page is an index seek from that row and costs the
+    same whatever page the user is on."""
+
+    def __init__(self, items, next_token=None, prev_token=None, total=None):
+        self.items = items
+        self.next_token = next_token
+        self.prev_token = prev_token
+        self.total = total
+
+    @property
+    def has_next(self):
+        return self.next_token is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_token is not None
+
+
+def _serializer():
+    return URLSafeSerializer(current_app.config['SECRET_KEY'], salt='keyset-cursor')
+
+
+def _encode(value):
+    if isinstance(value, datetime.datetime):
+        return {'dt': value.isoformat()}
+    if isinstance(value, datetime.date):
+        return {'d': value.isoformat()}
+    return value
+
+
+def _decode(value):
+    if isinstance(value, dict):
+        if 'd' in value:
+            return datetime.date.fromisoformat(value['d'])
+        return datetime.datetime.fromisoformat(value['dt'])
+    return value
+
+
+def _token(row, columns, direction):
+    """Method for making the opaque token which points just after (next) or just before (prev) a row"""
+    return _serializer().dumps({'k': [_encode(getattr(row, column.key)) for column in columns], 'd': direction})
+
+
+def estimate_count(query):
+    """Method for getting the planner estimate of the number of rows of a query on PostgreSQL, which is read from
+    EXPLAIN instead of running a COUNT(*) over the table.
+
+    Returns
+    ------------------
+    The estimated number of rows or None on the other databases"""
+
+    connection = db.session.connection()
+    if connection.dialect.name != 'postgresql':
+        return None
+    compiled = query.statement.compile(dialect=connection.dialect)
+    plan = connection.exec_driver_sql('EXPLAIN (FORMAT JSON) ' + str(compiled), compiled.params).scalar()
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def keyset_paginate(query, columns, cursor=None, per_page=5, descending=False, with_total=False):
+    """Method for fetching a page of a query ordered by a unique key, e.g. (booking_time, booking_id).
+
+    Args
+    ------------------
+    query: It is the filtered query of the rows to be listed
+    columns: It is the tuple of the columns ordering the rows, the last one has to be unique
+    cursor: It is the next or prev token of the page the user comes from, None for the first page
+    per_page: It is the number of rows on a page
+    descending: It is True if the rows are listed from the highest key to the lowest
+    with_total: It is True if an estimate of the total number of rows is needed
+
+    Returns
+    ------------------
+    The KeysetPage of the rows"""
+
+    direction, values = 'next', None
+    if cursor:
+        try:
+            data = _serializer().loads(cursor)
+            direction, values = data['d'], [_decode(value) for value in data['k']]
+        except (BadSignature, KeyError, TypeError, ValueError):
+            direction, values = 'next', None
+    backwards = (direction == 'prev') != descending
+    key = tuple_(*columns)
+    page = query
+    if values is not None:
+        page = page.filter(key < tuple_(*values) if backwards else key > tuple_(*values))
+    page = page.order_by(*[column.desc() if backwards else column.asc() for column in columns])
+    rows = page.limit(per_page + 1).all()
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if direction == 'prev':
+        rows.reverse()
+        rows_after, rows_before = values is not None, has_more
+    else:
+        rows_after, rows_before = has_more, values is not None
+    next_token = prev_token = None
+    if rows:
+        if rows_after:
+            next_token = _token(rows[-1], columns, 'next')
+        if rows_before:
+            prev_token = _token(rows[0], columns, 'prev')
+    total = estimate_count(query) if with_total else None
+    return KeysetPage(rows, next_token, prev_token, total)
@@ -0,0 +1,130 @@
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+import bcrypt
+
+# The cost of bcrypt used when BCRYPT_LOG_ROUNDS is not set, each round more doubles the time of a hash
+DEFAULT_ROUNDS = 12
+
+
+class PasswordServiceBusy(Exception):
+    """Raised when every slot of the hashing pool stays taken, or the pool does not answer, for longer than
+    PASSWORD_HASH_TIMEOUT"""
+
+
+def _hash(password, rounds):
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds)).decode('utf-8')
+
+
+def _check(hashed, password):
+    try:
+        return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
+    except ValueError:
+        # not a bcrypt hash
+        return False
+
+
+def rounds_of(hashed):
+    """Method for reading the cost a bcrypt hash was made with, $2b$<rounds>$<salt and hash>"""
+    try:
+        return int(hashed.split('$')[2])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+
+class PasswordHasher:
+    """Class for hashing and checking the passwords. A bcrypt hash costs tens of milliseconds of CPU on purpose, so
+    instead of running in the request worker it runs in a small pool of processes of its own; a worker waits for the
+    answer without holding the CPU and the number of hashes waiting for the pool is bounded, so a burst of logins is
+    refused with PasswordServiceBusy instead of piling up. With PASSWORD_HASH_WORKERS set to 0 the hashes run inline.
+    The cost is BCRYPT_LOG_ROUNDS, and a password checked on login against a hash of another cost is hashed again."""
+
+    def __init__(self, app=None):
+        self.rounds = DEFAULT_ROUNDS
+        self.workers = 0
+        self.timeout = 10
+        self._pool = None
+        self._pid = None
+        self._slots = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Method for reading the cost and the size of the pool from the app config. The pool itself is only started by
+        the first hash of each process, so the gunicorn workers forked from a preloaded app each get their own."""
+        self.rounds = int(app.config.get('BCRYPT_LOG_ROUNDS') or DEFAULT_ROUNDS)
+        self.workers = int(app.config.get('PASSWORD_HASH_WORKERS') or 0)
+        self.timeout = float(app.config.get('PASSWORD_HASH_TIMEOUT') or 10)
+        self._pool = None
+        self._pid = None
+        app.extensions['passwords'] = self
+
+    def _executor(self):
+        with self._lock:
+            if self._pool is None or self._pid != os.getpid():
+                self._pool = ProcessPoolExecutor(max_workers=self.workers)
+                self._pid = os.getpid()
+                # as many hashes may wait for the pool as it runs at once
+                self._slots = threading.BoundedSemaphore(self.workers * 2)
+            return self._pool, self._slots
+
+    def _run(self, function, *args):
+        if not self.workers:
+            return function(*args)
+        pool, slots = self._executor()
+        if not slots.acquire(timeout=self.timeout):
+            raise PasswordServiceBusy()
+        future = pool.submit(function, *args)
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeout:
+            future.cancel()
+            raise PasswordServiceBusy() from None
+        finally:
+            slots.release()
+
+    def hash(self, password):
+        """Method for hashing a password with the configured cost
+
+        Returns
+        ------------------
+        The hash as a string"""
+
+        return self._run(_hash, password, self.rounds)
+
+    def check(self, hashed, password):
+        """Method for checking a password against its hash
+
+        Returns
+        ------------------
+        True if the password is right"""
+
+        return bool(hashed) and self._run(_check, hashed, password)
+
+    def needs_rehash(self, hashed):
+        """Method for telling if a hash was made with another cost than the configured one"""
+        return rounds_of(hashed) != self.rounds
+
+    def verify(self, user, password):
+        """Method for checking the password of a user on login. A right password whose hash was made with another cost
+        is hashed again with the configured one, to be saved with the next commit, so raising or lowering the cost
+        takes effect as the users log in.
+
+        Args
+        ------------------
+        user: It is the User logging in
+        password: It is the password he entered
+
+        Returns
+        ------------------
+        True if the password is right"""
+
+        if not self.check(user.password, password):
+            return False
+        if self.needs_rehash(user.password):
+            user.password = self.hash(password)
+        return True
+
+
+passwords = PasswordHasher()
@@ -0,0 +1,279 @@
+import calendar
+import datetime
+import click
+import stripe
+from flask.cli import with_appcontext
+from sqlalchemy.exc import IntegrityError
+from . import db
+from .jobs.queue import enqueue
+from .models import Payment, Rented
+from .reservations import confirm_reservation, ReservationError
+
+BOOKING = 'booking'
+FINE = 'fine'
+CURRENCY = 'inr'
+# The statuses of a PaymentIntent which are not final yet, the webhook or the reconciliation settles them later
+PENDING_STATUSES = ('processing', 'requires_action', 'requires_confirmation', 'requires_capture')
+# Stripe forgets an idempotency key after 24 hours, so a payment Stripe never heard of is given up after that
+GIVE_UP_AFTER = datetime.timedelta(hours=24)
+
+
+class PaymentError(Exception):
+    """Raised when a payment is declined"""
+
+
+def _status(intent_status):
+    if intent_status == 'succeeded':
+        return 'succeeded'
+    if intent_status in PENDING_STATUSES:
+        return 'pending'
+    return 'failed'
+
+
+def _start(user_id, kind, target, amount, reservation_id=None, booking_id=None):
+    """Method for getting the payment of a held car or of a fine. A payment which is not failed is reused, so paying
+    twice for the same thing sends the same idempotency key to Stripe and never charges the card twice."""
+    payment = Payment.query.filter_by(target=target).order_by(Payment.id.desc()).first()
+    if payment is not None and payment.status != 'failed':
+        return payment
+    # the key follows the failed payment read above, so two requests retrying it both try to insert the same key
+    attempt = 1 if payment is None else int(payment.idempotency_key.rsplit(':', 1)[1]) + 1
+    key = f"{target}:{attempt}"
+    payment = Payment(user_id=user_id, kind=kind, target=target, amount=amount, currency=CURRENCY,
+                      idempotency_key=key, reservation_id=reservation_id, booking_id=booking_id)
+    db.session.add(payment)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # a second click of the same pay button got here first
+        db.session.rollback()
+        payment = Payment.query.filter_by(idempotency_key=key).one()
+    return payment
+
+
+def _next_attempt(payment):
+    """Method for giving up a pending payment Stripe never heard of and starting the next attempt of the same target,
+    which gets an idempotency key of its own"""
+    payment.status = 'failed'
+    payment.last_error = "Stripe has no payment for it"
+    db.session.commit()
+    return _start(payment.user_id, payment.kind, payment.target, payment.amount, payment.reservation_id,
+                  payment.booking_id)
+
+
+def _intents_since(created):
+    """Method for listing the PaymentIntents created since a time, a hundred per call
+
+    Returns
+    ------------------
+    The dictionary of the PaymentIntents by the payment id kept in their metadata"""
+
+    since = calendar.timegm((created - datetime.timedelta(minutes=5)).timetuple())
+    intents = {}
+    for intent in stripe.PaymentIntent.list(created={'gte': since}, limit=100).auto_paging_iter():
+        payment_id = (intent.get('metadata') or {}).get('payment_id')
+        if payment_id:
+            intents[int(payment_id)] = intent
+    return intents
+
+
+def _customer_id(user):
+    """Method for getting the Stripe customer of a user, which is only created on his first payment"""
+    if user.stripe_customer_id is None:
+        customer = stripe.Customer.create(email=user.email, metadata={'user_id': user.id},
+                                          idempotency_key=f"customer:{user.id}")
+        user.stripe_customer_id = customer.id
+        db.session.commit()
+    return user.stripe_customer_id
+
+
+def _charge(payment, user, token, description):
+    """Method for charging the card of a payment in a single PaymentIntent call which creates and confirms it. A pending
+    payment whose last call failed is looked up on Stripe by its payment id first: the card is not charged again if
+    Stripe made the payment, and the next attempt is started if it did not, as the new card token would not match the
+    parameters the idempotency key was first sent with.
+
+    Returns
+    ------------------
+    The payment, pending if Stripe could not be reached, or raises a PaymentError if the card is declined"""
+
+    if payment.status == 'succeeded':
+        return payment
+    try:
+        intent = None
+        if payment.provider_id:
+            intent = stripe.PaymentIntent.retrieve(payment.provider_id)
+        elif payment.last_error:
+            intent = _intents_since(payment.created).get(payment.id)
+            if intent is None:
+                payment = _next_attempt(payment)
+        if intent is None:
+            intent = stripe.PaymentIntent.create(
+                amount=payment.amount,
+                currency=payment.currency,
+                customer=_customer_id(user),
+                payment_method_data={'type': 'card', 'card': {'token': token}},
+                confirm=True,
+                description=description,
+                metadata={'payment_id': payment.id},
+                idempotency_key=payment.idempotency_key
+            )
+    except stripe.error.CardError as error:
+        payment.status = 'failed'
+        payment.last_error = (error.user_message or str(error))[:500]
+        db.session.commit()
+        raise PaymentError(error.user_message or "Your card has been declined!")
+    except stripe.error.StripeError as error:
+        # the payment may or may not have been made, the webhook or the reconciliation will tell
+        payment.last_error = str(error)[:500]
+        db.session.commit()
+        return payment
+    return apply_intent(payment, intent)
+
+
+def _fulfil(payment):
+    """Method for giving the user what he paid for once the payment has succeeded"""
+    if payment.kind == FINE:
+        # the fine is marked as paid by apply_intent, which enqueues the bookkeeping in the same commit
+        return
+    try:
+        booking = confirm_reservation(payment.reservation_id, payment.user_id, payment.provider_id)
+    except ReservationError as error:
+        payment.status = 'refunding'
+        payment.last_error = str(error)
+        enqueue('refund_payment', payment_id=payment.id)
+        db.session.commit()
+        return
+    payment.booking_id = booking.booking_id
+    db.session.commit()
+
+
+def apply_intent(payment, intent):
+    """Method for recording the state of the PaymentIntent of a payment. It is called for the answer of the charge, for
+    the webhooks and for the reconciliation, in any order and any number of times; the row of the payment is locked
+    so that the booking or the fine is only fulfilled by the first of them.
+
+    Args
+    ------------------
+    payment: It is the Payment
+    intent: It is the PaymentIntent as returned by Stripe
+
+    Returns
+    ------------------
+    The updated payment"""
+
+    payment = Payment.query.filter_by(id=payment.id).with_for_update().populate_existing().first()
+    payment.provider_id = intent['id']
+    status = _status(intent['status'])
+    if payment.status != 'pending' or status == 'pending':
+        db.session.commit()
+        return payment
+    payment.status = status
+    if status == 'succeeded' and payment.kind == FINE:
+        Rented.query.filter_by(booking_id=payment.booking_id).update({'fine_paid': True})
+        enqueue('reconcile_fines', user_id=payment.user_id)
+    db.session.commit()
+    if status == 'succeeded':
+        _fulfil(payment)
+    return payment
+
+
+def pay_for_hold(hold, user, token):
+    """Method for paying for a car held for a user and booking it once the payment succeeds. The amount is worked out
+    from the hold, never taken from the request.
+
+    Args
+    ------------------
+    hold: It is the Reservation being paid for
+    user: It is the user paying
+    token: It is the card token given by Stripe Checkout
+
+    Returns
+    ------------------
+    The Payment or raises a PaymentError"""
+
+    payment = _start(user.id, BOOKING, f"hold:{hold.id}", hold.total_amount * 100, reservation_id=hold.id)
+    return _charge(payment, user, token, 'Rent Car')
+
+
+def pay_for_fine(booking, user, token):
+    """Method for paying the fine of a booking, which is marked as paid once the payment succeeds
+
+    Args
+    ------------------
+    booking: It is the Rented booking whose fine is paid
+    user: It is the user paying
+    token: It is the card token given by Stripe Checkout
+
+    Returns
+    ------------------
+    The Payment or raises a PaymentError"""
+
+    payment = _start(user.id, FINE, f"fine:{booking.booking_id}", booking.fine * 100, booking_id=booking.booking_id)
+    return _charge(payment, user, token, 'Pay Fine')
+
+
+def handle_event(event):
+    """Method for handling a webhook event of Stripe about a PaymentIntent
+
+    Returns
+    ------------------
+    True if the event was about a payment made on the website"""
+
+    if not event['type'].startswith('payment_intent.'):
+        return False
+    intent = event['data']['object']
+    payment = Payment.query.filter_by(provider_id=intent['id']).first()
+    payment_id = (intent.get('metadata') or {}).get('payment_id')
+    if payment is None and payment_id:
+        payment = Payment.query.get(int(payment_id))
+    if payment is None:
+        return False
+    apply_intent(payment, intent)
+    return True
+
+
+def refund(payment_id):
+    """Method for refunding a payment whose booking could not be made"""
+    payment = Payment.query.get(payment_id)
+    if payment is None or payment.status != 'refunding':
+        return
+    stripe.Refund.create(payment_intent=payment.provider_id, idempotency_key=f"refund:{payment.id}")
+    payment.status = 'refunded'
+    db.session.commit()
+
+
+def reconcile(now=None):
+    """Method for comparing the pending payments with Stripe in a batch. The PaymentIntents created since the oldest
+    pending payment are listed a hundred per call and matched by the payment id kept in their metadata, the payments
+    Stripe never heard of are given up after GIVE_UP_AFTER, and the paid bookings which were not made are made.
+
+    Returns
+    ------------------
+    The number of payments whose state changed"""
+
+    now = now or datetime.datetime.utcnow()
+    changed = 0
+    pending = Payment.query.filter_by(status='pending').order_by(Payment.created).all()
+    if pending:
+        intents = _intents_since(pending[0].created)
+        for payment in pending:
+            intent = intents.get(payment.id)
+            if intent is not None:
+                changed += apply_intent(payment, intent).status != 'pending'
+            elif payment.created < now - GIVE_UP_AFTER:
+                payment.status = 'failed'
+                payment.last_error = "Stripe has no payment for it"
+                db.session.commit()
+                changed += 1
+    for payment in Payment.query.filter_by(status='succeeded', kind=BOOKING, booking_id=None).all():
+        _fulfil(payment)
+        changed += 1
+    return changed
+
+
+@click.command('reconcile-payments')
+@with_appcontext
+def reconcile_payments_command():
+    """Compare the pending payments with Stripe and settle them."""
+    click.echo(f"{reconcile()} payments settled")
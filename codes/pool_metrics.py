@@ -0,0 +1,86 @@
+import threading
+import time
+from sqlalchemy.exc import TimeoutError as PoolTimeout
+from sqlalchemy.pool import QueuePool
+
+# A checkout waiting longer than this is counted as a sign that the pool is too small for the load
+SLOW_CHECKOUT = 0.05
+
+
+class PoolStats:
+    """Class for the counters of the connection checkouts of the pools of a worker process"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.checkouts = 0
+            self.slow_checkouts = 0
+            self.timeouts = 0
+            self.total_wait = 0.0
+            self.max_wait = 0.0
+            self.max_checked_out = 0
+
+    def record(self, wait, checked_out, timed_out=False):
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+            else:
+                self.checkouts += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+            if wait > SLOW_CHECKOUT:
+                self.slow_checkouts += 1
+            self.max_checked_out = max(self.max_checked_out, checked_out)
+
+
+stats = PoolStats()
+_pools = []
+
+
+class InstrumentedQueuePool(QueuePool):
+    """Class for a QueuePool which records how long each checkout waits for a free connection, and how many
+    connections are in use when it gets one. It is chosen with the poolclass engine option."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        _pools.append(self)
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except PoolTimeout:
+            stats.record(time.perf_counter() - start, self.checkedout(), timed_out=True)
+            raise
+        stats.record(time.perf_counter() - start, self.checkedout())
+        return connection
+
+    def recreate(self):
+        pool = super().recreate()
+        if self in _pools:
+            _pools.remove(self)
+        return pool
+
+
+def _pool_state(pool):
+    limit = pool.size() + max(pool._max_overflow, 0)
+    return dict(size=pool.size(), max_overflow=pool._max_overflow, checked_out=pool.checkedout(),
+                overflow=pool.overflow(), saturation=round(pool.checkedout() / limit, 3) if limit else None)
+
+
+def report():
+    """Method for getting the pool metrics of this worker process, to size the workers against max_connections
+
+    Returns
+    ------------------
+    The dictionary of the checkout counters and of the current use of each pool"""
+
+    with stats._lock:
+        waits = stats.checkouts + stats.timeouts
+        return dict(checkouts=stats.checkouts, timeouts=stats.timeouts, slow_checkouts=stats.slow_checkouts,
+                    mean_wait_ms=round(stats.total_wait * 1000 / waits, 3) if waits else 0.0,
+                    max_wait_ms=round(stats.max_wait * 1000, 3), max_checked_out=stats.max_checked_out,
+                    pools=[_pool_state(pool) for pool in _pools])
@@ -0,0 +1,209 @@
+import random
+import re
+import threading
+import time
+import zlib
+from flask import request, before_render_template, template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Literals which are replaced so that the same statement with other values has the same fingerprint
+_NUMBER = re.compile(r"\b\d+(\.\d+)?\b")
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_IN_LIST = re.compile(r"\bIN \((?:[^()]|\([^()]*\))+\)", re.IGNORECASE)
+_SPACES = re.compile(r"\s+")
+
+
+def fingerprint(statement):
+    """Method for getting the fingerprint of a statement, which is the statement with its literals and the lists of
+    an IN replaced, so that the same query sent with other values is counted as one
+
+    Returns
+    ------------------
+    The fingerprint as a short hex string and the normalized statement"""
+
+    normalized = _SPACES.sub(' ', statement).strip()
+    normalized = _IN_LIST.sub('IN (?)', _NUMBER.sub('?', _STRING.sub('?', normalized)))
+    return f"{zlib.crc32(normalized.encode()):08x}", normalized
+
+
+def parameter_shape(parameters):
+    """Method for describing the bound parameters of a statement by their names and types only, so that no values
+    such as password hashes end up in the profile"""
+    if isinstance(parameters, dict):
+        return {key: type(value).__name__ for key, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        if parameters and isinstance(parameters[0], (dict, list, tuple)):
+            return [f"{len(parameters)} rows"]
+        return [type(value).__name__ for value in parameters]
+    return None
+
+
+class RequestProfile:
+    """Class for the measurements of one sampled request"""
+
+    __slots__ = ('start', 'queries', 'db_time', 'template_time', 'template_start', 'statements')
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.template_start = None
+        self.statements = []
+
+
+class EndpointStats:
+    """Class for the totals of the sampled requests of one endpoint"""
+
+    def __init__(self):
+        self.requests = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.queries = 0
+        self.max_queries = 0
+        self.statements = {}
+
+    def add(self, profile, elapsed, keep):
+        self.requests += 1
+        self.total_time += elapsed
+        self.max_time = max(self.max_time, elapsed)
+        self.db_time += profile.db_time
+        self.template_time += profile.template_time
+        self.queries += profile.queries
+        self.max_queries = max(self.max_queries, profile.queries)
+        for statement, parameters, duration in profile.statements:
+            key, normalized = fingerprint(statement)
+            stats = self.statements.get(key)
+            if stats is None:
+                if len(self.statements) >= keep * 4:
+                    self._trim(keep)
+                stats = self.statements[key] = dict(fingerprint=key, statement=normalized[:1000], calls=0,
+                                                    total_ms=0.0, max_ms=0.0, parameters=None)
+            stats['calls'] += 1
+            stats['total_ms'] += duration * 1000
+            if duration * 1000 >= stats['max_ms']:
+                stats['max_ms'] = duration * 1000
+                stats['parameters'] = parameter_shape(parameters)
+
+    def _trim(self, keep):
+        slowest = sorted(self.statements.values(), key=lambda stats: stats['total_ms'], reverse=True)[:keep]
+        self.statements = {stats['fingerprint']: stats for stats in slowest}
+
+    def to_dict(self, keep):
+        def ms(seconds):
+            return round(seconds * 1000 / self.requests, 3)
+        slowest = sorted(self.statements.values(), key=lambda stats: stats['max_ms'], reverse=True)[:keep]
+        return dict(requests=self.requests, mean_ms=ms(self.total_time), max_ms=round(self.max_time * 1000, 3),
+                    mean_db_ms=ms(self.db_time), mean_template_ms=ms(self.template_time),
+                    mean_queries=round(self.queries / self.requests, 2), max_queries=self.max_queries,
+                    slowest_statements=[dict(stats, total_ms=round(stats['total_ms'], 3),
+                                             max_ms=round(stats['max_ms'], 3)) for stats in slowest])
+
+
+class Profiler:
+    """Class for measuring what each endpoint costs: the number of queries, the time spent in the database and in
+    rendering templates, and its slowest statements. Only a sample of the requests is measured when
+    PROFILER_SAMPLE_RATE is below 1, and nothing is hooked at all when PROFILER_ENABLED is off. The totals are kept
+    per worker process and sent back to the browser of each sampled request in a Server-Timing header."""
+
+    def __init__(self, app=None):
+        self.enabled = False
+        self.sample_rate = 1.0
+        self.keep = 10
+        self._endpoints = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Method for hooking the profiler into the app and the database engines if PROFILER_ENABLED is set"""
+        self.enabled = bool(app.config.get('PROFILER_ENABLED'))
+        self.sample_rate = float(app.config.get('PROFILER_SAMPLE_RATE') or 1.0)
+        self.keep = int(app.config.get('PROFILER_SLOWEST') or 10)
+        app.extensions['profiler'] = self
+        if not self.enabled:
+            return
+        if not getattr(self, '_hooked', False):
+            event.listen(Engine, 'before_cursor_execute', self._before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', self._after_cursor_execute)
+            self._hooked = True
+        before_render_template.connect(self._before_render, app)
+        template_rendered.connect(self._after_render, app)
+        app.before_request(self._start)
+        app.after_request(self._finish)
+        app.teardown_request(self._discard)
+
+    @property
+    def current(self):
+        return getattr(self._local, 'profile', None)
+
+    def _start(self):
+        if self.sample_rate >= 1.0 or random.random() < self.sample_rate:
+            self._local.profile = RequestProfile()
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if self.current is not None:
+            conn.info.setdefault('profiler_start', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        profile = self.current
+        if profile is None or not conn.info.get('profiler_start'):
+            return
+        duration = time.perf_counter() - conn.info['profiler_start'].pop()
+        profile.queries += 1
+        profile.db_time += duration
+        profile.statements.append((statement, parameters, duration))
+
+    def _before_render(self, sender, template, context, **extra):
+        profile = self.current
+        if profile is not None:
+            profile.template_start = time.perf_counter()
+
+    def _after_render(self, sender, template, context, **extra):
+        profile = self.current
+        if profile is not None and profile.template_start is not None:
+            profile.template_time += time.perf_counter() - profile.template_start
+            profile.template_start = None
+
+    def _finish(self, response):
+        profile = self.current
+        if profile is None:
+            return response
+        self._local.profile = None
+        elapsed = time.perf_counter() - profile.start
+        endpoint = request.endpoint or 'unknown'
+        with self._lock:
+            stats = self._endpoints.get(endpoint)
+            if stats is None:
+                stats = self._endpoints[endpoint] = EndpointStats()
+            stats.add(profile, elapsed, self.keep)
+        response.headers.add('Server-Timing', f'db;dur={profile.db_time * 1000:.2f};desc="{profile.queries} queries"')
+        response.headers.add('Server-Timing', f'tpl;dur={profile.template_time * 1000:.2f}')
+        response.headers.add('Server-Timing', f'total;dur={elapsed * 1000:.2f}')
+        return response
+
+    def _discard(self, exc=None):
+        self._local.profile = None
+
+    def report(self):
+        """Method for getting the totals of each endpoint measured by this worker
+
+        Returns
+        ------------------
+        The dictionary of the stats of each endpoint, the slowest endpoints first"""
+
+        with self._lock:
+            stats = {endpoint: stats.to_dict(self.keep) for endpoint, stats in self._endpoints.items()}
+        return dict(sorted(stats.items(), key=lambda item: item[1]['mean_ms'], reverse=True))
+
+    def reset(self):
+        """Method for clearing the totals"""
+        with self._lock:
+            self._endpoints = {}
+
+
+profiler = Profiler()
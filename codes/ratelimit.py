@@ -0,0 +1,176 @@
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from flask import request
+
+# The limits used when they are not set in the config, as "<attempts>/<seconds>". A bucket holds up to <attempts>
+# tokens and gets them back at <attempts> per <seconds>; each attempt takes one token.
+DEFAULT_LIMITS = {
+    'login': dict(ip='20/60', account='10/600', all='50/1'),
+    'reset_request': dict(ip='5/600', account='3/3600', all='10/1'),
+}
+# Takes a token from a bucket kept in a Redis hash and answers how many seconds to wait if there was none
+TOKEN_BUCKET_SCRIPT = """
+local rate, burst, now = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'at')
+local tokens = tonumber(state[1]) or burst
+local at = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - at) * rate)
+local wait = 0
+if tokens >= 1 then tokens = tokens - 1 else wait = (1 - tokens) / rate end
+redis.call('HMSET', KEYS[1], 'tokens', tostring(tokens), 'at', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return tostring(wait)
+"""
+
+
+class RateLimited(Exception):
+    """Raised when a bucket of a request is empty, with the number of seconds to wait"""
+
+    def __init__(self, retry_after):
+        super().__init__(retry_after)
+        self.retry_after = retry_after
+
+
+def parse_limit(value):
+    """Method for reading a limit written as "<attempts>/<seconds>"
+
+    Returns
+    ------------------
+    The rate in tokens per second and the size of the bucket"""
+
+    attempts, seconds = value.split('/')
+    return float(attempts) / float(seconds), float(attempts)
+
+
+class MemoryBackend:
+    """Class for token buckets kept in the worker process. The least recently used buckets are dropped past max_size,
+    which only lets their next attempt start with a full bucket."""
+
+    def __init__(self, max_size=100000):
+        self.max_size = max_size
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key, rate, burst, now):
+        with self._lock:
+            tokens, at = self._buckets.get(key, (burst, now))
+            tokens = min(burst, tokens + max(0.0, now - at) * rate)
+            wait = 0.0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / rate
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_size:
+                self._buckets.popitem(last=False)
+            return wait
+
+
+class RedisBackend:
+    """Class for token buckets shared by all the workers on any server speaking the Redis protocol. Each attempt is a
+    single round trip running TOKEN_BUCKET_SCRIPT. A client object with the same eval method can be passed in place of
+    the url."""
+
+    def __init__(self, url=None, client=None, prefix='ratelimit:'):
+        if client is None:
+            import redis
+            client = redis.Redis.from_url(url)
+        self.client = client
+        self.prefix = prefix
+
+    def take(self, key, rate, burst, now):
+        return float(self.client.eval(TOKEN_BUCKET_SCRIPT, 1, self.prefix + key, rate, burst, now))
+
+
+class RateLimiter:
+    """Class for throttling the routes which cost a password hash or an email, i.e. login and reset_request. Every
+    attempt takes a token from the bucket of the address it comes from, from the bucket of the account it names and
+    from the bucket of the whole route. It runs before the view, so an attempt refused costs no query, no hash and no
+    email."""
+
+    def __init__(self, app=None):
+        self.backend = None
+        self.limits = {}
+        self.trusted_proxies = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app, backend=None):
+        """Method for choosing the backend and reading the limits from the app config. RATELIMIT_BACKEND is memory
+        (default), redis or none; a limit is overridden by e.g. RATELIMIT_LOGIN_IP=20/60."""
+        kind = (app.config.get('RATELIMIT_BACKEND') or 'memory').lower()
+        if backend is not None:
+            self.backend = backend
+        elif kind == 'redis':
+            self.backend = RedisBackend(app.config.get('RATELIMIT_URL'))
+        elif kind == 'memory':
+            self.backend = MemoryBackend()
+        else:
+            self.backend = None
+        self.limits = {scope: {kind: parse_limit(app.config.get(f'RATELIMIT_{scope}_{kind}'.upper()) or value)
+                               for kind, value in limits.items()}
+                       for scope, limits in DEFAULT_LIMITS.items()}
+        self.trusted_proxies = int(app.config.get('RATELIMIT_TRUSTED_PROXIES') or 0)
+        app.extensions['ratelimit'] = self
+
+    def client_ip(self):
+        """Method for getting the address of the client, taken from X-Forwarded-For only behind the number of proxies
+        set by RATELIMIT_TRUSTED_PROXIES, as the header can be written by anyone otherwise"""
+        route = request.access_route
+        if self.trusted_proxies and len(route) >= self.trusted_proxies:
+            return route[-self.trusted_proxies]
+        return request.remote_addr or 'unknown'
+
+    def hit(self, scope, ip, account=None, now=None):
+        """Method for taking a token from each bucket of an attempt
+
+        Args
+        ------------------
+        scope: It is the name of the limits, login or reset_request
+        ip: It is the address of the client
+        account: It is the email the attempt is for, if any
+
+        Returns
+        ------------------
+        0 if the attempt is allowed else the number of seconds to wait"""
+
+        if self.backend is None:
+            return 0
+        now = time.time() if now is None else now
+        limits = self.limits[scope]
+        keys = [('ip', f'{scope}:ip:{ip}')]
+        if account:
+            keys.append(('account', f'{scope}:account:{account}'))
+        # last, so that the attempts refused for their address or account do not use up the tokens of everyone
+        keys.append(('all', f'{scope}:all'))
+        for kind, key in keys:
+            wait = self.backend.take(key, *limits[kind], now)
+            if wait:
+                return wait
+        return 0
+
+    def limit(self, scope, account_field=None):
+        """Decorator for a view whose posts are throttled with the limits of the scope. The account is read from the
+        account_field of the posted form.
+
+        Returns
+        ------------------
+        The decorated view, which raises RateLimited when a bucket is empty"""
+
+        def decorator(view):
+            @wraps(view)
+            def decorated(*args, **kwargs):
+                if request.method == 'POST':
+                    account = (request.form.get(account_field) or '').strip().lower() if account_field else None
+                    wait = self.hit(scope, self.client_ip(), account)
+                    if wait:
+                        raise RateLimited(wait)
+                return view(*args, **kwargs)
+            return decorated
+        return decorator
+
+
+rate_limiter = RateLimiter()
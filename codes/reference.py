@@ -0,0 +1,68 @@
+import os
+from types import SimpleNamespace
+from .models import City, CarCompany, CarModels, CarCategories
+from .utils import VersionCounter
+
+
+class ReferenceData:
+    """Class for keeping the cities, car companies, car models and car categories in memory. These tables only change
+    through the admins blueprint, which bumps a version counter shared by all the workers after every change. Each
+    worker reloads a table only when the shared version has moved since it was cached, so in steady state the
+    dropdowns of the forms cost no query at all."""
+
+    MODELS = (City, CarCompany, CarModels, CarCategories)
+
+    def __init__(self, app=None):
+        self.counter = None
+        self._tables = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Method for setting up the shared version counter from the app config"""
+        path = app.config.get('REFERENCE_VERSION_FILE') or os.path.join(app.instance_path, 'reference.version')
+        self.counter = VersionCounter(path)
+        self._tables = {}
+        app.extensions['reference_data'] = self
+
+    def _table(self, model):
+        """Method for getting the cached rows of a table, loading them again if the shared version has changed"""
+        version = self.counter.read()
+        cached = self._tables.get(model)
+        if cached is None or cached[0] != version:
+            columns = [column.key for column in model.__table__.columns]
+            rows = [SimpleNamespace(**{key: getattr(row, key) for key in columns})
+                    for row in model.query.order_by(model.id).all()]
+            cached = (version, rows, {row.id: row for row in rows})
+            self._tables[model] = cached
+        return cached
+
+    def all(self, model):
+        """Method for getting all the rows of a reference table
+
+        Args
+        ------------------
+        model: It is one of City, CarCompany, CarModels or CarCategories
+
+        Returns
+        ------------------
+        The list of the rows ordered by id"""
+
+        return self._table(model)[1]
+
+    def get(self, model, row_id):
+        """Method for getting a single row of a reference table by its id
+
+        Returns
+        ------------------
+        The row if it exists else None"""
+
+        return self._table(model)[2].get(row_id)
+
+    def invalidate(self):
+        """Method to be called after a reference table has been changed so that every worker reloads it"""
+        self.counter.bump()
+        self._tables = {}
+
+
+reference_data = ReferenceData()
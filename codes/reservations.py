@@ -0,0 +1,119 @@
+import datetime
+from sqlalchemy.exc import IntegrityError
+from . import db, manifest
+from .availability import is_car_available
+from .models import Car, Rented, Reservation
+
+# How long a car stays held for a user while he is paying for it
+HOLD_TIME = datetime.timedelta(minutes=15)
+
+
+class ReservationError(Exception):
+    """Raised when a held car cannot be booked any more"""
+
+
+def _lock_car(car_id):
+    """Method for locking the row of a car until the end of the transaction. Every hold and every confirmation of a
+    car takes this lock first, so the availability check and the insert following it can never interleave with
+    another booking of the same car."""
+    if db.engine.dialect.name == 'sqlite':
+        # SQLite ignores FOR UPDATE, a write takes its database lock instead
+        Car.query.filter_by(id=car_id).update({Car.id: Car.id}, synchronize_session=False)
+    return Car.query.filter_by(id=car_id).with_for_update().first()
+
+
+def _is_held(car_id, rent_from, rent_till, user_id):
+    """Method for checking if another user holds a car for a time period clashing with the given one"""
+    return Reservation.query.filter_by(carID=car_id).filter_by(status='held')\
+        .filter(Reservation.expires_at > datetime.datetime.utcnow())\
+        .filter(Reservation.rented_from <= rent_till).filter(Reservation.rented_till >= rent_from)\
+        .filter(Reservation.user_id != user_id).first() is not None
+
+
+def hold_car(car_id, user, rent_from, rent_till, city_delivery_id):
+    """Method for holding a car for a user while he pays for it. The hold of the same user for the same car and dates
+    is renewed instead of adding a new one, and a user only ever has a single live hold: any other hold of his is
+    cancelled, so he cannot block more than one car at a time.
+
+    Args
+    ------------------
+    car_id: It is the id of the car to be held
+    user: It is the user booking the car
+    rent_from: It is the date from which the car is needed
+    rent_till: It is the date till which the car is needed
+    city_delivery_id: It is the city where the car will be returned
+
+    Returns
+    ------------------
+    The Reservation or None if the car is booked or held by someone else for these dates"""
+
+    now = datetime.datetime.utcnow()
+    car = _lock_car(car_id)
+    hold = Reservation.query.filter_by(carID=car_id, user_id=user.id, rented_from=rent_from, rented_till=rent_till,
+                                       status='held').first()
+    if car is None or not is_car_available(car_id, rent_from, rent_till) or \
+            _is_held(car_id, rent_from, rent_till, user.id):
+        db.session.rollback()
+        return None
+    if hold is None:
+        hold = Reservation(carID=car_id, user_id=user.id, rented_from=rent_from, rented_till=rent_till,
+                           city_taken_id=user.city_id, city_delivery_id=city_delivery_id)
+        db.session.add(hold)
+    hold.city_delivery_id = city_delivery_id
+    hold.expires_at = now + HOLD_TIME
+    db.session.flush()
+    Reservation.query.filter_by(user_id=user.id, status='held').filter(Reservation.id != hold.id)\
+        .update({'status': 'cancelled'}, synchronize_session=False)
+    db.session.commit()
+    return hold
+
+
+def confirm_reservation(hold_id, user_id, payment_intent):
+    """Method for turning a paid hold into a booking. It is idempotent on the payment intent, so a retried or repeated
+    confirmation of the same payment returns the booking made the first time instead of booking the car again.
+
+    Args
+    ------------------
+    hold_id: It is the id of the Reservation which has been paid
+    user_id: It is the id of the user who holds it
+    payment_intent: It is the id of the payment made for it
+
+    Returns
+    ------------------
+    The Rented booking or raises a ReservationError if the hold has expired and the car was booked meanwhile"""
+
+    if not payment_intent:
+        raise ReservationError("The payment for this reservation has not been made!")
+    booking = Rented.query.filter_by(payment_intent=payment_intent).first()
+    if booking is not None:
+        return booking
+    hold = Reservation.query.filter_by(id=hold_id, user_id=user_id).first()
+    if hold is None or hold.status == 'cancelled':
+        raise ReservationError("There is no such reservation!")
+    _lock_car(hold.carID)
+    hold = Reservation.query.filter_by(id=hold_id).with_for_update().populate_existing().first()
+    if hold.status == 'confirmed':
+        db.session.rollback()
+        return Rented.query.filter_by(payment_intent=hold.payment_intent).first()
+    if hold.expires_at <= datetime.datetime.utcnow() and (
+            not is_car_available(hold.carID, hold.rented_from, hold.rented_till) or
+            _is_held(hold.carID, hold.rented_from, hold.rented_till, hold.user_id)):
+        hold.status = 'cancelled'
+        db.session.commit()
+        raise ReservationError("The reservation has expired and the car has been booked by someone else!")
+    booking = Rented(carID=hold.carID, user_id=hold.user_id, booking_time=datetime.datetime.now(),
+                     rented_from=hold.rented_from, rented_till=hold.rented_till, city_taken_id=hold.city_taken_id,
+                     city_delivery_id=hold.city_delivery_id, payment_intent=payment_intent)
+    hold.status = 'confirmed'
+    hold.payment_intent = payment_intent
+    db.session.add(booking)
+    try:
+        db.session.flush()
+        manifest.booking_confirmed(booking)
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        booking = Rented.query.filter_by(payment_intent=payment_intent).first()
+        if booking is None:
+            raise
+    return booking
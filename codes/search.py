@@ -0,0 +1,50 @@
+from sqlalchemy import case, func, or_, select
+from . import db
+from .models import Car, CarCompany, CarModels, CarCategories, City
+
+
+def _name(column, key):
+    """Method for building the correlated lookup of a reference name of a car, empty if it is not set"""
+    return func.coalesce(select(column).where(column.class_.id == key).scalar_subquery(), "")
+
+
+# The search document of a car is its company, model, category, city and color in a single upper case column which
+# carries a trigram index on PostgreSQL, so a search is one indexed LIKE per word instead of a scan per table.
+SEARCH_DOCUMENT = func.upper(
+    _name(CarCompany.company_name, Car.company_id) + " " + _name(CarModels.model_name, Car.model_id) + " " +
+    _name(CarCategories.category, Car.category_id) + " " + _name(City.city, Car.city_id) + " " +
+    func.coalesce(Car.color, "")
+)
+
+
+def refresh_search_documents(*criterion):
+    """Method for rebuilding the search document of the cars matching the criterion in a single UPDATE. It needs to be
+    called when a car is added or updated and when a company, model, category or city is renamed.
+
+    Args
+    ------------------
+    criterion: It is the filter selecting the cars whose documents have changed, e.g. Car.company_id == 3"""
+
+    db.session.flush()
+    Car.query.filter(*criterion).update({Car.search_text: SEARCH_DOCUMENT}, synchronize_session=False)
+
+
+def search_cars(query, searched):
+    """Method for searching the cars matching the words entered by the user. A car matches if its search document
+    contains any of the words and the cars matching more of the words are ranked first.
+
+    Args
+    ------------------
+    query: It is the query of the cars to search in, e.g. the available cars
+    searched: It is the text entered by the user
+
+    Returns
+    ------------------
+    The query of the matching cars ordered by their rank"""
+
+    words = list(dict.fromkeys(searched.replace(",", " ").upper().split()))
+    if not words:
+        return query.filter(db.false())
+    matches = [Car.search_text.contains(word, autoescape=True) for word in words]
+    rank = sum(case((match, 1), else_=0) for match in matches)
+    return query.filter(or_(*matches)).order_by(rank.desc(), Car.id)
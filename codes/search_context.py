@@ -0,0 +1,94 @@
+import datetime
+from collections import namedtuple
+from flask import current_app, request, session
+from flask_login import current_user
+from itsdangerous import URLSafeTimedSerializer, BadSignature
+from .models import City
+from .reference import reference_data
+
+# The key of the token in the session and in the query string of a url
+KEY = 'search'
+SALT = 'search-context'
+
+
+class SearchContext(namedtuple('SearchContext', ('rent_from', 'rent_till', 'city_id'))):
+    """Class for the dates and the delivery city a user is looking for cars with"""
+
+    __slots__ = ()
+
+    @property
+    def city(self):
+        return reference_data.get(City, self.city_id)
+
+    @property
+    def expired(self):
+        return self.rent_from < datetime.datetime.today()
+
+
+def _serializer():
+    return URLSafeTimedSerializer(current_app.config['SECRET_KEY'], salt=SALT)
+
+
+def _day(value):
+    return datetime.datetime.combine(value, datetime.time()) if not isinstance(value, datetime.datetime) else value
+
+
+def make_token(user_id, rent_from, rent_till, city_id):
+    """Method for signing the search of a user. The dates are kept as ordinals of the days so the token stays a few
+    dozen bytes
+
+    Returns
+    ------------------
+    The token"""
+
+    return _serializer().dumps([user_id, _day(rent_from).toordinal(), _day(rent_till).toordinal(), city_id])
+
+
+def save(rent_from, rent_till, city_id):
+    """Method for keeping the search of the current user in his session as a signed token, instead of in the database.
+    The token is bound to the user and can also be passed in a url as ?search=<token>.
+
+    Args
+    ------------------
+    rent_from: It is the date from which the car is needed
+    rent_till: It is the date till which the car is needed
+    city_id: It is the city where the car will be returned
+
+    Returns
+    ------------------
+    The token"""
+
+    token = make_token(current_user.id, rent_from, rent_till, city_id)
+    session[KEY] = token
+    return token
+
+
+def load(token):
+    """Method for checking a token and reading the search out of it. A token is refused if its signature is wrong, if
+    it is older than SEARCH_CONTEXT_MAX_AGE, if it was made for another user, if the dates are the wrong way round or
+    if the city does not exist.
+
+    Returns
+    ------------------
+    The SearchContext or None"""
+
+    if not token:
+        return None
+    try:
+        user_id, rent_from, rent_till, city_id = _serializer().loads(
+            token, max_age=current_app.config.get('SEARCH_CONTEXT_MAX_AGE', 30 * 86400))
+    except (BadSignature, TypeError, ValueError):
+        return None
+    if user_id != current_user.id or rent_till < rent_from or reference_data.get(City, city_id) is None:
+        return None
+    return SearchContext(datetime.datetime.fromordinal(rent_from), datetime.datetime.fromordinal(rent_till), city_id)
+
+
+def current():
+    """Method for getting the search of the current user from the url or else from his session, without any query
+
+    Returns
+    ------------------
+    The SearchContext or None if the user has not searched yet or his token is not valid"""
+
+    return load(request.args.get(KEY) or session.get(KEY))
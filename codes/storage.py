@@ -0,0 +1,158 @@
+import mimetypes
+import os
+import shutil
+import click
+from flask import current_app, abort, request, send_from_directory, url_for, Response
+from flask.cli import with_appcontext
+from flask_login import current_user
+from itsdangerous import URLSafeTimedSerializer, BadSignature
+from werkzeug.security import safe_join
+from .uploads import store_upload
+
+# The prefix of the keys of the id proofs uploaded by the users
+ID_PROOFS = 'id_proofs'
+SALT = 'private-file'
+# The ways the bytes of a private file can be handed to the client
+DELIVERIES = ('send_file', 'x-accel-redirect')
+# The internal nginx location the files are sent from with X-Accel-Redirect. It must differ from the /private/ route
+# of the signed urls, or the internal location would also catch the signed urls and answer them with a 404
+ACCEL_PREFIX = '/_protected/'
+
+
+class LocalStorage:
+    """Class for keeping private files in a directory of the local disk which is not served by the static route. The
+    files are addressed by keys such as id_proofs/<name>, like the objects of a bucket, so it can be swapped for an S3
+    compatible backend offering the same methods."""
+
+    def __init__(self, root):
+        self.root = root
+
+    def directory(self, prefix):
+        """Method for getting the local directory of the keys starting with a prefix"""
+        return os.path.join(self.root, prefix)
+
+    def path(self, key):
+        """Method for getting the local path of a key, None if the key points outside of the storage"""
+        return safe_join(self.root, key)
+
+    def exists(self, key):
+        path = self.path(key)
+        return path is not None and os.path.isfile(path)
+
+    def put(self, prefix, file_storage, max_bytes=None):
+        """Method for storing an upload under the hash of its content
+
+        Args
+        ------------------
+        prefix: It is the prefix of the key, e.g. id_proofs
+        file_storage: It is the uploaded file of the form
+        max_bytes: It is the maximum size of the upload, None for no limit
+
+        Returns
+        ------------------
+        The name of the file under the prefix and True if it was not stored before or raises UploadTooLarge or
+        UnsupportedUpload"""
+
+        return store_upload(file_storage, self.directory(prefix), max_bytes)
+
+    def delete(self, key):
+        path = self.path(key)
+        if path is not None and os.path.isfile(path):
+            os.remove(path)
+
+
+class PrivateStorage:
+    """Class for storing the private uploads and handing them only to the admins. A page showing a private file gets
+    a short lived url signed for the admin looking at it, checked without any query, and the bytes are not read by
+    Python: with STORAGE_DELIVERY=x-accel-redirect nginx sends the file from an internal location at
+    STORAGE_ACCEL_PREFIX (/_protected/) mapped to STORAGE_ROOT, otherwise it goes out through send_file, i.e. the file
+    wrapper of the server (sendfile under gunicorn) or X-Sendfile when USE_X_SENDFILE is on. The old id_proofs folder
+    of the static files is never served, even before move-id-proofs has emptied it."""
+
+    def __init__(self, app=None):
+        self.backend = None
+        self.delivery = DELIVERIES[0]
+        self.accel_prefix = ACCEL_PREFIX
+        self.max_age = 300
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Method for choosing the storage directory and the delivery from the app config and adding the route"""
+        root = app.config.get('STORAGE_ROOT') or os.path.join(app.instance_path, 'private')
+        self.backend = LocalStorage(root)
+        self.delivery = (app.config.get('STORAGE_DELIVERY') or DELIVERIES[0]).lower()
+        if self.delivery not in DELIVERIES:
+            raise ValueError(f"STORAGE_DELIVERY must be one of {', '.join(DELIVERIES)}")
+        self.accel_prefix = app.config.get('STORAGE_ACCEL_PREFIX') or ACCEL_PREFIX
+        if (self.accel_prefix.rstrip('/') + '/').startswith('/private/'):
+            raise ValueError("STORAGE_ACCEL_PREFIX must differ from the /private/ route of the signed urls")
+        self.max_age = int(app.config.get('STORAGE_URL_MAX_AGE') or 300)
+        app.add_url_rule('/private/<token>', 'private_file', self.serve)
+        app.before_request(self._hide_static_id_proofs)
+        app.extensions['storage'] = self
+
+    @staticmethod
+    def _hide_static_id_proofs():
+        if request.endpoint == 'static' and \
+                os.path.normpath(request.view_args.get('filename', '')).split(os.sep)[0] == ID_PROOFS:
+            abort(404)
+
+    def _serializer(self):
+        return URLSafeTimedSerializer(current_app.config['SECRET_KEY'], salt=SALT)
+
+    def put(self, prefix, file_storage):
+        return self.backend.put(prefix, file_storage, current_app.config.get('MAX_CONTENT_LENGTH'))
+
+    def directory(self, prefix):
+        return self.backend.directory(prefix)
+
+    def exists(self, key):
+        return self.backend.exists(key)
+
+    def url(self, key):
+        """Method for getting a url of a private file which only the current user can open, for STORAGE_URL_MAX_AGE
+        seconds. The callers check that the user may see the file before asking for it."""
+        token = self._serializer().dumps([key, current_user.id])
+        return url_for('private_file', token=token)
+
+    def serve(self, token):
+        """Method for sending a private file to the admin it was signed for"""
+        try:
+            key, user_id = self._serializer().loads(token, max_age=self.max_age)
+        except (BadSignature, TypeError, ValueError):
+            abort(404)
+        if not current_user.is_authenticated or current_user.id != user_id or not current_user.is_admin:
+            abort(403)
+        path = self.backend.path(key)
+        if path is None or not os.path.isfile(path):
+            abort(404)
+        mimetype = mimetypes.guess_type(key)[0] or 'application/octet-stream'
+        if self.delivery == 'x-accel-redirect':
+            response = Response(mimetype=mimetype)
+            response.headers['X-Accel-Redirect'] = self.accel_prefix.rstrip('/') + '/' + key
+        else:
+            response = send_from_directory(self.backend.root, key, mimetype=mimetype, max_age=self.max_age)
+        response.cache_control.public = False
+        response.cache_control.private = True
+        response.cache_control.max_age = self.max_age
+        return response
+
+
+storage = PrivateStorage()
+
+
+@click.command('move-id-proofs')
+@with_appcontext
+def move_id_proofs_command():
+    """Move the id proofs out of the static folder into the private storage."""
+    source = os.path.join(current_app.static_folder, ID_PROOFS)
+    target = storage.directory(ID_PROOFS)
+    moved = 0
+    if os.path.isdir(source):
+        os.makedirs(target, exist_ok=True)
+        for filename in os.listdir(source):
+            shutil.move(os.path.join(source, filename), os.path.join(target, filename))
+            moved += 1
+        os.rmdir(source)
+    click.echo(f"{moved} id proofs moved to {target}")
@@ -0,0 +1,131 @@
+import hashlib
+import os
+import tempfile
+from PIL import Image, ImageOps
+
+CHUNK_SIZE = 64 * 1024
+# Every id proof is kept in these sizes, each one as WebP and as JPEG for the browsers without WebP
+VARIANTS = {'large': (1000, 1000), 'thumb': (200, 200)}
+FORMATS = {'webp': 'WEBP', 'jpg': 'JPEG'}
+# Images above this many pixels are refused instead of being decoded, unless their format can be decoded straight at
+# a reduced scale with draft()
+MAX_PIXELS = 40_000_000
+DRAFTABLE = {'JPEG'}
+# The extension a stored upload gets for the format found in its content, whatever the name it was uploaded with
+EXTENSIONS = {'JPEG': '.jpg', 'PNG': '.png', 'WEBP': '.webp', 'GIF': '.gif', 'BMP': '.bmp', 'TIFF': '.tif'}
+
+
+class UploadTooLarge(ValueError):
+    """Raised when an upload is bigger than the allowed number of bytes"""
+
+
+class UnsupportedUpload(ValueError):
+    """Raised when an upload is not an image in a format which can be read"""
+
+
+def too_many_pixels(picture):
+    """Method for checking whether an opened image would need too much memory to be decoded at full scale"""
+    return picture.format not in DRAFTABLE and picture.width * picture.height > MAX_PIXELS
+
+
+def image_extension(path):
+    """Method for getting the extension of an image from the format of its content. Only the header of the file is
+    read.
+
+    Returns
+    ------------------
+    The extension, e.g. .jpg, or raises UnsupportedUpload or UploadTooLarge if the image has too many pixels"""
+
+    try:
+        with Image.open(path) as picture:
+            image_format = picture.format
+            if too_many_pixels(picture):
+                raise UploadTooLarge(f"The image has more than {MAX_PIXELS} pixels!")
+    except (OSError, Image.DecompressionBombError):
+        raise UnsupportedUpload("The file is not an image which can be read!") from None
+    return EXTENSIONS.get(image_format, '.' + image_format.lower())
+
+
+def store_upload(file_storage, directory, max_bytes=None):
+    """Method for writing an image upload to a directory under the hash of its content and the extension of its format.
+    The upload is streamed to a temporary file in chunks while it is hashed, so the memory used does not depend on its
+    size, and an upload which is already stored is not stored a second time, whatever name it was uploaded with.
+
+    Args
+    ------------------
+    file_storage: It is the uploaded file of the form
+    directory: It is the directory where the file is stored
+    max_bytes: It is the maximum size of the upload, None for no limit
+
+    Returns
+    ------------------
+    The file name and True if the file was not stored before or raises UploadTooLarge or UnsupportedUpload"""
+
+    os.makedirs(directory, exist_ok=True)
+    digest = hashlib.sha256()
+    size = 0
+    fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            while True:
+                chunk = file_storage.stream.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if max_bytes is not None and size > max_bytes:
+                    raise UploadTooLarge(f"The upload is bigger than {max_bytes} bytes!")
+                digest.update(chunk)
+                out.write(chunk)
+        name = digest.hexdigest()[:32] + image_extension(temp_path)
+        path = os.path.join(directory, name)
+        if os.path.exists(path):
+            os.remove(temp_path)
+            return name, False
+        os.replace(temp_path, path)
+        return name, True
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def variant_name(name, variant, fmt):
+    """Method for getting the file name of a variant of a stored image, e.g. <hash>_thumb.webp"""
+    return f"{os.path.splitext(name)[0]}_{variant}.{fmt}"
+
+
+def make_variants(name, directory):
+    """Method for writing the fixed size variants of a stored image. JPEGs are decoded straight at a reduced scale with
+    draft() and the other formats are shrunk with reduce() before resampling, so decoding a very large photo does not
+    need memory for all of its pixels at full quality.
+
+    Args
+    ------------------
+    name: It is the file name of the stored image
+    directory: It is the directory where the image and its variants are stored
+
+    Raises
+    ------------------
+    UnsupportedUpload if the image cannot be decoded, which trying again would not change"""
+
+    largest = max(VARIANTS.values())
+    try:
+        with Image.open(os.path.join(directory, name)) as source:
+            source.draft('RGB', largest)
+            if too_many_pixels(source):
+                raise UnsupportedUpload(f"The image {name} has too many pixels!")
+            picture = ImageOps.exif_transpose(source)
+            picture.load()
+    except FileNotFoundError:
+        raise
+    except (OSError, SyntaxError, Image.DecompressionBombError) as error:
+        raise UnsupportedUpload(f"The image {name} cannot be decoded: {error}") from error
+    factor = min(picture.width // largest[0], picture.height // largest[1])
+    if factor > 1:
+        picture = picture.reduce(factor)
+    picture = picture.convert('RGB')
+    for variant, size in VARIANTS.items():
+        resized = picture.copy()
+        resized.thumbnail(size, reducing_gap=2.0)
+        for fmt, pil_format in FORMATS.items():
+            resized.save(os.path.join(directory, variant_name(name, variant, fmt)), pil_format, quality=85)
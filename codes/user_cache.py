@@ -0,0 +1,194 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from flask_login import UserMixin
+from sqlalchemy import event
+from . import db
+from .models import User
+from .utils import VersionCounter
+
+# The columns which the decorators and the templates read off current_user on every request
+PRINCIPAL_FIELDS = ('id', 'name', 'username', 'email', 'city_id', 'is_verified', 'is_admin', 'is_super_admin',
+                    'fine_pending', 'stripe_customer_id')
+
+
+class MemoryBackend:
+    """Class for a least recently used cache with a time to live, local to the worker process"""
+
+    def __init__(self, max_size=10000):
+        self.max_size = max_size
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            value, expires = item
+            if expires < time.monotonic():
+                del self._items[key]
+                return None
+            self._items.move_to_end(key)
+            return dict(value)
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._items[key] = (dict(value), time.monotonic() + ttl)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._items.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+
+class RedisBackend:
+    """Class for a cache shared by all the workers on any server speaking the Redis protocol. A client object with the
+    same get/setex/delete methods can be passed in place of the url, e.g. a local fake."""
+
+    def __init__(self, url=None, client=None, prefix='user:'):
+        if client is None:
+            import redis
+            client = redis.Redis.from_url(url)
+        self.client = client
+        self.prefix = prefix
+
+    def get(self, key):
+        value = self.client.get(self.prefix + str(key))
+        return json.loads(value) if value else None
+
+    def set(self, key, value, ttl):
+        self.client.setex(self.prefix + str(key), int(ttl), json.dumps(value))
+
+    def delete(self, key):
+        self.client.delete(self.prefix + str(key))
+
+
+class CachedUser(UserMixin):
+    """Class standing in for current_user. The principal columns are served from the cache and the User row is only
+    loaded from the database when some other attribute is read or when an attribute is changed."""
+
+    def __init__(self, data):
+        object.__setattr__(self, '_data', data)
+        object.__setattr__(self, '_user', None)
+
+    def _load(self):
+        if self._user is None:
+            object.__setattr__(self, '_user', User.query.get(self._data['id']))
+        return self._user
+
+    def __getattr__(self, name):
+        data = object.__getattribute__(self, '_data')
+        if name in data:
+            return data[name]
+        return getattr(self._load(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self._load(), name, value)
+        if name in self._data:
+            self._data[name] = value
+
+
+class UserCache:
+    """Class for loading the logged-in user without a database round trip. The principal of a user is cached by id and
+    dropped whenever a transaction changing that user is committed, e.g. by accept_user, reset_token, change_password,
+    a payment, car_return_review or a job of the worker.
+
+    The memory backend is local to each process, so a commit changing a user also bumps a version counter shared
+    through USER_VERSION_FILE, and every process empties its cache when it sees the version move. The file only
+    reaches the processes of one server; with the web and the job workers on several servers use the redis backend."""
+
+    def __init__(self, app=None):
+        self.backend = None
+        self.ttl = 60
+        self.counter = None
+        self._version = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app, backend=None):
+        """Method for choosing the backend from the app config. USER_CACHE_BACKEND is memory (default), redis or none"""
+        kind = (app.config.get('USER_CACHE_BACKEND') or 'memory').lower()
+        self.ttl = int(app.config.get('USER_CACHE_TTL') or 60)
+        self.counter = None
+        if backend is not None:
+            self.backend = backend
+        elif kind == 'redis':
+            self.backend = RedisBackend(app.config.get('USER_CACHE_URL'))
+        elif kind == 'memory':
+            self.backend = MemoryBackend(int(app.config.get('USER_CACHE_SIZE') or 10000))
+            self.counter = VersionCounter(app.config.get('USER_VERSION_FILE') or
+                                          os.path.join(app.instance_path, 'user.version'))
+            self._version = self.counter.read()
+        else:
+            self.backend = None
+        app.extensions['user_cache'] = self
+
+    def load(self, user_id):
+        """Method for loading the user for flask-login
+
+        Args
+        ------------------
+        user_id: It is the id of the user stored in the session
+
+        Returns
+        ------------------
+        The cached user or None if there is no such user"""
+
+        if self.backend is None:
+            return User.query.get(user_id)
+        if self.counter is not None:
+            version = self.counter.read()
+            if version != self._version:
+                # a user has been changed by another process
+                self.backend.clear()
+                self._version = version
+        data = self.backend.get(user_id)
+        if data is None:
+            user = User.query.get(user_id)
+            if user is None:
+                return None
+            data = {field: getattr(user, field) for field in PRINCIPAL_FIELDS}
+            self.backend.set(user_id, data, self.ttl)
+        return CachedUser(data)
+
+    def invalidate(self, user_id):
+        """Method for dropping a user from the cache, and from the caches of the other processes for the memory
+        backend"""
+        if self.backend is not None:
+            self.backend.delete(int(user_id))
+        if self.counter is not None:
+            version = self.counter.bump()
+            # a bump of another process in between has to empty this cache on the next load
+            if version == self._version + 1:
+                self._version = version
+
+
+user_cache = UserCache()
+
+
+@event.listens_for(db.session, 'after_flush')
+def _collect_changed_users(session, flush_context):
+    changed = session.info.setdefault('changed_users', set())
+    for instance in list(session.dirty) + list(session.deleted):
+        if isinstance(instance, User) and instance.id is not None:
+            changed.add(instance.id)
+
+
+@event.listens_for(db.session, 'after_commit')
+def _invalidate_changed_users(session):
+    for user_id in session.info.pop('changed_users', ()):
+        user_cache.invalidate(user_id)
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _forget_changed_users(session):
+    session.info.pop('changed_users', None)
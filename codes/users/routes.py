@@ -1,11 +1,19 @@
-from flask import render_template, url_for, flash, redirect, Blueprint, request
+from flask import render_template, url_for, flash, redirect, Blueprint, request, current_app, abort
 from flask_login import current_user, login_required
-from .. import db, bcrypt
+from .. import db, manifest, payments, search_context
 from ..decorators import user_required, admin_role_required
-from ..models import User, City, UserVerification, Rented, Temporary, Car
+from ..models import User, City, UserVerification, Rented, Reservation
 from ..users.forms import RegistrationForm, ApprovalForm, TakingDates
 from ..utils import save_picture
+from ..uploads import UploadTooLarge, UnsupportedUpload
+from ..jobs.queue import enqueue
+from ..payments import PaymentError
 from ..main.forms import SearchForm
+from ..loaders import BOOKING_DETAILS
+from ..reference import reference_data
+from ..pagination import keyset_paginate
+from ..validations import commit_form
+from ..passwords import passwords
 import datetime
 import stripe
 import os
@@ -13,6 +21,9 @@ import os
 
 users = Blueprint('users', __name__)
 stripe.api_key = os.environ.get("STRIPE_SECRET_KEY")
+# The API can be pointed at a local stub for load tests, and a slow Stripe only holds a request for this many seconds
+stripe.api_base = os.environ.get("STRIPE_API_BASE", stripe.api_base)
+stripe.default_http_client = stripe.http_client.RequestsClient(timeout=int(os.environ.get("STRIPE_TIMEOUT", 30)))
 
 
 @users.context_processor
@@ -30,20 +41,19 @@ def register():
     -----------------------------
     Returns: The success flash message and redirects to log in page"""
 
-    cities = City.query.all()
     if current_user.is_authenticated:
         return redirect(url_for('main.home'))
     form = RegistrationForm()
     if request.method == "POST":
         if form.validate_on_submit():
-            hashed_password = bcrypt.generate_password_hash(form.password.data).decode('utf-8')
+            hashed_password = passwords.hash(form.password.data)
             user = User(username=form.username.data, email=form.email.data, password=hashed_password, name=form.name.data,
                         city_id=form.city_id.data)
             db.session.add(user)
-            db.session.commit()
-            flash(f'Your account has been created successfully!', 'success')
-            return redirect(url_for('main.login'))
-    return render_template('register.html', form=form, cities=cities)
+            if commit_form(form):
+                flash(f'Your account has been created successfully!', 'success')
+                return redirect(url_for('main.login'))
+    return render_template('register.html', form=form, cities=reference_data.all(City))
 
 
 @users.route("/verify_account", methods=['GET', 'POST'])
@@ -60,15 +70,18 @@ def apply_for_verification():
     form = ApprovalForm()
     if request.method == "POST":
         if form.validate_on_submit():
-            if form.id_proof.data:
-                picture_file = save_picture(form.id_proof.data)
-                current_user.image_file = picture_file
-                row = UserVerification(user_id=current_user.id, id_proof=picture_file, approval="",
-                                   date=datetime.date.today())
-                db.session.add(row)
-                db.session.commit()
-            flash(f'Your documents are submitted successfully! Please wait for the approval.', 'info')
-            return redirect(url_for('main.home'))
+            try:
+                if form.id_proof.data:
+                    picture_file = save_picture(form.id_proof.data)
+                    current_user.image_file = picture_file
+                    row = UserVerification(user_id=current_user.id, id_proof=picture_file, approval="",
+                                           date=datetime.date.today())
+                    db.session.add(row)
+                    db.session.commit()
+                flash(f'Your documents are submitted successfully! Please wait for the approval.', 'info')
+                return redirect(url_for('main.home'))
+            except (UploadTooLarge, UnsupportedUpload) as error:
+                form.id_proof.errors.append(str(error))
     return render_template('apply_for_verification.html', title='Apply for Verification', form=form,
                            records=records)
 
@@ -110,19 +123,9 @@ def taking_dates():
             rent_from_date = form.rent_from.data
             rent_till_date = form.rent_till.data
             city_delivery = form.city_id.data
-            record = Temporary.query.filter_by(user_id=current_user.id).first()
-            if record:
-                record.rent_from = rent_from_date
-                record.rent_till = rent_till_date
-                record.city_id = city_delivery
-                db.session.commit()
-            else:
-                new = Temporary(user_id=current_user.id, rent_from=rent_from_date, rent_till=rent_till_date,
-                                city_id=city_delivery)
-                db.session.add(new)
-                db.session.commit()
+            search_context.save(rent_from_date, rent_till_date, city_delivery)
             return redirect(url_for('main.home'))
-    cities = City.query.all()
+    cities = reference_data.all(City)
     return render_template('taking_dates.html', form=form, cities=cities)
 
 
@@ -136,9 +139,8 @@ def bookings():
     -----------------------------
     Returns: The bookings list if the user has bookings else returns info flash message and redirects to home page"""
 
-    page = request.args.get('page', 1, type=int)
-    orders = Rented.query.filter_by(user_id=current_user.id).order_by(Rented.booking_time.desc())\
-        .paginate(page=page, per_page=5)
+    orders = keyset_paginate(Rented.query.options(*BOOKING_DETAILS).filter_by(user_id=current_user.id),
+                             (Rented.booking_time, Rented.booking_id), request.args.get('cursor'), descending=True)
     current_date = datetime.datetime.today()
     if orders.items:
         return render_template('orders.html', orders=orders, current_date=current_date)
@@ -160,6 +162,7 @@ def cancel_booking(ids):
     record = Rented.query.filter_by(booking_id=ids).first()
     if record.rented_from > datetime.datetime.today():
         record.final_status = "false"
+        manifest.booking_cancelled(record)
         db.session.commit()
         flash("Your booking has been cancelled!", "warning")
         return redirect(url_for('users.bookings'))
@@ -168,104 +171,106 @@ def cancel_booking(ids):
         return redirect(url_for('main.home'))
 
 
-@users.route('/pay_fine/<string:ids>')
+@users.route('/index/<int:hold_id>')
 @login_required
 @user_required
-def pay_fine(ids):
-
-    """Method to pay fine for all the user. It updates all the details in the database when the fine
-    is paid by the user.
-    -----------------------------
-    Returns: The success flash message and redirects to home page"""
-
-    record = Rented.query.filter_by(booking_id=ids).first()
-    user = User.query.filter_by(id=record.user_id).first()
-    record.fine_paid = True
-    user.fine_pending = False
-    db.session.commit()
-    flash('You have successfully paid the fine amount!', "success")
-    return redirect(url_for('main.home'))
-
-
-@users.route('/index/<string:ids>/<int:days>')
-def index(ids, days):
+def index(hold_id):
 
-    """Method to call the payment page for paying the Rent of the car by clicked on the book car button.
+    """Method to call the payment page for paying the Rent of the car held for the user by clicking on the confirm car
+    button.
     -----------------------------
     Returns: The payment page with a button to pay the required amount of money"""
 
-    car = Car.query.filter_by(id=ids).first()
-    total_amount = (days*car.ppd) + car.deposit
+    hold = Reservation.query.filter_by(id=hold_id, user_id=current_user.id).first_or_404()
+    return render_template('index.html', total_amount=hold.total_amount,
+                           key=os.environ.get("STRIPE_PUBLISHABLE_KEY"), hold_id=hold.id)
 
-    return render_template('index.html', total_amount=total_amount,
-                           key=os.environ.get("STRIPE_PUBLISHABLE_KEY"), ids=car.id)
 
+@users.route('/fine_index/<int:booking_id>')
+@login_required
+@user_required
+def fine_index(booking_id):
 
-@users.route('/fine_index/<string:ids>/<int:total_amount>')
-def fine_index(ids, total_amount):
-
-    """Method to call the payment page for paying the fine of the car by clicked on the pay fine button.
+    """Method to call the payment page for paying the fine of a booking by clicking on the pay fine button.
     -----------------------------
-    Returns: The payment page with a button to pay the required amount of money"""
+    Returns: The payment page with a button to pay the fine or redirects to the bookings if there is no fine to pay"""
 
-    return render_template('fine_index.html', total_amount=total_amount,
-                           key=os.environ.get("STRIPE_PUBLISHABLE_KEY"), ids=ids)
+    record = Rented.query.filter_by(booking_id=booking_id, user_id=current_user.id).first_or_404()
+    if not record.fine or record.fine_paid:
+        flash("There is no fine to pay for this booking!", "info")
+        return redirect(url_for('users.bookings'))
+    return render_template('fine_index.html', total_amount=record.fine,
+                           key=os.environ.get("STRIPE_PUBLISHABLE_KEY"), ids=record.booking_id)
 
 
-@users.route('/charge/<int:total_amount>/<int:ids>')
-def charge(total_amount, ids):
+@users.route('/charge/<int:hold_id>', methods=['POST'])
+@login_required
+@user_required
+def charge(hold_id):
 
-    """Method for paying the amount of money, a user need to pay for booking a car.
+    """Method for paying the rent of the car held for the user and booking it once the payment has succeeded. The
+    amount is worked out from the hold and paying again for the same hold never charges the card twice.
     -----------------------------
-    Returns: The payment page entering all the details to pay the amount required"""
-
-    amount = total_amount*100
-
-    card_obj = stripe.PaymentMethod.create(
-        type="card",
-        card={
-            "number": "4242424242424242",
-            "exp_month": 7,
-            "exp_year": 2023,
-            "cvc": 980
-        },
-    )
-
-    customer = stripe.Customer.create(
-        email=current_user.email,
-        source=request.form['stripeToken']
-    )
-
-    charge = stripe.PaymentIntent.create(
-        customer=customer.id,
-        amount=amount,
-        payment_method=card_obj.id,
-        currency='inr',
-        description='Rent Car'
-    )
-
-    return redirect(url_for('cars.confirm_car', ids=ids))
+    Returns: The success flash message and redirects to the home page, or back to the payment page if the card is
+    declined"""
+
+    hold = Reservation.query.filter_by(id=hold_id, user_id=current_user.id).first_or_404()
+    try:
+        payment = payments.pay_for_hold(hold, current_user, request.form.get('stripeToken'))
+    except PaymentError as error:
+        flash(str(error), "danger")
+        return redirect(url_for('users.index', hold_id=hold.id))
+    if payment.status == 'succeeded' and payment.booking_id:
+        flash("The car has been booked successfully!", "success")
+    elif payment.status in ('refunding', 'refunded'):
+        flash("The reservation has expired and the car has been booked by someone else! Your payment will be "
+              "refunded.", "danger")
+    else:
+        enqueue('reconcile_payments', delay=600)
+        db.session.commit()
+        flash("Your payment is being processed, the car will be booked as soon as it is confirmed!", "info")
+    return redirect(url_for('main.home'))
 
 
-@users.route('/fine_charge/<int:total_amount>/<int:ids>')
-def fine_charge(total_amount, ids):
+@users.route('/fine_charge/<int:booking_id>', methods=['POST'])
+@login_required
+@user_required
+def fine_charge(booking_id):
 
-    """Method for paying the amount of money, a user need to pay for paying the fine.
+    """Method for paying the fine of a booking. The amount is the fine of the booking and the fine is marked as paid
+    once the payment has succeeded.
     -----------------------------
-    Returns: The payment page entering all the details to pay the amount required"""
-
-    amount = total_amount*100
+    Returns: The success flash message and redirects to the home page, or back to the payment page if the card is
+    declined"""
+
+    record = Rented.query.filter_by(booking_id=booking_id, user_id=current_user.id).first_or_404()
+    try:
+        payment = payments.pay_for_fine(record, current_user, request.form.get('stripeToken'))
+    except PaymentError as error:
+        flash(str(error), "danger")
+        return redirect(url_for('users.fine_index', booking_id=record.booking_id))
+    if payment.status == 'succeeded':
+        flash('You have successfully paid the fine amount!', "success")
+    else:
+        enqueue('reconcile_payments', delay=600)
+        db.session.commit()
+        flash("Your payment is being processed, the fine will be marked as paid as soon as it is confirmed!", "info")
+    return redirect(url_for('main.home'))
 
-    customer = stripe.Customer.create(
-        email=current_user.email,
-        source=request.form['stripeToken']
-    )
 
-    charge = stripe.PaymentIntent.create(
-        customer=customer.id,
-        amount=amount,
-        currency='INR',
-        description='Rent Car'
-    )
+@users.route('/stripe/webhook', methods=['POST'])
+def stripe_webhook():
 
-    return redirect(url_for('users.pay_fine', ids=ids))
+    """Method for receiving the events of Stripe about the payments, which settle the payments left pending
+    -----------------------------
+    Returns: An empty response, or a 400 error if the event is not signed by Stripe"""
+
+    secret = current_app.config.get('STRIPE_WEBHOOK_SECRET')
+    if not secret:
+        abort(404)
+    try:
+        event = stripe.Webhook.construct_event(request.get_data(), request.headers.get('Stripe-Signature', ''), secret)
+    except (ValueError, stripe.error.SignatureVerificationError):
+        abort(400)
+    payments.handle_event(event)
+    return '', 200
@@ -1,36 +1,67 @@
+import fcntl
 import os
-import secrets
-from flask import current_app
-from PIL import Image
 from flask import url_for
-from flask_mail import Message
-from . import mail
+from .jobs.queue import enqueue
+from .storage import storage, ID_PROOFS
+from .uploads import variant_name
 
 
 def save_picture(form_picture):
-    """Method to save the documents submitted by the user. It takes an input as a se"""
-    random_hex = secrets.token_hex(8)
-    _, f_ext = os.path.splitext(form_picture.filename)
-    picture_fn = random_hex+f_ext
-    """
-    Here first the picture path is saved in the folder and picture size is mentioned.
-    """
-    picture_path = os.path.join(current_app.root_path, 'static/id_proofs', picture_fn)
-    output_size = (500, 5000)
-    picture = Image.open(form_picture)
-    picture.thumbnail(output_size)
-    picture.save(picture_path)
+    """Method to save the documents submitted by the user. The upload is kept in the private storage under the hash of
+    its content so that the same document uploaded again is kept only once, and making its smaller variants is left to
+    a background job."""
+    picture_fn, is_new = storage.put(ID_PROOFS, form_picture)
+    if is_new:
+        enqueue('process_id_proof', filename=picture_fn)
     return picture_fn
 
 
+def id_proof_urls(picture_fn):
+    """Method to get the signed urls of the large variants of a document, falling back to the document as it was
+    uploaded while the variants are not made yet"""
+    jpg, webp = variant_name(picture_fn, 'large', 'jpg'), variant_name(picture_fn, 'large', 'webp')
+    if storage.exists(f'{ID_PROOFS}/{jpg}'):
+        return storage.url(f'{ID_PROOFS}/{jpg}'), storage.url(f'{ID_PROOFS}/{webp}')
+    return storage.url(f'{ID_PROOFS}/{picture_fn}'), None
+
+
 def send_reset_email(user):
-    """Method to send the reset password email"""
+    """Method to send the reset password email. The email is handed to the jobs worker once the caller commits"""
     token = user.get_reset_token()
-    msg = Message('Password Reset Request',
-                  sender='noreply@demo.com',
-                  recipients=[user.email])
-    msg.body = f'''To reset your password, visit the following link:
+    body = f'''To reset your password, visit the following link:
                 {url_for('main.reset_token', token=token, _external=True)}
                 If you did not make this request then simply ignore this email and no changes will be made.
                 '''
-    mail.send(msg)
+    enqueue('send_email', subject='Password Reset Request', recipients=[user.email], body=body)
+
+
+class VersionCounter:
+    """Class for a version number shared by all the workers through a small file. Readers only open and read the file,
+    writers increment it under an exclusive lock so that no bump is lost when two workers write at the same time."""
+
+    def __init__(self, path):
+        self.path = path
+
+    def read(self):
+        """Method to read the current version. A missing file is version 0"""
+        try:
+            with open(self.path) as f:
+                return int(f.read() or 0)
+        except (FileNotFoundError, ValueError):
+            return 0
+
+    def bump(self):
+        """Method to increment the version so that every worker drops what it has cached for it"""
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, 'a+') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.seek(0)
+                version = int(f.read() or 0) + 1
+                f.seek(0)
+                f.truncate()
+                f.write(str(version))
+                f.flush()
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+        return version
@@ -1,10 +1,89 @@
 from wtforms.validators import ValidationError
+from sqlalchemy import select, literal, union_all
+from sqlalchemy.exc import IntegrityError
+from . import db
 from .models import User, Car, CarCompany, CarCategories, CarModels, City
+from .reference import reference_data
 import datetime
+import re
+
+# The columns whose values have to be unique, by the name of the field holding them, with the message shown when the
+# value is already taken
+UNIQUE_FIELDS = {
+    'username': (User.username, 'Username is already taken!'),
+    'email': (User.email, 'Email is already taken!'),
+    'car_id': (Car.car_id, 'Car ID is already taken!'),
+}
+UNIQUE_MESSAGES = dict({name: message for name, (_, message) in UNIQUE_FIELDS.items()},
+                       city='City already exists!', company_name='Company already exists!',
+                       category='Category already exists!', model_name='Model already exists!')
+# The column named by a unique violation, in the messages of PostgreSQL and of SQLite
+_UNIQUE_COLUMN = re.compile(r'Key \((\w+)\)=|UNIQUE constraint failed: \w+\.(\w+)')
+
+
+def _name(value):
+    return value.replace(" ", "").upper()
+
+
+def _taken(form):
+    """Method for finding which of the unique fields of a form hold a value which is already taken. All the fields are
+    checked in a single query the first time a validator asks, and the answer is kept on the form for the others.
+
+    Returns
+    ------------------
+    The set of the names of the fields whose value is taken"""
+
+    if getattr(form, '_taken_fields', None) is None:
+        selects = [select(literal(name).label('field')).where(column == (_name(form[name].data) if name == 'car_id'
+                                                                          else form[name].data))
+                   for name, (column, _) in UNIQUE_FIELDS.items() if name in form and form[name].data]
+        if not selects:
+            form._taken_fields = set()
+        else:
+            statement = selects[0] if len(selects) == 1 else union_all(*selects)
+            form._taken_fields = {row.field for row in db.session.execute(statement)}
+    return form._taken_fields
+
+
+def _exists(model, field):
+    if field.data is not None and reference_data.get(model, field.data) is None:
+        raise ValidationError(f'{field.label.text} does not exist!')
+
+
+def commit_form(form, *updates):
+    """Method for saving what was added or changed from a form. A value taken by someone else between the validation of
+    the form and the commit is refused by the unique constraint of the database, and the IntegrityError is turned into
+    the error of the field instead of a server error.
+
+    Args
+    ------------------
+    form: It is the form whose values are being saved
+    updates: They are functions making further changes once the rows of the form are flushed, e.g. refreshing the
+    search documents of the cars
+
+    Returns
+    ------------------
+    True if saved, else False with the error added to the field"""
+
+    try:
+        db.session.flush()
+        for update in updates:
+            update()
+        db.session.commit()
+        return True
+    except IntegrityError as error:
+        db.session.rollback()
+        match = _UNIQUE_COLUMN.search(str(error.orig))
+        column = next((group for group in match.groups() if group), None) if match else None
+        if column is None or column not in form:
+            raise
+        form[column].errors = list(form[column].errors) + [UNIQUE_MESSAGES.get(column, 'It is already taken!')]
+        return False
 
 
 class Validators:
-    """Class for validating different variables"""
+    """Class for validating different variables. The uniqueness of the users and the cars is checked for the whole form
+    in one query, and the names and ids of the reference tables are checked against the reference cache without any."""
     @staticmethod
     def validate_username(self, field):
         """Method for validating the username and checking if it already exists
@@ -19,8 +98,7 @@ class Validators:
         True if the field is validated or raises a Validation error"""
 
         if " " not in field.data:
-            user = User.query.filter_by(username=field.data).first()
-            if user:
+            if 'username' in _taken(self):
                 raise ValidationError('Username is already taken!')
         else:
             raise ValidationError('Username cannot have spaces!')
@@ -38,8 +116,7 @@ class Validators:
         ------------------
         True if the field is validated or raises a Validation error"""
 
-        user = User.query.filter_by(email=field.data).first()
-        if user:
+        if 'email' in _taken(self):
             raise ValidationError('Email is already taken!')
 
     @staticmethod
@@ -127,8 +204,7 @@ class Validators:
         ------------------
         True if the field is validated or raises a Validation error"""
 
-        car = Car.query.filter_by(car_id=field.data.replace(" ", "").upper()).first()
-        if car:
+        if 'car_id' in _taken(self):
             raise ValidationError('Car ID is already taken!')
 
     @staticmethod
@@ -144,8 +220,7 @@ class Validators:
         ------------------
         True if the field is validated or raises a Validation error"""
 
-        company = CarCompany.query.filter_by(company_name=field.data.replace(" ", "").upper()).first()
-        if company:
+        if any(company.company_name == _name(field.data) for company in reference_data.all(CarCompany)):
             raise ValidationError('Company already exists!')
 
     @staticmethod
@@ -160,8 +235,7 @@ class Validators:
         Returns
         ------------------
         True if the field is validated or raises a Validation error"""
-        city = City.query.filter_by(city=field.data.replace(" ", "").upper()).first()
-        if city:
+        if any(city.city == _name(field.data) for city in reference_data.all(City)):
             raise ValidationError('City already exists!')
 
     @staticmethod
@@ -177,8 +251,7 @@ class Validators:
         ------------------
         True if the field is validated or raises a Validation error"""
 
-        category = CarCategories.query.filter_by(category=field.data.replace(" ", "").upper()).first()
-        if category:
+        if any(category.category == _name(field.data) for category in reference_data.all(CarCategories)):
             raise ValidationError('Category already exists!')
 
     @staticmethod
@@ -194,10 +267,69 @@ class Validators:
         ------------------
         True if the field is validated or raises a Validation error"""
 
-        model = CarModels.query.filter_by(model_name=field.data.replace(" ", "").upper()).first()
-        if model:
+        if any(model.model_name == _name(field.data) for model in reference_data.all(CarModels)):
             raise ValidationError('Model already exists!')
 
+    @staticmethod
+    def validate_city_id(self, field):
+        """Method for checking that the selected city exists
+
+        Args
+        ------------------
+        self: is used as the function is defined in the class
+        field: It is the id of the city selected by the user
+
+        Returns
+        ------------------
+        True if the field is validated or raises a Validation error"""
+
+        _exists(City, field)
+
+    @staticmethod
+    def validate_company_id(self, field):
+        """Method for checking that the selected company exists
+
+        Args
+        ------------------
+        self: is used as the function is defined in the class
+        field: It is the id of the company selected by the user
+
+        Returns
+        ------------------
+        True if the field is validated or raises a Validation error"""
+
+        _exists(CarCompany, field)
+
+    @staticmethod
+    def validate_category_id(self, field):
+        """Method for checking that the selected category exists
+
+        Args
+        ------------------
+        self: is used as the function is defined in the class
+        field: It is the id of the category selected by the user
+
+        Returns
+        ------------------
+        True if the field is validated or raises a Validation error"""
+
+        _exists(CarCategories, field)
+
+    @staticmethod
+    def validate_model_id(self, field):
+        """Method for checking that the selected model exists
+
+        Args
+        ------------------
+        self: is used as the function is defined in the class
+        field: It is the id of the model selected by the user
+
+        Returns
+        ------------------
+        True if the field is validated or raises a Validation error"""
+
+        _exists(CarModels, field)
+
     @staticmethod
     def validate_mail(self, field):
 
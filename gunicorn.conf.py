@@ -0,0 +1,32 @@
+"""Settings of gunicorn for serving the app, read from the env variables"""
+
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 8000)}"
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.environ.get("GUNICORN_THREADS", 1))
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 30))
+# sync (default) or gevent. With gevent a worker serves up to worker_connections requests at once and a request
+# waiting on Stripe or on the database lets the others run, so a slow upstream no longer ties up the whole worker.
+# DB_POOL_SIZE + DB_MAX_OVERFLOW then bounds how many of them can use the database at the same time.
+worker_class = os.environ.get("WORKER_CLASS", "sync")
+worker_connections = int(os.environ.get("WORKER_CONNECTIONS", 100))
+# The app is imported once in the master and the workers are forked from it, so the connections the master may have
+# opened while importing are dropped in each worker below and every worker builds its own pool.
+preload_app = True
+
+if worker_class == "gevent":
+    # Patched here, before the app is preloaded, so that every module of the app sees the cooperative sockets, locks
+    # and thread locals, and psycopg2 waits for the database without blocking the other greenlets.
+    from gevent import monkey
+    monkey.patch_all()
+    from psycogreen.gevent import patch_psycopg
+    patch_psycopg()
+
+
+def post_fork(server, worker):
+    from app import app
+    from codes import db
+    # close=False leaves the sockets of the parent alone and only makes this worker forget them
+    db.get_engine(app).dispose(close=False)
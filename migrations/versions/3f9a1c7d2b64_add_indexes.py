@@ -0,0 +1,47 @@
+"""add indexes for the hot query paths
+
+Revision ID: 3f9a1c7d2b64
+Revises: c5411c271c87
+Create Date: 2026-10-17 10:12:31.408215
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f9a1c7d2b64'
+down_revision = 'c5411c271c87'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # cars of a city which can be booked (main.home, main.search)
+    op.create_index('ix_cars_city_status', 'cars', ['city_id', 'status'], unique=False)
+    # confirmed bookings of a car clashing with a period (availability anti-join, cars.book_car)
+    op.create_index('ix_rented_car_period', 'rented', ['carID', 'rented_from', 'rented_till'], unique=False,
+                    postgresql_where=sa.text("final_status = 'true'"),
+                    sqlite_where=sa.text("final_status = 'true'"))
+    # bookings of a user newest first (users.bookings, cars.book_car)
+    op.create_index('ix_rented_user_booking_time', 'rented', ['user_id', 'booking_time'], unique=False)
+    # cars still to be picked up from a city (cars.cars_taking_list and its late variant)
+    op.create_index('ix_rented_taking', 'rented', ['city_taken_id', 'rented_from'], unique=False,
+                    postgresql_where=sa.text("final_status = 'true' AND NOT car_taken"),
+                    sqlite_where=sa.text("final_status = 'true' AND car_taken = 0"))
+    # cars still to be returned to a city (cars.cars_delivery_list and its late variant)
+    op.create_index('ix_rented_delivery', 'rented', ['city_delivery_id', 'rented_till'], unique=False,
+                    postgresql_where=sa.text("final_status = 'true' AND car_taken AND NOT car_delivery"),
+                    sqlite_where=sa.text("final_status = 'true' AND car_taken = 1 AND car_delivery = 0"))
+    # verification requests waiting for an admin (users.display_users_list, admins.verify_user)
+    op.create_index('ix_user_verification_pending', 'user_verification', ['user_id'], unique=False,
+                    postgresql_where=sa.text("approval = ''"), sqlite_where=sa.text("approval = ''"))
+
+
+def downgrade():
+    op.drop_index('ix_user_verification_pending', table_name='user_verification')
+    op.drop_index('ix_rented_delivery', table_name='rented')
+    op.drop_index('ix_rented_taking', table_name='rented')
+    op.drop_index('ix_rented_user_booking_time', table_name='rented')
+    op.drop_index('ix_rented_car_period', table_name='rented')
+    op.drop_index('ix_cars_city_status', table_name='cars')
@@ -0,0 +1,104 @@
+"""add the reservation holds and the payment intent of the bookings
+
+Revision ID: 5e7f3b2a9c48
+Revises: d41c7a9e5f12
+Create Date: 2026-10-17 12:30:07.581733
+
+"""
+from alembic import op, context
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5e7f3b2a9c48'
+down_revision = 'd41c7a9e5f12'
+branch_labels = None
+depends_on = None
+
+# Pairs of confirmed bookings of the same car whose periods overlap, which the exclusion constraint refuses
+CLASHES = sa.text('''
+    SELECT a.booking_id, b.booking_id, a."carID" FROM rented a JOIN rented b
+    ON a."carID" = b."carID" AND a.booking_id < b.booking_id
+    AND a.rented_from <= b.rented_till AND b.rented_from <= a.rented_till
+    WHERE a.final_status = 'true' AND b.final_status = 'true'
+    ORDER BY a."carID", a.booking_id, b.booking_id
+''')
+
+
+def resolve_double_bookings(bind):
+    """Method for marking as not confirmed the bookings which clash with a booking of the same car made before them.
+    The bookings of each car are walked in the order they were made, so a booking is only dropped when it clashes
+    with one which is kept."""
+    car_ids = sorted({row[2] for row in bind.execute(CLASHES)})
+    dropped = []
+    for car_id in car_ids:
+        kept = []
+        rows = bind.execute(sa.text('''
+            SELECT booking_id, rented_from, rented_till FROM rented
+            WHERE "carID" = :car_id AND final_status = 'true' ORDER BY booking_time, booking_id
+        '''), {'car_id': car_id})
+        for booking_id, rented_from, rented_till in rows:
+            if any(rented_from <= till and start <= rented_till for start, till in kept):
+                dropped.append(booking_id)
+            else:
+                kept.append((rented_from, rented_till))
+    if dropped:
+        bind.execute(sa.text("UPDATE rented SET final_status = 'false' WHERE booking_id IN :ids")
+                     .bindparams(sa.bindparam('ids', expanding=True)), {'ids': dropped})
+        print(f"Marked the double bookings {', '.join(map(str, dropped))} as not confirmed, "
+              f"their payments have to be refunded")
+
+
+def upgrade():
+    op.create_table('reservations',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('carID', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('rented_from', sa.DateTime(), nullable=False),
+    sa.Column('rented_till', sa.DateTime(), nullable=False),
+    sa.Column('city_taken_id', sa.Integer(), nullable=True),
+    sa.Column('city_delivery_id', sa.Integer(), nullable=True),
+    sa.Column('created', sa.DateTime(), nullable=False),
+    sa.Column('expires_at', sa.DateTime(), nullable=False),
+    sa.Column('status', sa.String(length=20), nullable=False),
+    sa.Column('payment_intent', sa.String(length=100), nullable=True),
+    sa.ForeignKeyConstraint(['carID'], ['cars.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['city_delivery_id'], ['cities.id'], ondelete='SET NULL'),
+    sa.ForeignKeyConstraint(['city_taken_id'], ['cities.id'], ondelete='SET NULL'),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('payment_intent')
+    )
+    op.create_index('ix_reservations_car_expires', 'reservations', ['carID', 'expires_at'], unique=False)
+    with op.batch_alter_table('rented') as batch_op:
+        batch_op.add_column(sa.Column('payment_intent', sa.String(length=100), nullable=True))
+        batch_op.create_unique_constraint('rented_payment_intent_key', ['payment_intent'])
+    bind = op.get_bind()
+    if bind.dialect.name == 'postgresql':
+        # A second line of defence behind the row lock: two confirmed bookings of a car can never overlap. The double
+        # bookings made before it would make adding it fail, so they are resolved first when asked to with
+        # -x resolve_double_bookings=true, and listed otherwise.
+        if context.get_x_argument(as_dictionary=True).get('resolve_double_bookings', '').lower() == 'true':
+            resolve_double_bookings(bind)
+        clashes = bind.execute(CLASHES).fetchall()
+        if clashes:
+            raise RuntimeError(
+                "Confirmed bookings of the same car overlap, so rented_no_overlap cannot be added:\n" +
+                "\n".join(f"car {car_id}: bookings {first} and {second}" for first, second, car_id in clashes[:50]) +
+                (f"\n... and {len(clashes) - 50} more" if len(clashes) > 50 else "") +
+                "\nCancel one booking of each pair, or run `flask db upgrade -x resolve_double_bookings=true` to keep "
+                "the booking made first and mark the later ones as not confirmed.")
+        op.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
+        op.execute('ALTER TABLE rented ADD CONSTRAINT rented_no_overlap EXCLUDE USING gist '
+                   '("carID" WITH =, tsrange(rented_from, rented_till, \'[]\') WITH &&) '
+                   'WHERE (final_status = \'true\')')
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute('ALTER TABLE rented DROP CONSTRAINT rented_no_overlap')
+    with op.batch_alter_table('rented') as batch_op:
+        batch_op.drop_constraint('rented_payment_intent_key', type_='unique')
+        batch_op.drop_column('payment_intent')
+    op.drop_index('ix_reservations_car_expires', table_name='reservations')
+    op.drop_table('reservations')
@@ -0,0 +1,38 @@
+"""add the search document of the cars
+
+Revision ID: 8b2e4d91f0a3
+Revises: 3f9a1c7d2b64
+Create Date: 2026-10-17 11:03:54.662190
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8b2e4d91f0a3'
+down_revision = '3f9a1c7d2b64'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('cars', sa.Column('search_text', sa.String(length=300), nullable=True))
+    op.execute("""
+        UPDATE cars SET search_text = UPPER(
+            COALESCE((SELECT company_name FROM car_companies WHERE car_companies.id = cars.company_id), '') || ' ' ||
+            COALESCE((SELECT model_name FROM car_models WHERE car_models.id = cars.model_id), '') || ' ' ||
+            COALESCE((SELECT category FROM car_categories WHERE car_categories.id = cars.category_id), '') || ' ' ||
+            COALESCE((SELECT city FROM cities WHERE cities.id = cars.city_id), '') || ' ' ||
+            COALESCE(color, ''))
+    """)
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        op.create_index('ix_cars_search_text_trgm', 'cars', ['search_text'], unique=False, postgresql_using='gin',
+                        postgresql_ops={'search_text': 'gin_trgm_ops'})
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        op.drop_index('ix_cars_search_text_trgm', table_name='cars')
+    op.drop_column('cars', 'search_text')
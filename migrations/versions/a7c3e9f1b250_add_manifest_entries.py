@@ -0,0 +1,46 @@
+"""add the daily pickup and return manifest of each city
+
+Revision ID: a7c3e9f1b250
+Revises: 5e7f3b2a9c48
+Create Date: 2026-10-17 14:05:41.218406
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a7c3e9f1b250'
+down_revision = '5e7f3b2a9c48'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('manifest_entries',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('city_id', sa.Integer(), nullable=False),
+    sa.Column('kind', sa.String(length=10), nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('till', sa.Date(), nullable=False),
+    sa.Column('booking_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['booking_id'], ['rented.booking_id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['city_id'], ['cities.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('booking_id', 'kind', name='uq_manifest_booking_kind')
+    )
+    op.create_index('ix_manifest_city_kind_day', 'manifest_entries', ['city_id', 'kind', 'day', 'booking_id'],
+                    unique=False)
+    # the lists of the bookings made so far, the same as what rebuild-manifest writes
+    op.execute("INSERT INTO manifest_entries (city_id, kind, day, till, booking_id) "
+               "SELECT city_taken_id, 'pickup', date(rented_from), date(rented_till), booking_id FROM rented "
+               "WHERE final_status = 'true' AND car_taken = false AND city_taken_id IS NOT NULL")
+    op.execute("INSERT INTO manifest_entries (city_id, kind, day, till, booking_id) "
+               "SELECT city_delivery_id, 'return', date(rented_till), date(rented_till), booking_id FROM rented "
+               "WHERE final_status = 'true' AND car_taken = true AND car_delivery = false "
+               "AND city_delivery_id IS NOT NULL")
+
+
+def downgrade():
+    op.drop_index('ix_manifest_city_kind_day', table_name='manifest_entries')
+    op.drop_table('manifest_entries')
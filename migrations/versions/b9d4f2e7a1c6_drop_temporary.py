@@ -0,0 +1,34 @@
+"""drop the temporary table, the search of a user is kept in a signed token instead
+
+Revision ID: b9d4f2e7a1c6
+Revises: e2b8d6c4a913
+Create Date: 2026-10-17 16:41:52.318406
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b9d4f2e7a1c6'
+down_revision = 'e2b8d6c4a913'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.drop_table('temporary')
+
+
+def downgrade():
+    op.create_table('temporary',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=True),
+    sa.Column('booking_time', sa.DateTime(), nullable=False),
+    sa.Column('rent_from', sa.DateTime(), nullable=False),
+    sa.Column('rent_till', sa.DateTime(), nullable=False),
+    sa.Column('city_id', sa.Integer(), nullable=True),
+    sa.ForeignKeyConstraint(['city_id'], ['cities.id'], ondelete='SET NULL'),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='SET NULL'),
+    sa.PrimaryKeyConstraint('id')
+    )
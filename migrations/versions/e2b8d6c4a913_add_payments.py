@@ -0,0 +1,53 @@
+"""add the payments and the stripe customer of the users
+
+Revision ID: e2b8d6c4a913
+Revises: a7c3e9f1b250
+Create Date: 2026-10-17 15:22:09.774130
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e2b8d6c4a913'
+down_revision = 'a7c3e9f1b250'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('payments',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=True),
+    sa.Column('kind', sa.String(length=10), nullable=False),
+    sa.Column('target', sa.String(length=50), nullable=False),
+    sa.Column('reservation_id', sa.Integer(), nullable=True),
+    sa.Column('booking_id', sa.Integer(), nullable=True),
+    sa.Column('amount', sa.Integer(), nullable=False),
+    sa.Column('currency', sa.String(length=3), nullable=False),
+    sa.Column('idempotency_key', sa.String(length=80), nullable=False),
+    sa.Column('provider_id', sa.String(length=100), nullable=True),
+    sa.Column('status', sa.String(length=20), nullable=False),
+    sa.Column('last_error', sa.String(length=500), nullable=True),
+    sa.Column('created', sa.DateTime(), nullable=False),
+    sa.Column('updated', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['booking_id'], ['rented.booking_id'], ondelete='SET NULL'),
+    sa.ForeignKeyConstraint(['reservation_id'], ['reservations.id'], ondelete='SET NULL'),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='SET NULL'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('idempotency_key'),
+    sa.UniqueConstraint('provider_id')
+    )
+    op.create_index('ix_payments_target', 'payments', ['target'], unique=False)
+    op.create_index('ix_payments_status_updated', 'payments', ['status', 'updated'], unique=False)
+    with op.batch_alter_table('users') as batch_op:
+        batch_op.add_column(sa.Column('stripe_customer_id', sa.String(length=100), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('users') as batch_op:
+        batch_op.drop_column('stripe_customer_id')
+    op.drop_index('ix_payments_status_updated', table_name='payments')
+    op.drop_index('ix_payments_target', table_name='payments')
+    op.drop_table('payments')
@@ -0,0 +1,121 @@
+import datetime
+import os
+import socket
+from types import SimpleNamespace
+import pytest
+from codes import create_app, db
+from codes.config import Config
+
+# The tests run on a SQLite file unless TEST_DB_URL points them to e.g. a PostgreSQL database made for them
+TEST_DB_URL = os.environ.get("TEST_DB_URL")
+
+
+@pytest.fixture
+def app_config():
+    """The config keys a test module changes, overridden by a fixture of the same name in the module"""
+    return {}
+
+
+@pytest.fixture
+def app(tmp_path, app_config):
+    """The app with empty tables, on a database of its own"""
+    settings = dict(
+        TESTING=True,
+        SECRET_KEY='test',
+        SQLALCHEMY_DATABASE_URI=TEST_DB_URL or f"sqlite:///{tmp_path / 'test.db'}",
+        SQLALCHEMY_ENGINE_OPTIONS={},
+        WTF_CSRF_ENABLED=False,
+        MAIL_SUPPRESS_SEND=False,
+        BCRYPT_LOG_ROUNDS=4,
+        PASSWORD_HASH_WORKERS=0,
+        RATELIMIT_BACKEND='none',
+        PAGE_CACHE_ENABLED=False,
+        USER_CACHE_BACKEND='none',
+        REFERENCE_VERSION_FILE=str(tmp_path / 'reference.version'),
+        FLEET_VERSION_FILE=str(tmp_path / 'fleet.version'),
+        USER_VERSION_FILE=str(tmp_path / 'user.version'),
+        STORAGE_ROOT=str(tmp_path / 'private'),
+    )
+    settings.update(app_config)
+    app = create_app(type('TestConfig', (Config,), settings))
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def seeded(app):
+    """A small synthetic fleet, see benchmarks.seed
+
+    Returns
+    ------------------
+    The dictionary of the number of rows added to each table"""
+
+    from benchmarks.seed import seed
+    return seed(cities=3, companies=3, models=5, categories=2, cars=30, users=10, bookings=300)
+
+
+@pytest.fixture
+def world(app):
+    """A city with its admin and a verified user, both with the password Bench@123"""
+    from codes.models import City, User
+    from codes.passwords import passwords
+    city = City(city='PUNE')
+    db.session.add(city)
+    db.session.flush()
+    password = passwords.hash('Bench@123')
+    admin = User(name='Admin', username='admin', email='admin@test.com', password=password, city_id=city.id,
+                 is_verified=True, is_admin=True)
+    user = User(name='User', username='user', email='user@test.com', password=password, city_id=city.id,
+                is_verified=True)
+    db.session.add_all([admin, user])
+    db.session.commit()
+    return SimpleNamespace(city=city, admin=admin, user=user)
+
+
+def add_car(world, number):
+    """Method for adding a car to the city of the world. Each car gets a company, a model and a category of its own, so
+    a page loading them one row at a time shows up in the number of queries."""
+    from codes.models import Car, CarCompany, CarModels, CarCategories
+    company, model = CarCompany(company_name=f'COMPANY{number}'), CarModels(model_name=f'MODEL{number}')
+    category = CarCategories(category=f'CATEGORY{number}')
+    db.session.add_all([company, model, category])
+    db.session.flush()
+    car = Car(car_id=f"MH12AB{number:04d}", company_id=company.id, model_id=model.id, category_id=category.id,
+              color='WHITE', mileage=15, ppd=1000, min_rent=1000, city_id=world.city.id, deposit=5000, status="true")
+    db.session.add(car)
+    db.session.commit()
+    return car
+
+
+def add_booking(car, user, rent_from, days=2, **columns):
+    """Method for adding a confirmed booking of a car"""
+    from codes.models import Rented
+    booking = Rented(carID=car.id, user_id=user.id, booking_time=datetime.datetime.now(), rented_from=rent_from,
+                     rented_till=rent_from + datetime.timedelta(days=days), city_taken_id=car.city_id,
+                     city_delivery_id=car.city_id, final_status="true", **columns)
+    db.session.add(booking)
+    db.session.commit()
+    return booking
+
+
+def login(client, email, password='Bench@123'):
+    """Method for logging a user in through the login form"""
+    response = client.post('/login', data=dict(email=email, password=password))
+    assert response.status_code == 302, "the login failed"
+    return response
+
+
+def free_port():
+    """Method for finding a port a stub server can listen on"""
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
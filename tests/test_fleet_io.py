@@ -0,0 +1,100 @@
+import csv
+import datetime
+import io
+import json
+import pytest
+from codes import db, fleet_io
+from codes.models import Car
+from .conftest import add_booking, add_car
+
+HEADER = "car_id,company,model,category,color,mileage,ppd,min_rent,deposit,city,status\n"
+
+
+def row(car_id, company='company1', ppd=1000, status='true'):
+    return f"{car_id},{company},model1,category1,white,15,{ppd},1000,5000,pune,{status}\n"
+
+
+def import_csv(text, **options):
+    return fleet_io.import_cars(io.BytesIO(text.encode()), 'csv', **options)
+
+
+def plates():
+    return [car.car_id for car in Car.query.order_by(Car.id)]
+
+
+def test_every_bad_row_is_reported_with_its_line_and_the_good_rows_are_added(world, monkeypatch):
+    add_car(world, 1)
+    report = import_csv(HEADER + row('MH12XY0001') + row('M') + row('MH12XY0002', company='nowhere') +
+                        row('MH12XY0003', ppd=-5, status='maybe') + row('MH12XY0004'))
+    assert (report.inserted, report.failed) == (2, 3)
+    assert report.errors == [
+        (3, "car_id should have between 2 and 20 characters"),
+        (4, "there is no company named 'nowhere'"),
+        (5, "status should be true or false; ppd should be a positive number"),
+    ]
+    assert plates() == ['MH12AB0001', 'MH12XY0001', 'MH12XY0004']
+
+    monkeypatch.setattr(fleet_io, 'MAX_ERRORS', 1)
+    report = import_csv(HEADER + row('M') + row('N'))
+    assert (report.failed, report.errors) == (2, [(2, "car_id should have between 2 and 20 characters")])
+
+
+def test_the_broken_lines_of_a_json_lines_file_are_reported(world):
+    add_car(world, 1)
+    lines = [json.dumps(dict(car_id='MH12XY0001', company='company1', model='model1', category='category1',
+                             color='white', mileage=15, ppd=1000, min_rent=1000, deposit=5000, city='pune')),
+             '{"car_id": ', '', '["MH12XY0002"]']
+    report = fleet_io.import_cars(io.BytesIO("\n".join(lines).encode()), 'jsonl')
+    assert report.inserted == 1
+    assert report.errors == [(2, "The line is not valid JSON!"), (4, "The line is not a JSON object!")]
+
+
+def test_duplicate_plates_in_the_file_and_in_the_database_are_refused(world):
+    add_car(world, 1)
+    report = import_csv(HEADER + row('MH12AB0001') + row('mh12 xy 0001') + row('MH12XY0001'))
+    assert report.inserted == 1
+    assert report.errors == [(2, "Car ID MH12AB0001 is already taken!"),
+                             (4, "car_id MH12XY0001 appears more than once in the file")]
+    assert plates() == ['MH12AB0001', 'MH12XY0001']
+
+
+def test_a_dry_run_checks_the_file_without_adding_anything(world):
+    add_car(world, 1)
+    report = import_csv(HEADER + row('MH12XY0001') + row('MH12AB0001') + row('MH12XY0002'), dry_run=True)
+    assert (report.inserted, report.failed) == (2, 1)
+    assert plates() == ['MH12AB0001']
+
+
+@pytest.mark.parametrize('batch_size', [1, 2, 3, 1000])
+def test_the_outcome_does_not_depend_on_the_batch_boundaries(world, batch_size):
+    add_car(world, 1)
+    text = HEADER + row('MH12XY0001') + row('MH12AB0001') + row('MH12XY0002') + row('MH12XY0001') + row('MH12XY0003')
+    report = import_csv(text, batch_size=batch_size)
+    assert report.inserted == 3
+    assert report.errors == [(3, "Car ID MH12AB0001 is already taken!"),
+                             (5, "car_id MH12XY0001 appears more than once in the file")]
+    assert plates() == ['MH12AB0001', 'MH12XY0001', 'MH12XY0002', 'MH12XY0003']
+
+
+@pytest.mark.parametrize('fmt', ['csv', 'jsonl'])
+def test_an_exported_fleet_imports_back_the_same(world, fmt):
+    for number in range(3):
+        add_car(world, number)
+    exported = "".join(fleet_io.export_cars(fmt))
+    Car.query.delete()
+    db.session.commit()
+    report = fleet_io.import_cars(io.BytesIO(exported.encode()), fmt)
+    assert (report.inserted, report.errors) == (3, [])
+    assert "".join(fleet_io.export_cars(fmt)) == exported
+
+
+def test_the_bookings_export_the_same_rows_as_csv_and_json_lines(world):
+    today = datetime.datetime.combine(datetime.date.today(), datetime.time())
+    first = add_booking(add_car(world, 1), world.user, today, fine=500)
+    second = add_booking(add_car(world, 2), world.user, today + datetime.timedelta(days=3))
+    rows = list(csv.DictReader(io.StringIO("".join(fleet_io.export_bookings('csv')))))
+    lines = [json.loads(line) for line in fleet_io.export_bookings('jsonl')]
+    assert [row['booking_id'] for row in rows] == [str(first.booking_id), str(second.booking_id)]
+    assert [{key: str(value) for key, value in line.items()} for line in lines] == rows
+    assert (rows[0]['car_id'], rows[0]['username'], rows[0]['city_taken'], rows[0]['fine']) == \
+        ('MH12AB0001', 'user', 'PUNE', '500')
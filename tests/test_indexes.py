@@ -0,0 +1,108 @@
+import datetime
+import re
+import pytest
+from sqlalchemy import event
+from codes import db
+from codes.availability import available_cars, is_car_available
+from codes.models import Car, Rented, User, UserVerification
+from .conftest import login
+
+
+def statements_of(function):
+    """Method for recording the statements a function sends to the database"""
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        function()
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+    return [(statement, parameters) for statement, parameters in statements
+            if statement.lstrip().upper().startswith('SELECT')]
+
+
+def plan_of(statement, parameters):
+    """Method for getting the plan of a statement as text, from EXPLAIN QUERY PLAN on SQLite and from EXPLAIN with the
+    sequential scans switched off on PostgreSQL, so the tiny test tables do not make a table scan the cheaper plan"""
+    with db.engine.connect() as connection:
+        if db.engine.dialect.name == 'postgresql':
+            connection.exec_driver_sql('SET enable_seqscan = off')
+            rows = connection.exec_driver_sql('EXPLAIN ' + statement, parameters).fetchall()
+            return '\n'.join(row[0] for row in rows)
+        rows = connection.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters).fetchall()
+        return '\n'.join(row[-1] for row in rows)
+
+
+def assert_uses_index(function, table, index):
+    """Method for checking that every select of a function reads the table through the index and never scans it"""
+    plans = [plan_of(*statement) for statement in statements_of(function)]
+    plans = [plan for plan in plans if table in plan]
+    assert plans, f"no statement read {table}"
+    for plan in plans:
+        # a SCAN of SQLite through a partial index only reads the rows of the index
+        scans = [line for line in plan.splitlines()
+                 if f'Seq Scan on {table}' in line or re.search(rf'SCAN {table}( AS \w+)?$', line.strip())]
+        assert not scans, plan
+        assert index in plan, plan
+
+
+@pytest.fixture
+def period():
+    today = datetime.datetime.combine(datetime.date.today(), datetime.time())
+    return today + datetime.timedelta(days=3), today + datetime.timedelta(days=6)
+
+
+def test_car_availability_uses_the_partial_booking_index(seeded, period):
+    car = Car.query.first()
+    assert_uses_index(lambda: is_car_available(car.id, *period), 'rented', 'ix_rented_car_period')
+
+
+def test_available_cars_use_the_city_and_booking_indexes(seeded, period):
+    car = Car.query.first()
+    assert_uses_index(lambda: available_cars(car.city_id, *period).all(), 'rented', 'ix_rented_car_period')
+    assert_uses_index(lambda: available_cars(car.city_id, *period).all(), 'cars', 'ix_cars_city_status')
+
+
+def test_the_bookings_page_and_its_next_page_use_the_booking_time_index(seeded, client):
+    user = User.query.filter_by(is_admin=False).order_by(User.id).first()
+    login(client, user.email)
+    assert_uses_index(lambda: client.get('/bookings'), 'rented', 'ix_rented_user_booking_time')
+    cursor = re.search(r'cursor=([\w.-]+)', client.get('/bookings').get_data(as_text=True)).group(1)
+    assert_uses_index(lambda: client.get(f'/bookings?cursor={cursor}'), 'rented', 'ix_rented_user_booking_time')
+
+
+def test_pickups_and_returns_use_the_partial_manifest_indexes(seeded):
+    car = Car.query.first()
+    assert_uses_index(lambda: Rented.query.filter(Rented.final_status == "true").filter_by(car_taken=False)
+                      .filter(Rented.city_taken_id == car.city_id).all(), 'rented', 'ix_rented_taking')
+    assert_uses_index(lambda: Rented.query.filter(Rented.final_status == "true").filter_by(car_taken=True)
+                      .filter_by(car_delivery=False).filter(Rented.city_delivery_id == car.city_id).all(),
+                      'rented', 'ix_rented_delivery')
+
+
+@pytest.mark.parametrize('url', ['/cars_taking_list', '/cars_delivery_list', '/cars_taking_list_late',
+                                 '/cars_delivery_list_late'])
+def test_the_manifest_lists_use_the_manifest_index(seeded, client, url):
+    admin = User.query.filter_by(is_admin=True).order_by(User.id).first()
+    login(client, admin.email)
+    assert_uses_index(lambda: client.get(url), 'manifest_entries', 'ix_manifest_city_kind_day')
+
+
+def test_the_users_to_verify_list_uses_the_pending_index(seeded, client):
+    for number, user in enumerate(User.query.filter_by(is_admin=False)):
+        db.session.add(UserVerification(user_id=user.id, id_proof=f'proof{number}.png', date=datetime.date.today(),
+                                        approval="" if number % 2 else "approved"))
+    db.session.commit()
+    login(client, User.query.filter_by(is_admin=True).first().email)
+    assert_uses_index(lambda: client.get('/display_users_list'), 'user_verification', 'ix_user_verification_pending')
+
+
+def test_pending_verification_uses_the_partial_index(seeded):
+    user = User.query.filter_by(is_admin=False).first()
+    db.session.add(UserVerification(user_id=user.id, id_proof='proof.png', approval="", date=datetime.date.today()))
+    db.session.commit()
+    assert_uses_index(lambda: UserVerification.query.filter_by(user_id=user.id)
+                      .filter(UserVerification.approval == "").first(), 'user_verification',
+                      'ix_user_verification_pending')
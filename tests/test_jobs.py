@@ -0,0 +1,74 @@
+import datetime
+import pytest
+from aiosmtpd.controller import Controller
+from codes import db
+from codes.jobs.queue import enqueue, work
+from codes.models import Job
+from .conftest import free_port
+
+
+class Inbox:
+    """Handler of the SMTP stub, keeping the messages it is sent. It answers the first `refuse` of them with a
+    temporary failure, like a busy mail server."""
+
+    def __init__(self, refuse=0):
+        self.refuse = refuse
+        self.messages = []
+
+    async def handle_DATA(self, server, session, envelope):
+        if self.refuse:
+            self.refuse -= 1
+            return '451 4.3.0 Try again later'
+        self.messages.append(envelope)
+        return '250 OK'
+
+
+@pytest.fixture
+def smtp():
+    controller = Controller(Inbox(), hostname='127.0.0.1', port=free_port())
+    controller.start()
+    yield controller
+    controller.stop()
+
+
+@pytest.fixture
+def app_config(smtp):
+    return dict(MAIL_SERVER=smtp.hostname, MAIL_PORT=smtp.port, MAIL_USE_TLS=False, MAIL_USERNAME=None,
+                MAIL_PASSWORD=None)
+
+
+def send_test_email():
+    job = enqueue('send_email', subject='Password Reset Request', recipients=['user@test.com'], body='Hello')
+    db.session.commit()
+    return job.id
+
+
+def test_enqueue_leaves_the_commit_to_the_caller(app):
+    from codes.jobs import tasks  # noqa: F401, registers the jobs
+    enqueue('send_email', subject='Lost', recipients=['user@test.com'], body='Hello')
+    db.session.rollback()
+    assert Job.query.count() == 0
+
+
+def test_worker_delivers_the_email(app, smtp):
+    job_id = send_test_email()
+    work(burst=True)
+    assert [message.rcpt_tos for message in smtp.handler.messages] == [['user@test.com']]
+    assert b'Password Reset Request' in smtp.handler.messages[0].content
+    assert Job.query.get(job_id).status == 'done'
+
+
+def test_worker_retries_the_email_the_server_refused(app, smtp):
+    smtp.handler.refuse = 1
+    job_id = send_test_email()
+    work(burst=True)
+    job = Job.query.get(job_id)
+    assert job.status == 'queued' and job.attempts == 1 and smtp.handler.messages == []
+    assert job.run_at > datetime.datetime.utcnow()
+
+    job.run_at = datetime.datetime.utcnow()
+    db.session.commit()
+    work(burst=True)
+    job = Job.query.get(job_id)
+    assert job.status == 'done' and job.attempts == 2
+    assert len(smtp.handler.messages) == 1
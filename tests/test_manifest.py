@@ -0,0 +1,23 @@
+import datetime
+from codes import manifest
+from codes.models import ManifestEntry
+from .conftest import add_booking, add_car, login
+
+
+def test_taking_a_car_twice_moves_it_once(client, world):
+    today = datetime.datetime.combine(datetime.date.today(), datetime.time())
+    booking = add_booking(add_car(world, 1), world.user, today)
+    manifest.rebuild()
+    login(client, world.admin.email)
+    for _ in range(2):
+        assert client.get(f'/car_taken/{booking.booking_id}').status_code == 302
+    entries = ManifestEntry.query.filter_by(booking_id=booking.booking_id).all()
+    assert [entry.kind for entry in entries] == [manifest.RETURN]
+
+
+def test_adding_an_entry_twice_keeps_one(world):
+    today = datetime.datetime.combine(datetime.date.today(), datetime.time())
+    booking = add_booking(add_car(world, 1), world.user, today)
+    manifest.booking_confirmed(booking)
+    manifest.booking_confirmed(booking)
+    assert ManifestEntry.query.filter_by(booking_id=booking.booking_id).count() == 1
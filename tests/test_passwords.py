@@ -0,0 +1,35 @@
+import time
+import pytest
+from codes.passwords import PasswordHasher, PasswordServiceBusy
+
+
+@pytest.fixture
+def hasher():
+    hasher = PasswordHasher()
+    hasher.rounds, hasher.workers, hasher.timeout = 4, 1, 0.5
+    yield hasher
+    if hasher._pool is not None:
+        hasher._pool.shutdown(wait=False, cancel_futures=True)
+
+
+def test_the_pool_hashes_and_checks(hasher):
+    hashed = hasher.hash('Bench@123')
+    assert hasher.check(hashed, 'Bench@123') and not hasher.check(hashed, 'wrong')
+
+
+def test_a_saturated_pool_is_busy(hasher):
+    _, slots = hasher._executor()
+    for _ in range(2):
+        slots.acquire()
+    with pytest.raises(PasswordServiceBusy):
+        hasher.hash('Bench@123')
+
+
+def test_a_slow_pool_is_busy(hasher):
+    hasher._run(time.sleep, 0)  # starts the worker process
+    started = time.monotonic()
+    with pytest.raises(PasswordServiceBusy):
+        hasher._run(time.sleep, 2)
+    assert time.monotonic() - started < 1.5
+    # the slot of the hash which timed out is given back
+    assert hasher._slots.acquire(blocking=False) and hasher._slots.acquire(blocking=False)
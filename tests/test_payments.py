@@ -0,0 +1,187 @@
+import datetime
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+import stripe
+from benchmarks import upstream_stubs
+from benchmarks.upstream_stubs import StripeHandler, DECLINED_TOKEN, signed_event
+from codes import db, payments, reservations
+from codes.jobs.queue import enqueue, work
+from codes.models import Payment, Rented, Reservation, User
+from .conftest import add_booking, add_car, free_port, login
+
+WEBHOOK_SECRET = 'whsec_test'
+
+
+@pytest.fixture
+def app_config():
+    return dict(STRIPE_WEBHOOK_SECRET=WEBHOOK_SECRET)
+
+
+@pytest.fixture
+def stripe_stub(app, monkeypatch):
+    """The fake of the Stripe API, with the objects of the previous test forgotten"""
+    StripeHandler.objects.clear()
+    StripeHandler.idempotent.clear()
+    port = free_port()
+    servers = upstream_stubs.start(port, free_port())
+    monkeypatch.setattr(stripe, 'api_base', f'http://127.0.0.1:{port}')
+    monkeypatch.setattr(stripe, 'api_key', 'sk_test_stub')
+    yield StripeHandler
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def stripe_objects(kind):
+    return [obj for obj in StripeHandler.objects.values() if obj['object'] == kind]
+
+
+def hold_a_car(world, number=1, user=None):
+    car = add_car(world, number)
+    rent_from = datetime.datetime.combine(datetime.date.today(), datetime.time()) + datetime.timedelta(days=5)
+    return reservations.hold_car(car.id, user or world.user, rent_from, rent_from + datetime.timedelta(days=2),
+                                 world.city.id)
+
+
+def lose_answers(monkeypatch, reach_stripe=True):
+    """Method for making the calls creating a PaymentIntent fail as if the connection dropped, after Stripe has made
+    the payment if reach_stripe is True"""
+    create = stripe.PaymentIntent.create
+
+    def lost(**params):
+        if reach_stripe:
+            create(**params)
+        raise stripe.error.APIConnectionError("The connection was reset")
+
+    monkeypatch.setattr(stripe.PaymentIntent, 'create', lost)
+    return lambda: monkeypatch.setattr(stripe.PaymentIntent, 'create', create)
+
+
+def post_webhook(client, event_type, obj):
+    payload, headers = signed_event(WEBHOOK_SECRET, event_type, obj)
+    return client.post('/stripe/webhook', data=payload, headers=headers)
+
+
+def test_a_double_submit_charges_once(app, client, world, stripe_stub):
+    hold_id = hold_a_car(world).id
+    login(client, world.user.email)
+    for _ in range(2):
+        assert client.post(f'/charge/{hold_id}', data=dict(stripeToken='tok_visa')).status_code == 302
+    assert len(stripe_objects('payment_intent')) == 1
+    assert [payment.status for payment in Payment.query.all()] == ['succeeded']
+    assert Rented.query.count() == 1
+
+
+def test_concurrent_submits_charge_once(app, world, stripe_stub):
+    hold_id, user_id = hold_a_car(world).id, world.user.id
+    barrier = threading.Barrier(2)
+
+    def pay(_):
+        with app.app_context():
+            hold, user = Reservation.query.get(hold_id), User.query.get(user_id)
+            barrier.wait()
+            payment_id = payments.pay_for_hold(hold, user, 'tok_visa').id
+            db.session.remove()
+            return payment_id
+
+    with ThreadPoolExecutor(2) as pool:
+        assert len(set(pool.map(pay, range(2)))) == 1
+    assert len(stripe_objects('payment_intent')) == 1
+    assert Payment.query.count() == 1 and Rented.query.count() == 1
+
+
+def test_a_declined_card_raises_and_the_next_card_pays(app, world, stripe_stub):
+    hold = hold_a_car(world)
+    with pytest.raises(payments.PaymentError):
+        payments.pay_for_hold(hold, world.user, DECLINED_TOKEN)
+    assert Payment.query.one().status == 'failed' and Rented.query.count() == 0
+
+    payment = payments.pay_for_hold(hold, world.user, 'tok_visa')
+    assert payment.status == 'succeeded' and payment.idempotency_key == f'hold:{hold.id}:2'
+    assert Rented.query.one().payment_intent == payment.provider_id
+
+
+@pytest.mark.parametrize('webhook_first', [False, True])
+def test_the_webhook_and_the_charge_confirm_once_in_any_order(app, client, world, stripe_stub, monkeypatch,
+                                                             webhook_first):
+    hold_id = hold_a_car(world).id
+    login(client, world.user.email)
+    if webhook_first:
+        # the answer of the charge is lost, the payment waits for the webhook
+        restore = lose_answers(monkeypatch)
+        client.post(f'/charge/{hold_id}', data=dict(stripeToken='tok_visa'))
+        restore()
+        assert Payment.query.one().status == 'pending'
+    else:
+        client.post(f'/charge/{hold_id}', data=dict(stripeToken='tok_visa'))
+    [intent] = stripe_objects('payment_intent')
+    assert post_webhook(client, 'payment_intent.succeeded', intent).status_code == 200
+    client.post(f'/charge/{hold_id}', data=dict(stripeToken='tok_visa'))
+    assert post_webhook(client, 'payment_intent.succeeded', intent).status_code == 200
+
+    assert len(stripe_objects('payment_intent')) == 1
+    payment = Payment.query.one()
+    assert (payment.status, payment.provider_id) == ('succeeded', intent['id'])
+    assert Rented.query.one().booking_id == payment.booking_id
+
+
+def test_a_lost_answer_is_found_on_stripe_instead_of_charging_again(app, world, stripe_stub, monkeypatch):
+    hold = hold_a_car(world)
+    restore = lose_answers(monkeypatch)
+    assert payments.pay_for_hold(hold, world.user, 'tok_first').status == 'pending'
+    restore()
+    payment = payments.pay_for_hold(hold, world.user, 'tok_second')
+    assert payment.status == 'succeeded' and payment.idempotency_key == f'hold:{hold.id}:1'
+    assert len(stripe_objects('payment_intent')) == 1 and Rented.query.count() == 1
+
+
+def test_a_call_which_never_reached_stripe_starts_a_new_attempt(app, world, stripe_stub, monkeypatch):
+    hold = hold_a_car(world)
+    restore = lose_answers(monkeypatch, reach_stripe=False)
+    assert payments.pay_for_hold(hold, world.user, 'tok_first').status == 'pending'
+    restore()
+    payment = payments.pay_for_hold(hold, world.user, 'tok_second')
+    assert payment.status == 'succeeded' and payment.idempotency_key == f'hold:{hold.id}:2'
+    assert [payment.status for payment in Payment.query.order_by(Payment.id)] == ['failed', 'succeeded']
+    assert len(stripe_objects('payment_intent')) == 1 and Rented.query.count() == 1
+
+
+def test_an_expired_hold_taken_by_someone_else_is_refunded(app, client, world, stripe_stub):
+    hold = hold_a_car(world)
+    hold.expires_at = datetime.datetime.utcnow() - datetime.timedelta(minutes=1)
+    db.session.commit()
+    add_booking(hold.car, world.admin, hold.rented_from)
+    hold_id, user_id = hold.id, world.user.id
+    login(client, world.user.email)
+    client.post(f'/charge/{hold_id}', data=dict(stripeToken='tok_visa'))
+    assert Payment.query.one().status == 'refunding'
+
+    work(burst=True)
+    payment = Payment.query.one()
+    assert payment.status == 'refunded' and payment.booking_id is None
+    assert [refund['payment_intent'] for refund in stripe_objects('refund')] == [payment.provider_id]
+    assert Reservation.query.get(hold_id).status == 'cancelled'
+    assert Rented.query.filter_by(user_id=user_id).count() == 0
+
+
+def test_the_reconcile_job_settles_the_pending_payments(app, world, stripe_stub, monkeypatch):
+    from codes.jobs import tasks  # noqa: F401, registers the jobs
+    paid = hold_a_car(world, 1)
+    restore = lose_answers(monkeypatch)
+    payments.pay_for_hold(paid, world.user, 'tok_visa')
+    restore()
+    forgotten = hold_a_car(world, 2, user=world.admin)
+    payment = payments._start(world.admin.id, payments.BOOKING, f'hold:{forgotten.id}', 100,
+                              reservation_id=forgotten.id)
+    payment.created -= payments.GIVE_UP_AFTER + datetime.timedelta(hours=1)
+    db.session.commit()
+    paid_id, forgotten_id, user_id = paid.id, forgotten.id, world.user.id
+
+    enqueue('reconcile_payments')
+    db.session.commit()
+    work(burst=True)
+    statuses = {payment.reservation_id: payment.status for payment in Payment.query.all()}
+    assert statuses == {paid_id: 'succeeded', forgotten_id: 'failed'}
+    assert [booking.user_id for booking in Rented.query.all()] == [user_id]
+    assert payments.reconcile() == 0
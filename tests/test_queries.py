@@ -0,0 +1,64 @@
+import datetime
+from codes import manifest
+from codes.loaders import count_queries, assert_max_queries
+from codes.search_context import make_token
+from .conftest import add_booking, add_car, login
+
+
+def queries_of(client, url):
+    """Method for counting the queries of rendering a page"""
+    with count_queries() as statements:
+        response = client.get(url)
+    assert response.status_code == 200, response.status_code
+    return len(statements)
+
+
+def assert_constant_queries(client, url, add_rows):
+    """Method for checking that a page takes as many queries with a single row as with a full page of rows"""
+    add_rows(1)
+    single = queries_of(client, url)
+    add_rows(4)
+    with assert_max_queries(single):
+        assert client.get(url).status_code == 200
+
+
+def tomorrow():
+    return datetime.datetime.combine(datetime.date.today(), datetime.time()) + datetime.timedelta(days=1)
+
+
+def test_home_listing_takes_constant_queries(client, world):
+    cars = []
+    assert_constant_queries(client, '/home', lambda count: cars.extend(add_car(world, len(cars) + i)
+                                                                       for i in range(count)))
+
+
+def test_available_cars_listing_takes_constant_queries(client, world):
+    login(client, world.user.email)
+    rent_from = tomorrow() + datetime.timedelta(days=10)
+    token = make_token(world.user.id, rent_from, rent_from + datetime.timedelta(days=2), world.city.id)
+    cars = []
+    assert_constant_queries(client, f'/home?search={token}', lambda count: cars.extend(
+        add_car(world, len(cars) + i) for i in range(count)))
+
+
+def test_bookings_listing_takes_constant_queries(client, world):
+    login(client, world.user.email)
+    made = []
+
+    def add_rows(count):
+        for _ in range(count):
+            car = add_car(world, len(made))
+            made.append(add_booking(car, world.user, tomorrow() + datetime.timedelta(days=3 * len(made))))
+    assert_constant_queries(client, '/bookings', add_rows)
+
+
+def test_admin_manifest_listing_takes_constant_queries(client, world):
+    login(client, world.admin.email)
+    made = []
+
+    def add_rows(count):
+        for _ in range(count):
+            car = add_car(world, len(made))
+            made.append(add_booking(car, world.user, datetime.datetime.combine(datetime.date.today(), datetime.time())))
+        manifest.rebuild()
+    assert_constant_queries(client, '/cars_taking_list', add_rows)
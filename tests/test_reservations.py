@@ -0,0 +1,83 @@
+import datetime
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from codes import db, reservations
+from codes.models import Reservation, User
+from codes.search_context import make_token
+from .conftest import add_car, login
+
+
+def book_url(world, car):
+    rent_from = datetime.datetime.combine(datetime.date.today(), datetime.time()) + datetime.timedelta(days=5)
+    token = make_token(world.user.id, rent_from, rent_from + datetime.timedelta(days=2), world.city.id)
+    return f'/book_car/{car.id}?search={token}'
+
+
+def test_opening_book_car_holds_nothing(client, world):
+    car = add_car(world, 1)
+    login(client, world.user.email)
+    response = client.get(book_url(world, car))
+    assert response.status_code == 200 and b'Confirm Car!' in response.data
+    assert Reservation.query.count() == 0
+
+
+def test_confirming_holds_the_car_and_goes_to_the_payment(client, world):
+    car = add_car(world, 1)
+    login(client, world.user.email)
+    response = client.post(book_url(world, car))
+    hold = Reservation.query.one()
+    assert response.status_code == 302 and response.location.endswith(f'/index/{hold.id}')
+    assert (hold.carID, hold.user_id, hold.status) == (car.id, world.user.id, 'held')
+
+
+def test_a_user_only_holds_one_car_at_a_time(client, world):
+    cars = [add_car(world, number) for number in range(3)]
+    login(client, world.user.email)
+    for car in cars:
+        assert client.post(book_url(world, car)).status_code == 302
+    held = Reservation.query.filter_by(status='held').all()
+    assert [hold.carID for hold in held] == [cars[-1].id]
+    assert Reservation.query.filter_by(status='cancelled').count() == 2
+
+
+def test_two_concurrent_holds_of_a_car_have_one_winner(app, world, monkeypatch):
+    car_id, city_id, user_ids = add_car(world, 1).id, world.city.id, [world.user.id, world.admin.id]
+    rent_from = datetime.datetime.combine(datetime.date.today(), datetime.time()) + datetime.timedelta(days=5)
+    rent_till = rent_from + datetime.timedelta(days=2)
+    is_car_available = reservations.is_car_available
+
+    def slow_is_car_available(*args):
+        # widens the time between the check and the insert of a hold
+        time.sleep(0.2)
+        return is_car_available(*args)
+
+    monkeypatch.setattr(reservations, 'is_car_available', slow_is_car_available)
+    barrier = threading.Barrier(2)
+
+    def hold(user_id):
+        with app.app_context():
+            user = User.query.get(user_id)
+            barrier.wait()
+            hold = reservations.hold_car(car_id, user, rent_from, rent_till, city_id)
+            held = hold is not None
+            db.session.remove()
+            return held
+
+    with ThreadPoolExecutor(2) as pool:
+        results = list(pool.map(hold, user_ids))
+    assert sorted(results) == [False, True]
+    assert Reservation.query.filter_by(carID=car_id, status='held').count() == 1
+
+
+def test_a_hold_of_the_user_does_not_block_his_new_dates(app, world):
+    car = add_car(world, 1)
+    rent_from = datetime.datetime.combine(datetime.date.today(), datetime.time()) + datetime.timedelta(days=5)
+    first = reservations.hold_car(car.id, world.user, rent_from, rent_from + datetime.timedelta(days=2), world.city.id)
+    rent_from += datetime.timedelta(days=1)
+    second = reservations.hold_car(car.id, world.user, rent_from, rent_from + datetime.timedelta(days=2),
+                                   world.city.id)
+    assert second is not None and second.id != first.id
+    assert Reservation.query.get(first.id).status == 'cancelled'
+    assert reservations.hold_car(car.id, world.admin, rent_from, rent_from + datetime.timedelta(days=2),
+                                 world.city.id) is None
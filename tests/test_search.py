@@ -0,0 +1,68 @@
+import io
+from codes import db, fleet_io
+from codes.models import Car, CarCompany, CarModels
+from codes.search import refresh_search_documents, search_cars
+from .conftest import add_car, login
+
+
+def add_named_car(world, number, company, model, color):
+    car = add_car(world, number)
+    for model_class, column, key, name in ((CarCompany, 'company_name', 'company_id', company),
+                                           (CarModels, 'model_name', 'model_id', model)):
+        row = model_class.query.filter_by(**{column: name}).first()
+        if row is None:
+            setattr(model_class.query.get(getattr(car, key)), column, name)
+        else:
+            setattr(car, key, row.id)
+    car.color = color
+    refresh_search_documents(Car.id == car.id)
+    db.session.commit()
+    return car
+
+
+def searched(text):
+    return [car.car_id for car in search_cars(Car.query, text)]
+
+
+def test_the_cars_matching_more_words_rank_first(world):
+    red_honda = add_named_car(world, 1, 'HONDA', 'CITY', 'RED')
+    white_honda = add_named_car(world, 2, 'HONDA', 'JAZZ', 'WHITE')
+    red_maruti = add_named_car(world, 3, 'MARUTI', 'SWIFT', 'RED')
+    assert red_honda.search_text == 'HONDA CITY CATEGORY1 PUNE RED'
+    assert searched('honda, red') == [red_honda.car_id, white_honda.car_id, red_maruti.car_id]
+    assert searched('Swift red') == [red_maruti.car_id, red_honda.car_id]
+    # a part of a word matches, like the trigram index, and a word repeated counts once
+    assert searched('hon HONDA') == [red_honda.car_id, white_honda.car_id]
+
+
+def test_nothing_matches_no_words_or_a_wildcard(world):
+    add_named_car(world, 1, 'HONDA', 'CITY', 'RED')
+    assert searched('  ') == []
+    assert searched('%') == [] and searched('_') == []
+    assert searched('toyota') == []
+
+
+def test_creating_and_editing_a_car_refresh_its_search_document(client, world):
+    car = add_named_car(world, 1, 'HONDA', 'CITY', 'RED')
+    login(client, world.admin.email)
+    response = client.post('/create_cars', data=dict(
+        car_id='MH 12 XY 9999', company_id=car.company_id, category_id=car.category_id, model_id=car.model_id,
+        color='dark blue', mileage=15, ppd=1000, min_rent=1000, deposit=5000, city_id=world.city.id))
+    assert response.status_code == 302
+    assert searched('darkblue') == ['MH12XY9999']
+
+    response = client.post('/update_car?car_id=MH12XY9999', data=dict(
+        color='green', mileage=15, ppd=1000, min_rent=1000, deposit=5000, city_id=world.city.id, status='true'))
+    assert response.status_code == 302
+    assert searched('darkblue') == [] and searched('green') == ['MH12XY9999']
+    assert Car.query.filter_by(car_id='MH12XY9999').one().search_text == 'HONDA CITY CATEGORY1 PUNE GREEN'
+
+
+def test_imported_cars_get_their_search_document(world):
+    add_named_car(world, 1, 'HONDA', 'CITY', 'RED')
+    fleet = ("car_id,company,model,category,color,mileage,ppd,min_rent,deposit,city\n"
+             "MH12XY0001,honda,city,category1,silver,15,1000,1000,5000,pune\n")
+    report = fleet_io.import_cars(io.BytesIO(fleet.encode()), 'csv')
+    assert (report.inserted, report.errors) == (1, [])
+    assert searched('silver') == ['MH12XY0001']
+    assert Car.query.filter_by(car_id='MH12XY0001').one().search_text == 'HONDA CITY CATEGORY1 PUNE SILVER'
@@ -0,0 +1,61 @@
+import io
+import os
+import pytest
+from flask_login import login_user
+from PIL import Image
+from werkzeug.datastructures import FileStorage
+from codes.storage import storage, ID_PROOFS
+from .conftest import login
+
+
+@pytest.fixture
+def app_config():
+    return dict(STORAGE_DELIVERY='x-accel-redirect')
+
+
+@pytest.fixture
+def proof(app):
+    buffer = io.BytesIO()
+    Image.new('RGB', (40, 30), 'red').save(buffer, 'PNG')
+    buffer.seek(0)
+    name, _ = storage.put(ID_PROOFS, FileStorage(buffer, filename='proof.png'))
+    return f'{ID_PROOFS}/{name}'
+
+
+def signed_url(app, user, key):
+    with app.test_request_context():
+        login_user(user)
+        return storage.url(key)
+
+
+def test_the_signed_url_is_sent_from_the_internal_location(app, client, world, proof):
+    url = signed_url(app, world.admin, proof)
+    login(client, world.admin.email)
+    response = client.get(url)
+    assert url.startswith('/private/')
+    assert response.status_code == 200
+    assert response.headers['X-Accel-Redirect'] == '/_protected/' + proof
+
+
+def test_the_signed_url_only_opens_for_its_admin(app, client, world, proof):
+    url = signed_url(app, world.admin, proof)
+    login(client, world.user.email)
+    assert client.get(url).status_code == 403
+
+
+def test_the_id_proofs_are_not_in_the_static_folder(client, proof):
+    assert client.get('/static/' + proof).status_code == 404
+
+
+def test_files_left_in_the_static_folder_are_not_served(app, client):
+    directory = os.path.join(app.static_folder, ID_PROOFS)
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, 'left_behind_test.png')
+    with open(path, 'wb') as f:
+        f.write(b'proof')
+    try:
+        assert client.get(f'/static/{ID_PROOFS}/left_behind_test.png').status_code == 404
+        assert client.get(f'/static//{ID_PROOFS}/left_behind_test.png').status_code in (308, 404)
+        assert client.get(f'/static/dist/../{ID_PROOFS}/left_behind_test.png').status_code == 404
+    finally:
+        os.remove(path)
@@ -0,0 +1,76 @@
+import io
+import pytest
+from PIL import Image
+from werkzeug.datastructures import FileStorage
+from codes import db, uploads
+from codes.jobs.queue import enqueue, work
+from codes.models import Job, UserVerification
+from codes.storage import storage, ID_PROOFS
+from codes.uploads import store_upload, make_variants, variant_name, UploadTooLarge, UnsupportedUpload
+from .conftest import login
+
+
+def image_bytes(fmt='JPEG', size=(40, 30)):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, 'red').save(buffer, fmt)
+    return buffer.getvalue()
+
+
+def upload(content, filename):
+    return FileStorage(io.BytesIO(content), filename=filename)
+
+
+def test_same_image_with_another_extension_is_stored_once(tmp_path):
+    content = image_bytes()
+    first, first_new = store_upload(upload(content, 'proof.jpeg'), str(tmp_path))
+    second, second_new = store_upload(upload(content, 'PROOF.JPG'), str(tmp_path))
+    assert first == second and first.endswith('.jpg')
+    assert first_new and not second_new
+    assert sorted(path.name for path in tmp_path.iterdir()) == [first]
+
+
+def test_extension_follows_the_content_not_the_name(tmp_path):
+    name, _ = store_upload(upload(image_bytes('PNG'), 'proof.jpg'), str(tmp_path))
+    assert name.endswith('.png')
+
+
+def test_refused_uploads_leave_no_file(tmp_path):
+    with pytest.raises(UploadTooLarge):
+        store_upload(upload(image_bytes(), 'proof.jpg'), str(tmp_path), max_bytes=10)
+    with pytest.raises(UnsupportedUpload):
+        store_upload(upload(b'not an image', 'proof.png'), str(tmp_path))
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_apply_for_verification_shows_the_upload_error_on_the_form(client, world):
+    login(client, world.user.email)
+    response = client.post('/verify_account', data=dict(id_proof=(io.BytesIO(b'not an image'), 'proof.png')),
+                           content_type='multipart/form-data')
+    assert response.status_code == 200
+    assert b'The file is not an image which can be read!' in response.data
+    assert UserVerification.query.count() == 0
+
+
+def test_only_the_formats_without_draft_are_refused_for_their_pixels(tmp_path, monkeypatch):
+    monkeypatch.setattr(uploads, 'MAX_PIXELS', 1000)
+    with pytest.raises(UploadTooLarge):
+        store_upload(upload(image_bytes('PNG'), 'proof.png'), str(tmp_path))
+    name, _ = store_upload(upload(image_bytes('JPEG', (1200, 900)), 'proof.jpg'), str(tmp_path))
+    make_variants(name, str(tmp_path))
+    with Image.open(tmp_path / variant_name(name, 'large', 'jpg')) as large:
+        assert large.size == (1000, 750)
+
+
+def test_an_image_which_cannot_be_decoded_fails_its_job_at_once(app):
+    from codes.jobs import tasks  # noqa: F401, registers the jobs
+    directory = storage.directory(ID_PROOFS)
+    name, _ = store_upload(upload(image_bytes('PNG'), 'proof.png'), directory)
+    with open(f"{directory}/{name}", 'r+b') as stored:
+        stored.truncate(60)
+    with pytest.raises(UnsupportedUpload):
+        make_variants(name, directory)
+    job_id = enqueue('process_id_proof', filename=name).id
+    db.session.commit()
+    work(burst=True)
+    job = Job.query.get(job_id)
+    assert job.status == 'failed' and job.attempts == 1
@@ -0,0 +1,83 @@
+import pytest
+from codes import db, user_cache as user_cache_module
+from codes.loaders import count_queries
+from codes.models import User, UserVerification
+from codes.user_cache import user_cache, UserCache, MemoryBackend
+from .conftest import login
+
+
+@pytest.fixture
+def app_config():
+    return dict(USER_CACHE_BACKEND='memory')
+
+
+def test_a_user_changed_by_another_process_is_loaded_again(app, world):
+    assert user_cache.load(world.user.id).fine_pending is False
+    # the job worker, a process with a memory cache of its own sharing the version file
+    worker_cache = UserCache(app)
+    db.session.execute(User.__table__.update().values(fine_pending=True).where(User.id == world.user.id))
+    db.session.commit()
+    worker_cache.invalidate(world.user.id)
+    assert user_cache.load(world.user.id).fine_pending is True
+
+
+def test_a_cache_hit_serves_current_user_without_a_query(client, world):
+    user_id, city_id = world.user.id, world.city.id
+    login(client, world.user.email)
+    client.get('/taking_dates')
+    # the requests share the session of the test, which must not answer from its identity map
+    db.session.expunge_all()
+    with count_queries() as statements:
+        assert client.get('/taking_dates').status_code == 200
+    assert not [statement for statement in statements if 'FROM users' in statement]
+    with count_queries() as statements:
+        user = user_cache.load(user_id)
+        assert (user.name, user.email, user.is_admin, user.city_id) == ('User', 'user@test.com', False, city_id)
+    assert statements == []
+
+
+def test_a_committed_change_of_the_user_is_loaded_again(app, world):
+    user_id = world.user.id
+    assert user_cache.load(user_id).name == 'User'
+    User.query.get(user_id).name = 'Renamed'
+    db.session.flush()
+    # only the commit drops the cached user, a change rolled back leaves it cached
+    db.session.rollback()
+    assert user_cache.backend.get(user_id) is not None
+    User.query.get(user_id).name = 'Renamed'
+    db.session.commit()
+    assert user_cache.backend.get(user_id) is None
+    assert user_cache.load(user_id).name == 'Renamed'
+
+
+def test_the_memory_backend_drops_the_expired_and_the_least_recently_used(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(user_cache_module.time, 'monotonic', lambda: now[0])
+    backend = MemoryBackend(max_size=2)
+    backend.set(1, {'id': 1}, ttl=60)
+    backend.set(2, {'id': 2}, ttl=60)
+    assert backend.get(1) == {'id': 1}
+    backend.set(3, {'id': 3}, ttl=10)
+    assert backend.get(2) is None and backend.get(1) == {'id': 1}
+    now[0] += 30
+    assert backend.get(3) is None and backend.get(1) == {'id': 1}
+    now[0] += 31
+    assert backend.get(1) is None
+
+
+def test_the_cached_user_loads_the_row_for_relationships_and_changes(app, world):
+    db.session.add(UserVerification(user_id=world.user.id, id_proof='proof.png', approval=""))
+    db.session.commit()
+    user_id, city = world.user.id, world.city.city
+    user_cache.load(user_id)
+    db.session.expunge_all()
+    cached = user_cache.load(user_id)
+    with count_queries() as statements:
+        assert cached.city.city == city
+        assert cached.users_verify.id_proof == 'proof.png'
+    assert len(statements) == 3
+    cached.fine_pending = True
+    assert cached.fine_pending is True
+    db.session.commit()
+    assert User.query.get(user_id).fine_pending is True
+    assert user_cache.load(user_id).fine_pending is True
@@ -0,0 +1,61 @@
+from codes import db, validations
+from codes.loaders import count_queries
+from codes.models import Car, User
+from codes.users.forms import RegistrationForm
+from .conftest import add_car, login
+
+
+def registration(world, **changes):
+    return dict(dict(username='newuser', email='new@test.com', password='Bench@123', confirm_password='Bench@123',
+                     name='New', city_id=world.city.id), **changes)
+
+
+def race(monkeypatch, table, **values):
+    """Method for making another request insert a row once the form has checked its unique fields, between the
+    validation and the commit of the form"""
+    taken = validations._taken
+
+    def checked_then_taken(form):
+        fields = taken(form)
+        if not getattr(form, '_raced', False):
+            form._raced = True
+            with db.engine.begin() as connection:
+                connection.execute(table.insert().values(**values))
+        return fields
+
+    monkeypatch.setattr(validations, '_taken', checked_then_taken)
+
+
+def test_a_username_taken_after_the_validation_is_a_field_error(client, world, monkeypatch):
+    race(monkeypatch, User.__table__, name='Other', username='newuser', email='other@test.com', password='x',
+         city_id=world.city.id)
+    response = client.post('/register', data=registration(world))
+    assert response.status_code == 200
+    assert b'Username is already taken!' in response.data
+    assert [user.email for user in User.query.filter_by(username='newuser')] == ['other@test.com']
+
+
+def test_a_car_id_taken_after_the_validation_is_a_field_error(client, world, monkeypatch):
+    car = add_car(world, 1)
+    race(monkeypatch, Car.__table__, car_id='MH12XY0001', company_id=car.company_id, model_id=car.model_id,
+         category_id=car.category_id, color='RED', mileage=15, ppd=1000, min_rent=1000, deposit=5000,
+         city_id=world.city.id)
+    login(client, world.admin.email)
+    response = client.post('/create_cars', data=dict(
+        car_id='MH12XY0001', company_id=car.company_id, category_id=car.category_id, model_id=car.model_id,
+        color='white', mileage=15, ppd=1000, min_rent=1000, deposit=5000, city_id=world.city.id))
+    assert response.status_code == 200
+    assert b'Car ID is already taken!' in response.data
+    assert Car.query.filter_by(car_id='MH12XY0001').one().color == 'RED'
+
+
+def test_the_unique_fields_of_a_form_are_checked_in_one_query(app, world):
+    with app.test_request_context('/register', method='POST',
+                                  data=registration(world, username='user', email='user@test.com')):
+        form = RegistrationForm()
+        with count_queries() as statements:
+            assert not form.validate()
+    assert form.username.errors == ['Username is already taken!']
+    assert form.email.errors == ['Email is already taken!']
+    [statement] = [statement for statement in statements if 'users' in statement]
+    assert 'UNION ALL' in statement
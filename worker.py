@@ -0,0 +1,10 @@
+"""File for running the background jobs worker"""
+
+from codes import create_app
+from codes.jobs.queue import work
+
+app = create_app()
+
+if __name__ == '__main__':
+    with app.app_context():
+        work()